@@ -1,26 +1,121 @@
 import chainlit as cl
 import asyncio
+import json
+import logging
+import random
 import sys
+import uuid
 import httpx
 from urllib.parse import urlparse, parse_qs
 import os
 
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+
+logger = logging.getLogger(__name__)
 
 # Global variable to store user type based on environment or default
 USER_TYPE_DEFAULT = os.getenv("CHAINLIT_USER_TYPE", "Client")
 
+# Django API. One client with a keep-alive connection pool is shared by all
+# chat sessions for the lifetime of the app.
+DJANGO_URL = os.getenv("DJANGO_URL", "http://django:8000")
+DJANGO_MAX_CONNECTIONS = int(os.getenv("DJANGO_MAX_CONNECTIONS", "50"))
+DJANGO_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("DJANGO_MAX_KEEPALIVE_CONNECTIONS", "20"))
+DJANGO_KEEPALIVE_EXPIRY = float(os.getenv("DJANGO_KEEPALIVE_EXPIRY", "60"))
+# HTTP/2 needs the h2 package and is only negotiated over TLS (https)
+DJANGO_HTTP2 = os.getenv("DJANGO_HTTP2", "0") == "1"
+# Seconds to connect, and to wait for each endpoint's reply (between chunks
+# of a streamed one)
+DJANGO_CONNECT_TIMEOUT = float(os.getenv("DJANGO_CONNECT_TIMEOUT", "5"))
+DJANGO_STREAM_TIMEOUT = float(os.getenv("DJANGO_STREAM_TIMEOUT", "60"))
+DJANGO_ATTORNEY_TIMEOUT = float(os.getenv("DJANGO_ATTORNEY_TIMEOUT", "120"))
+# Failed requests are retried with the same Idempotency-Key, so Django
+# answers a retry from the first attempt instead of running the turn again.
+# Delays are drawn at random up to DJANGO_RETRY_BACKOFF seconds, doubling
+# with each attempt.
+DJANGO_RETRIES = int(os.getenv("DJANGO_RETRIES", "3"))
+DJANGO_RETRY_BACKOFF = float(os.getenv("DJANGO_RETRY_BACKOFF", "0.5"))
+# A 409 (the first attempt is still running after Django waited for it) is
+# not retried
+RETRY_STATUSES = {502, 503, 504}
+UNREACHABLE_MESSAGE = "Sorry, I couldn't reach the onboarding service. Please send your message again in a moment."
+
+_django_client = None
+
+
+def django_client():
+    """
+    The shared Django API client, built on first use (and again after a
+    --watch reload, which doesn't rerun the startup hook).
+    """
+    global _django_client
+    if _django_client is None or _django_client.is_closed:
+        http2 = DJANGO_HTTP2 and h2 is not None
+        if DJANGO_HTTP2 and not http2:
+            logger.warning("DJANGO_HTTP2 is set but the h2 package is not installed; using HTTP/1.1")
+        _django_client = httpx.AsyncClient(
+            base_url=DJANGO_URL,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=DJANGO_MAX_CONNECTIONS,
+                max_keepalive_connections=DJANGO_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=DJANGO_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(DJANGO_STREAM_TIMEOUT, connect=DJANGO_CONNECT_TIMEOUT),
+        )
+    return _django_client
+
+
+def endpoint_timeout(read):
+    return httpx.Timeout(read, connect=DJANGO_CONNECT_TIMEOUT)
+
+
+def retry_delay(attempt):
+    return random.uniform(0, DJANGO_RETRY_BACKOFF * 2 ** attempt)
+
+
+def json_body(response):
+    """
+    The decoded JSON body of `response`, or None if it has none, e.g. the
+    HTML error page of a proxy in front of Django.
+    """
+    content_type = response.headers.get("content-type", "").split(";")[0].strip()
+    if content_type != "application/json":
+        return None
+    try:
+        return response.json()
+    except ValueError:
+        return None
+
+
+@cl.on_app_startup
+async def on_app_startup():
+    django_client()
+
+
+@cl.on_app_shutdown
+async def on_app_shutdown():
+    global _django_client
+    if _django_client is not None:
+        await _django_client.aclose()
+        _django_client = None
+
 
 @cl.on_chat_start
 async def on_chat_start():
     """
     Initialize chat session when page loads.
     """
-    print("[D] Chat session started", flush=True)
-    
+    logger.debug("Chat session started")
+
     # Check for user_type in environment variable (can be set by Docker/config)
     user_type = os.getenv("CHAINLIT_USER_TYPE", "Client")
-    print(f"[D] User type from environment: {user_type}", flush=True)
-    
+    logger.debug("User type from environment: %s", user_type)
+
     cl.user_session.set("user_type", user_type)
     
     # Store interaction_id in session (default to None, will be set by user/API)
@@ -39,50 +134,122 @@ async def main(message: cl.Message):
     Main handler for all messages.
     Send to Django and display Django's response.
     """
-    print(f"[D] Received message: {message.content}", flush=True)
-    
+    # Messages carry login details, so only their size is logged
+    logger.debug("Received a message (%s characters)", len(message.content))
+
     # Get interaction_id from session (if available)
     interaction_id = cl.user_session.get("interaction_id")
     user_type = cl.user_session.get("user_type")
-    print(f"[D] User type from session: {user_type}", flush=True)
-    print(f"[D] Interaction ID from session: {interaction_id}", flush=True)
+    logger.debug("User type %s, interaction %s", user_type, interaction_id)
     # Send message to Django API
+    response_msg = cl.Message(content="")
+    # Every attempt at sending this message carries the same key
+    headers = {"Idempotency-Key": message.id or str(uuid.uuid4())}
     try:
-        async with httpx.AsyncClient() as client:
-            payload = {"message": message.content}
-            if interaction_id:
-                payload["interaction_id"] = interaction_id
-            
-            print(f"[D] Payload sent to Django: {payload}", flush=True)
-            
-            if user_type == "Client":
-                response = await client.post(
-                    "http://django:8000/api/message/",
-                    json=payload,
-                    timeout=60.0
-                )
-            elif user_type == "Attorney":
-                response = await client.post(
-                    "http://django:8000/api/attorney_message/",
-                    json=payload,
-                    timeout=60.0
-                )
+        payload = {"message": message.content}
+        if interaction_id:
+            payload["interaction_id"] = interaction_id
+
+        if user_type == "Client":
+            # Stream the reply token by token as Gemini produces it
+            django_response = await stream_client_response(payload, headers, response_msg)
+        elif user_type == "Attorney":
+            response = await post_with_retries(
+                "/api/attorney_message/",
+                payload,
+                headers,
+                endpoint_timeout(DJANGO_ATTORNEY_TIMEOUT)
+            )
+            logger.debug("Django response status: %s", response.status_code)
+            response_data = json_body(response)
+            if response_data is None:
+                logger.warning("Django answered %s without a JSON body", response.status_code)
+                django_response = UNREACHABLE_MESSAGE
             else:
-                print(f"[D] Unknown user type: {user_type}", flush=True)
-            print(f"[D] Django response status: {response.status_code}", flush=True)
-            
-            response_data = response.json()
-            print (response_data, flush=True)
-            if(response_data.get('interaction_id')):
-                cl.user_session.set("interaction_id", response_data['interaction_id'])
-            django_response = response_data.get('response') or response_data.get('gemini_response') or "No response from Django."
-            print(f"[D] Django said: {django_response}", flush=True)
+                django_response = response_data.get('response') or response_data.get('gemini_response') or response_data.get('message') or "No response from Django."
+        else:
+            logger.warning("Unknown user type: %s", user_type)
+            django_response = "No response from Django."
+    except httpx.TransportError as e:
+        logger.warning("Error sending to Django: %r", e)
+        django_response = UNREACHABLE_MESSAGE
+        if response_msg.streaming:
+            await response_msg.stream_token(f"\n\n{django_response}")
     except Exception as e:
-        print(f"[D] Error sending to Django: {e}", flush=True)
+        logger.exception("Error sending to Django: %r", e)
         django_response = f"Error: {str(e)}"
     
     # Send Django's response to user
-    print("[D] Sending Django response to user...", flush=True)
-    response_msg = cl.Message(content=django_response)
+    if not response_msg.streaming:
+        response_msg.content = django_response
     await response_msg.send()
-    print("[D] Response sent", flush=True)
+
+
+async def post_with_retries(path, payload, headers, timeout):
+    """
+    POST `payload` to `path`, retrying connection failures and retryable
+    statuses with jittered backoff.
+    """
+    for attempt in range(DJANGO_RETRIES + 1):
+        try:
+            response = await django_client().post(path, json=payload, headers=headers, timeout=timeout)
+            if response.status_code not in RETRY_STATUSES or attempt == DJANGO_RETRIES:
+                return response
+            logger.warning("Django answered %s, retrying", response.status_code)
+        except httpx.TransportError as e:
+            if attempt == DJANGO_RETRIES:
+                raise
+            logger.warning("Error sending to Django: %r, retrying", e)
+        await asyncio.sleep(retry_delay(attempt))
+
+
+async def stream_client_response(payload, headers, response_msg):
+    """
+    Forward the NDJSON events from Django's streaming endpoint into
+    `response_msg` and return the full reply. The request is retried until
+    the first event arrives; after that the reply is already on screen.
+    """
+    django_response = "No response from Django."
+    for attempt in range(DJANGO_RETRIES + 1):
+        received = False
+        try:
+            async with django_client().stream(
+                "POST",
+                "/api/message/stream/",
+                json=payload,
+                headers=headers,
+                timeout=endpoint_timeout(DJANGO_STREAM_TIMEOUT)
+            ) as response:
+                logger.debug("Django response status: %s", response.status_code)
+                if response.status_code != 200:
+                    await response.aread()
+                    if response.status_code in RETRY_STATUSES and attempt < DJANGO_RETRIES:
+                        await asyncio.sleep(retry_delay(attempt))
+                        continue
+                    response_data = json_body(response)
+                    if response_data is None:
+                        logger.warning("Django answered %s without a JSON body", response.status_code)
+                        return UNREACHABLE_MESSAGE
+                    return response_data.get('message') or django_response
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    received = True
+                    event = json.loads(line)
+                    if event.get('interaction_id'):
+                        cl.user_session.set("interaction_id", event['interaction_id'])
+                    if event['type'] == 'chunk':
+                        await response_msg.stream_token(event['text'])
+                    elif event['type'] == 'done':
+                        django_response = event.get('gemini_response') or django_response
+                    elif event['type'] == 'error':
+                        django_response = f"Error: {event.get('message')}"
+                        if response_msg.streaming:
+                            await response_msg.stream_token(f"\n\n{django_response}")
+            return django_response
+        except httpx.TransportError as e:
+            if received or attempt == DJANGO_RETRIES:
+                raise
+            logger.warning("Error streaming from Django: %r, retrying", e)
+        await asyncio.sleep(retry_delay(attempt))
+    return django_response
@@ -14,3 +14,10 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_app.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings
+
+if settings.SQL_AGENT_WARM_UP:
+    from django_app.onboarding.llm import get_backend
+
+    get_backend().warm_up()
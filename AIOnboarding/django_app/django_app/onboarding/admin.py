@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Client, Department, Interaction, Document
+from .documents import queue_extraction
+from .search import matching_filter
+from .models import Client, ClientSummary, Department, Document, GeminiContextCache, Interaction, Job, Message, MessageRequest, StageTiming
 
 
 @admin.register(Department)
@@ -11,6 +13,10 @@ class DepartmentAdmin(admin.ModelAdmin):
         ('Department Information', {
             'fields': ('name', 'prompt')
         }),
+        ('Conversation Context', {
+            'fields': ('context_strategy', 'context_window', 'context_token_budget'),
+            'classes': ('collapse',)
+        }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
@@ -24,6 +30,7 @@ class ClientAdmin(admin.ModelAdmin):
     search_fields = ('name', 'email')
     filter_horizontal = ('departments',)
     readonly_fields = ('created_at', 'updated_at')
+    # A new password typed here is hashed by Client.save()
     fieldsets = (
         ('Client Information', {
             'fields': ('name', 'email', 'password')
@@ -38,18 +45,66 @@ class ClientAdmin(admin.ModelAdmin):
     )
 
 
+class MessageInline(admin.TabularInline):
+    model = Message
+    fields = ('position', 'role', 'parts', 'created_at')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+    verbose_name_plural = 'Conversation'
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+class StageTimingInline(admin.TabularInline):
+    model = StageTiming
+    fields = ('stage', 'duration_ms', 'model', 'input_tokens', 'output_tokens', 'cached_tokens', 'cache_hit', 'error', 'created_at')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+    verbose_name_plural = 'Stage timings'
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Interaction)
 class InteractionAdmin(admin.ModelAdmin):
     list_display = ('id', 'client', 'department', 'created_at')
     search_fields = ('client__name', 'department__name', 'title')
     list_filter = ('department', 'created_at')
     readonly_fields = ('created_at', 'updated_at')
+    inlines = (MessageInline, StageTimingInline)
     fieldsets = (
         ('Interaction Information', {
             'fields': ('client', 'department', 'title')
         }),
-        ('Conversation', {
-            'fields': ('conversation',)
+        ('Timestamps', {
+            'fields': ('created_at', 'updated_at'),
+            'classes': ('collapse',)
+        }),
+    )
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            results |= queryset.filter(matching_filter(search_term))
+        return results, may_have_duplicates
+
+
+@admin.register(ClientSummary)
+class ClientSummaryAdmin(admin.ModelAdmin):
+    list_display = ('client', 'covered_until', 'updated_at')
+    search_fields = ('client__name', 'client__email')
+    readonly_fields = ('interaction_hashes', 'covered_until', 'created_at', 'updated_at')
+    fieldsets = (
+        ('Summary', {
+            'fields': ('client', 'summary')
+        }),
+        ('Coverage', {
+            'fields': ('interaction_hashes', 'covered_until'),
+            'classes': ('collapse',)
         }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
@@ -58,18 +113,80 @@ class InteractionAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(GeminiContextCache)
+class GeminiContextCacheAdmin(admin.ModelAdmin):
+    list_display = ('name', 'department', 'token_estimate', 'expires_at')
+    list_filter = ('department',)
+    readonly_fields = ('key', 'name', 'model', 'department', 'token_estimate', 'expires_at', 'created_at', 'updated_at')
+
+
 @admin.register(Document)
 class DocumentAdmin(admin.ModelAdmin):
-    list_display = ('file_name', 'interaction', 'created_at')
-    search_fields = ('file_name', 'interaction__id')
-    list_filter = ('created_at', 'file_type')
-    readonly_fields = ('created_at',)
+    list_display = ('file_name', 'interaction', 'status', 'size', 'created_at')
+    search_fields = ('file_name', 'interaction__id', 'content_hash')
+    list_filter = ('status', 'created_at', 'file_type')
+    readonly_fields = ('size', 'content_hash', 'status', 'text_file', 'text_length', 'error', 'created_at', 'extracted_at')
+    actions = ('extract_text',)
     fieldsets = (
         ('Document Information', {
-            'fields': ('interaction', 'file_name', 'file_type', 'file')
+            'fields': ('interaction', 'file_name', 'file_type', 'file', 'size', 'content_hash')
+        }),
+        ('Extracted Text', {
+            'fields': ('status', 'text_file', 'text_length', 'error', 'extracted_at')
         }),
         ('Timestamps', {
             'fields': ('created_at',),
             'classes': ('collapse',)
         }),
     )
+
+    @admin.action(description="Extract the text of the selected documents again")
+    def extract_text(self, request, queryset):
+        for document in queryset:
+            queue_extraction(document, again=True)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'task', 'queue', 'status', 'priority', 'attempts', 'run_at', 'finished_at')
+    search_fields = ('task', 'idempotency_key')
+    list_filter = ('status', 'queue', 'task')
+    readonly_fields = ('locked_by', 'locked_at', 'result', 'last_error', 'created_at', 'updated_at', 'finished_at')
+    fieldsets = (
+        ('Job', {
+            'fields': ('task', 'kwargs', 'queue', 'priority', 'idempotency_key')
+        }),
+        ('State', {
+            'fields': ('status', 'attempts', 'max_attempts', 'run_at', 'locked_by', 'locked_at')
+        }),
+        ('Outcome', {
+            'fields': ('result', 'last_error', 'finished_at')
+        }),
+        ('Timestamps', {
+            'fields': ('created_at', 'updated_at'),
+            'classes': ('collapse',)
+        }),
+    )
+
+
+@admin.register(MessageRequest)
+class MessageRequestAdmin(admin.ModelAdmin):
+    list_display = ('key', 'status', 'created_at', 'updated_at')
+    search_fields = ('key',)
+    list_filter = ('status', 'created_at')
+    readonly_fields = ('key', 'status', 'response', 'created_at', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(StageTiming)
+class StageTimingAdmin(admin.ModelAdmin):
+    list_display = ('interaction', 'stage', 'duration_ms', 'model', 'input_tokens', 'output_tokens', 'cache_hit', 'error', 'created_at')
+    search_fields = ('=interaction__id', 'stage', 'model')
+    list_filter = ('stage', 'cache_hit', 'error', 'created_at')
+    list_select_related = ('interaction',)
+    readonly_fields = ('interaction', 'stage', 'duration_ms', 'model', 'input_tokens', 'output_tokens', 'cached_tokens', 'cache_hit', 'error', 'created_at')
+
+    def has_add_permission(self, request):
+        return False
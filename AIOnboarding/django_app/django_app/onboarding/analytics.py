@@ -0,0 +1,151 @@
+"""
+Direct answers to the common attorney questions.
+
+route_question() matches a question against a small set of patterns and, when
+one fits, answers it with an indexed ORM query from DepartmentStats, or with
+the full-text index for questions about what was said (search.py). Anything
+it doesn't recognise returns None and falls through to the SQL agent.
+"""
+import re
+from datetime import timedelta
+
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .departments import aget_catalog
+from .models import Department, Interaction
+from .search import asearch_interactions, format_results
+
+PERIOD_RE = re.compile(r"\b(?P<period>today|this week|this month|this year|last 7 days|past week|last 30 days|past month)\b")
+INTAKE_WORDS = r"(?:new )?(?:intakes?|interactions?|matters?|conversations?|chats?)"
+ASK = r"(?:(?:how many|what are|what were|show(?: me)?|list|count|give me)(?: the)?(?: number of)? )?"
+
+# Patterns are matched against the whole question once the department name and
+# reporting period have been taken out, so anything more specific (e.g. "whose
+# client is over 60") doesn't match and goes to the SQL agent instead.
+PER_DEPARTMENT_RE = re.compile(
+    rf"{ASK}{INTAKE_WORDS}(?: (?:are there|were there|did we have))? (?:per|by|for each|in each|across)(?: each)? departments?"
+)
+COUNT_RE = re.compile(
+    rf"how many {INTAKE_WORDS}(?: (?:were there|did we (?:have|get)|have there been|have we had|came in|do we have))?"
+    r"(?: (?:for|in|from))?(?: the)?(?: department)?"
+)
+CLIENT_LATEST_RE = re.compile(
+    rf"{ASK}(?:latest|most recent|recent|last)(?: \d+)? {INTAKE_WORDS} (?:for|of|from) (?:client )?(?P<client>\S+(?: \S+){{0,3}})"
+)
+
+SEARCH_RE = re.compile(
+    rf"(?:(?:find|search(?: for)?|which|what)(?: the| all)? |{ASK}){INTAKE_WORDS}(?: (?:for|in|from)(?: the)?(?: department)?)?"
+    r" (?:that |which )?(?:mention(?:s|ed)?|mentioning|talk(?:s|ed)? about|talking about|about|contain(?:s|ing)?) (?P<terms>.+)"
+)
+
+
+def period_start(period, now=None):
+    """
+    Start of a named reporting period, in the current time zone.
+    """
+    now = timezone.localtime(now or timezone.now())
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "today":
+        return midnight
+    if period == "this week":
+        return midnight - timedelta(days=midnight.weekday())
+    if period == "this month":
+        return midnight.replace(day=1)
+    if period == "this year":
+        return midnight.replace(month=1, day=1)
+    if period in ("last 7 days", "past week"):
+        return now - timedelta(days=7)
+    if period in ("last 30 days", "past month"):
+        return now - timedelta(days=30)
+    return None
+
+
+class DepartmentStats:
+    """
+    Parameterised reporting queries over interactions, backed by the
+    (department, created_at, id), (client, -created_at) and (created_at, id)
+    indexes.
+    """
+
+    async def interactions_per_department(self, since=None):
+        interactions = Q(interactions__created_at__gte=since) if since else Q()
+        rows = Department.objects.annotate(total=Count("interactions", filter=interactions)).values_list("name", "total")
+        counts = [(name, total) async for name, total in rows.order_by("-total", "name")]
+        unassigned = Interaction.objects.filter(department__isnull=True)
+        if since:
+            unassigned = unassigned.filter(created_at__gte=since)
+        counts.append(("Unassigned", await unassigned.acount()))
+        return counts
+
+    async def intake_count(self, since=None, department=None):
+        interactions = Interaction.objects.all()
+        if department is not None:
+            interactions = interactions.filter(department=department)
+        if since:
+            interactions = interactions.filter(created_at__gte=since)
+        return await interactions.acount()
+
+    async def latest_for_client(self, client, limit=5):
+        """
+        Most recent interactions of the client whose name or email matches.
+        """
+        interactions = (
+            Interaction.objects.filter(Q(client__email__iexact=client) | Q(client__name__iexact=client))
+            .select_related("client", "department")
+            .only("id", "title", "created_at", "client__name", "department__name")
+            .order_by("-created_at")[:limit]
+        )
+        return [interaction async for interaction in interactions]
+
+
+async def route_question(question, stats=None):
+    """
+    Answer `question` directly if it matches a known report, else None.
+    """
+    stats = stats or DepartmentStats()
+    lowered = " ".join(question.lower().split())
+    period_match = PERIOD_RE.search(lowered)
+    period = period_match.group("period") if period_match else None
+    since = period_start(period) if period else None
+    period_text = f" {period}" if period else ""
+    remainder = PERIOD_RE.sub(" ", lowered)
+
+    match = CLIENT_LATEST_RE.fullmatch(_tidy(remainder))
+    if match:
+        client = match.group("client")
+        interactions = await stats.latest_for_client(client)
+        if not interactions:
+            return f"No interactions found for client {client}."
+        lines = [
+            f"- Interaction {interaction.id} ({interaction.department.name if interaction.department else 'Unassigned'}), "
+            f"started {timezone.localtime(interaction.created_at):%Y-%m-%d %H:%M}"
+            + (f": {interaction.title}" if interaction.title else "")
+            for interaction in interactions
+        ]
+        return f"Latest interactions for {interactions[0].client.name}:\n" + "\n".join(lines)
+
+    if PER_DEPARTMENT_RE.fullmatch(_tidy(remainder)):
+        counts = await stats.interactions_per_department(since=since)
+        lines = [f"- {name}: {total}" for name, total in counts if total]
+        if not lines:
+            return f"There are no interactions{period_text}."
+        return f"Interactions per department{period_text}:\n" + "\n".join(lines)
+
+    department = (await aget_catalog()).find_in(remainder)
+    if department:
+        remainder = remainder.replace(department.name.lower(), " ")
+    match = SEARCH_RE.fullmatch(_tidy(remainder))
+    if match:
+        terms = match.group("terms")
+        return format_results(terms, await asearch_interactions(terms, department=department, since=since))
+    if COUNT_RE.fullmatch(_tidy(remainder)):
+        total = await stats.intake_count(since=since, department=department)
+        department_text = f" for {department.name}" if department else ""
+        return f"There were {total} intakes{department_text}{period_text}."
+
+    return None
+
+
+def _tidy(text):
+    return " ".join(text.split()).strip(" ?.!")
@@ -1,5 +1,27 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
 
 
 class OnboardingConfig(AppConfig):
-    name = 'django_app.onboarding'
\ No newline at end of file
+    name = 'django_app.onboarding'
+
+    def ready(self):
+        from . import departments, metrics, response_cache, sql_agent
+        from .models import Client, Department, Interaction, Message
+
+        # Every database write is timed in the metrics
+        connection_created.connect(metrics.instrument_connection, dispatch_uid='onboarding_metrics_connection')
+
+        # A migration in this process changes the schema the SQL agent reflected
+        post_migrate.connect(sql_agent.invalidate, dispatch_uid='onboarding_sql_agent_invalidate')
+
+        # The department catalog is reloaded after any department change
+        post_save.connect(departments.invalidate, sender=Department, dispatch_uid='onboarding_departments_save')
+        post_delete.connect(departments.invalidate, sender=Department, dispatch_uid='onboarding_departments_delete')
+
+        # Cached attorney answers are stale as soon as the data behind them
+        # changes; bulk writes clear the cache themselves
+        for model in (Interaction, Message, Client, Department):
+            post_save.connect(response_cache.invalidate, sender=model, dispatch_uid=f'onboarding_response_cache_save_{model.__name__}')
+            post_delete.connect(response_cache.invalidate, sender=model, dispatch_uid=f'onboarding_response_cache_delete_{model.__name__}')
@@ -0,0 +1,7 @@
+"""
+Offline benchmarks for the onboarding pipeline.
+
+Benchmarks run against a throwaway test database and the stub LLM backend, so
+they need neither network access nor an API key. They are driven from
+management commands (see onboarding/management/commands/bench_*.py).
+"""
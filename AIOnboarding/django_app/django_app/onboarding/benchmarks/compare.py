@@ -0,0 +1,67 @@
+"""
+Comparison of two run_benchmarks result files, e.g. from two commits.
+
+Every metric compared is one where higher is worse, so a change above the
+threshold percentage counts as a regression.
+"""
+import json
+
+METRICS = [
+    ("mean_ms",),
+    ("p95_ms",),
+    ("queries_per_request",),
+    ("bytes_written_per_request",),
+    ("memory", "peak_kib"),
+]
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _value(result, path):
+    for key in path:
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+
+def _rows(scenario, label, before, after, threshold):
+    for path in METRICS:
+        old, new = _value(before, path), _value(after, path)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old * 100 if old else (0.0 if new == old else float("inf"))
+        yield {
+            "scenario": scenario,
+            "step": label,
+            "metric": ".".join(path),
+            "before": old,
+            "after": new,
+            "change_pct": round(change, 1),
+            "regression": change > threshold,
+        }
+
+
+def compare(baseline, current, threshold=10.0):
+    """
+    One row per scenario (and per step) and metric present in both results.
+    """
+    rows = []
+    for scenario, after in current["scenarios"].items():
+        before = baseline["scenarios"].get(scenario)
+        if before is None:
+            continue
+        rows.extend(_rows(scenario, None, before, after, threshold))
+        for step, step_after in after.get("steps", {}).items():
+            step_before = before.get("steps", {}).get(step)
+            if step_before is not None:
+                rows.extend(_rows(scenario, step, step_before, step_after, threshold))
+    return rows
+
+
+def format_row(row):
+    name = f"{row['scenario']}.{row['step']}" if row["step"] else row["scenario"]
+    return f"{name} {row['metric']}: {row['before']} -> {row['after']} ({row['change_pct']:+}%)"
@@ -0,0 +1,89 @@
+"""
+Turn latency and input size of a long intake under each context strategy,
+compared with replaying the full history.
+"""
+from concurrent.futures import wait
+from unittest import mock
+
+from django.test.utils import override_settings
+
+from .. import jobs
+from ..gemini import gemini_prompt
+from ..genai_client import get_client
+from ..models import Client, Interaction, Message
+from ..orchestration import get_executor
+from .harness import summarize, timer
+
+STRATEGIES = ("full", "window", "summary", "budget")
+
+DETAIL = (
+    "The supplier delivered the goods late again and the invoice does not match the purchase order. "
+    "We have emails going back several months and a signed master agreement with a termination clause. "
+)
+
+
+def _long_interaction(department, history_turns):
+    client = Client.objects.create(name="Long Client", email="long@example.com", password="secret")
+    interaction = Interaction.objects.create(
+        client=client,
+        department=department,
+        system_instructions="This is the Clients first interaction with the onboarding system.",
+    )
+    messages = []
+    for turn in range(history_turns):
+        messages.append(Message.from_content(interaction, turn * 2, {"role": "user", "parts": [{"text": f"Part {turn}. " + DETAIL * 3}]}))
+        messages.append(Message.from_content(interaction, turn * 2 + 1, {"role": "model", "parts": [{"text": "Thank you, could you tell me more about that? " * 4}]}))
+    Message.objects.bulk_create(messages)
+    return interaction
+
+
+class _TrackedExecutor:
+    """
+    Shared executor wrapper remembering what was submitted, so background
+    summary refreshes can be waited for between measured turns.
+    """
+
+    def __init__(self, executor):
+        self._executor = executor
+        self.futures = []
+
+    def submit(self, fn, *args, **kwargs):
+        future = self._executor.submit(fn, *args, **kwargs)
+        self.futures.append(future)
+        return future
+
+    def drain(self):
+        wait(self.futures)
+        self.futures.clear()
+
+
+def strategy_turns(department, strategy, history_turns, turns):
+    department.context_strategy = strategy
+    department.save()
+    interaction = _long_interaction(department, history_turns)
+    stub = get_client()
+    samples = []
+    calls_before, tokens_before = stub.calls, stub.input_tokens
+    executor = _TrackedExecutor(get_executor())
+    # Summary refreshes run as in-process jobs so they can be waited for
+    with override_settings(JOBS_RUN_IN_PROCESS=True), mock.patch.object(jobs, "get_executor", return_value=executor):
+        for index in range(turns):
+            with timer(samples):
+                gemini_prompt(f"One more thing about the dispute, detail {index}.", interaction_id=interaction.id)
+            executor.drain()
+    result = summarize(samples)
+    result["gemini_calls"] = stub.calls - calls_before
+    result["mean_chat_input_tokens"] = round((stub.input_tokens - tokens_before) / turns)
+    return result
+
+
+def run(department, history_turns, turns, window, budget):
+    """
+    Run the same long intake under each strategy and return {strategy: summary}.
+    """
+    results = {}
+    with override_settings(GEMINI_CONTEXT_WINDOW=window, GEMINI_CONTEXT_TOKEN_BUDGET=budget):
+        for strategy in STRATEGIES:
+            Client.objects.all().delete()
+            results[strategy] = strategy_turns(department, strategy, history_turns, turns)
+    return results
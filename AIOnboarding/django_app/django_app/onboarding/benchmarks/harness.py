@@ -0,0 +1,74 @@
+import os
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test import override_settings
+
+from ..llm import StubBackend, set_backend
+
+
+@contextmanager
+def isolated_database():
+    """
+    Run the block against a freshly migrated test database that is dropped
+    afterwards, like the Django test runner does. Uploaded files and
+    retrieval indexes go to a temporary directory for the same reason.
+    """
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        with tempfile.TemporaryDirectory() as files, override_settings(
+            MEDIA_ROOT=os.path.join(files, "media"),
+            RETRIEVAL_INDEX_ROOT=os.path.join(files, "retrieval_index"),
+        ):
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+@contextmanager
+def stub_backend(**options):
+    """
+    Run the block against a StubBackend built with `options`.
+    """
+    backend = StubBackend(**options)
+    set_backend(backend)
+    try:
+        yield backend
+    finally:
+        set_backend(None)
+
+
+@contextmanager
+def timer(samples):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        samples.append(time.perf_counter() - start)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    """
+    Latency summary in milliseconds.
+    """
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "mean_ms": round(statistics.mean(samples) * 1000, 2),
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2),
+    }
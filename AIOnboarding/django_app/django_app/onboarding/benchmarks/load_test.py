@@ -0,0 +1,91 @@
+"""
+Concurrent load against /api/message/ and /api/attorney_message/.
+
+Virtual users are driven through Django's in-process AsyncClient, so requests
+go through the full ASGI handler and middleware stack without a network
+listener. The LLM and the SQL agent are the stub backend's stand-ins.
+"""
+import asyncio
+import json
+import time
+
+from django.test import AsyncClient
+
+from .harness import summarize
+
+
+class LoadStats:
+    def __init__(self):
+        self.samples = []
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    async def post(self, client, path, payload):
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        start = time.perf_counter()
+        try:
+            response = await client.post(path, data=json.dumps(payload), content_type="application/json")
+        finally:
+            self.samples.append(time.perf_counter() - start)
+            self.in_flight -= 1
+        if not 200 <= response.status_code < 300:
+            self.errors += 1
+            return {}
+        return response.json()
+
+    def report(self, elapsed):
+        report = summarize(self.samples)
+        report.update({
+            "errors": self.errors,
+            "peak_concurrency": self.peak_in_flight,
+            "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(len(self.samples) / elapsed, 2) if elapsed else 0.0,
+        })
+        return report
+
+
+async def _client_user(index, turns, stats, semaphore, department):
+    client = AsyncClient()
+    interaction_id = None
+    for turn in range(turns):
+        if turn == 0:
+            message = (
+                f"Hi, my name is Load Client. My email is load{index}@example.com and my password is "
+                f"secret{index}. I need help from {department}."
+            )
+        else:
+            message = f"More detail about my matter, part {turn}."
+        payload = {"message": message}
+        if interaction_id:
+            payload["interaction_id"] = interaction_id
+        async with semaphore:
+            data = await stats.post(client, "/api/message/", payload)
+        interaction_id = data.get("interaction_id") or interaction_id
+
+
+async def _attorney_user(index, turns, stats, semaphore):
+    client = AsyncClient()
+    for turn in range(turns):
+        async with semaphore:
+            await stats.post(client, "/api/attorney_message/", {"message": f"How many intakes this week? ({index}.{turn})"})
+
+
+async def run(users, turns, concurrency, department):
+    """
+    Run `users` client and `users` attorney sessions of `turns` messages each,
+    with at most `concurrency` requests in flight per endpoint.
+    """
+    results = {}
+    for endpoint in ("client", "attorney"):
+        stats = LoadStats()
+        semaphore = asyncio.Semaphore(concurrency)
+        if endpoint == "client":
+            sessions = [_client_user(index, turns, stats, semaphore, department) for index in range(users)]
+        else:
+            sessions = [_attorney_user(index, turns, stats, semaphore) for index in range(users)]
+        start = time.perf_counter()
+        await asyncio.gather(*sessions)
+        results[endpoint] = stats.report(time.perf_counter() - start)
+    return results
@@ -0,0 +1,382 @@
+"""
+End-to-end benchmarks of the message endpoints.
+
+Each scenario posts to /api/message/ or /api/attorney_message/ through
+Django's in-process AsyncClient, so requests take the full ASGI path, with
+the stub LLM backend standing in for Gemini and the SQL agent. Requests run
+one at a time and each one records:
+
+- its latency, grouped by the step of the scenario it belongs to;
+- the time spent in each pipeline stage (classification, client lookup,
+  history summary, context building, the chat reply, persisting, ...),
+  measured by wrapping the stage functions in gemini.py;
+- the SQL queries it ran and the parameter bytes its INSERT and UPDATE
+  statements wrote.
+
+Peak Python memory is measured in a separate, shorter pass under
+tracemalloc, which would otherwise slow down the timed pass.
+"""
+import inspect
+import itertools
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import AsyncClient
+from django.utils import timezone
+
+from .. import gemini
+from ..credentials import hash_password
+from ..models import Client, ClientSummary, Department, Interaction, Message
+from ..summaries import interaction_hash
+from .harness import summarize
+
+# (stage, object, attribute) of every function timed as a pipeline stage
+STAGES = [
+    ("classify", gemini, "aanalyze_turn"),
+    ("classify", gemini, "aextract_variables_gemini"),
+    ("classify", gemini, "_check_department_change"),
+    ("classify", gemini, "acheck_completed"),
+    ("identify_client", gemini, "_identify_client"),
+    ("client_summary", gemini, "aclient_summary"),
+    ("build_context", gemini, "build_context"),
+    ("context_cache", gemini, "cached_content_for"),
+    ("chat_reply", gemini.ChatTurn, "_send"),
+    ("persist_messages", gemini, "append_messages"),
+    ("after_turn", gemini, "after_turn"),
+    ("route_question", gemini, "route_question"),
+    ("response_cache", gemini.attorney_cache, "lookup"),
+    ("sql_agent", gemini, "gemini_sql_query"),
+]
+
+PASSWORD = "benchmark-password"
+HISTORY_INTERACTIONS = 20
+HISTORY_MESSAGES = 30
+LONG_CONVERSATION_MESSAGES = 200
+
+_serials = itertools.count()
+_password_hash = None
+
+
+def _hashed_password():
+    # Hashing is deliberately slow, so clients made in setup share one hash
+    global _password_hash
+    if _password_hash is None:
+        _password_hash = hash_password(PASSWORD)
+    return _password_hash
+
+
+class StageTimer:
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def wrap(self, stage, fn):
+        samples = self.samples[stage]
+        if inspect.iscoroutinefunction(fn):
+            async def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    samples.append(time.perf_counter() - start)
+        else:
+            def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    samples.append(time.perf_counter() - start)
+        return timed
+
+    @contextmanager
+    def installed(self):
+        with ExitStack() as stack:
+            for stage, target, attribute in STAGES:
+                stack.enter_context(mock.patch.object(target, attribute, self.wrap(stage, getattr(target, attribute))))
+            yield self
+
+    def report(self):
+        return {stage: summarize(samples) for stage, samples in self.samples.items() if samples}
+
+
+def _params_size(params, many):
+    rows = params if many else [params]
+    size = 0
+    for row in rows or []:
+        values = row.values() if isinstance(row, dict) else (row or [])
+        for value in values:
+            if value is None:
+                continue
+            size += len(value) if isinstance(value, (bytes, memoryview)) else len(str(value).encode("utf-8"))
+    return size
+
+
+class QueryCounter:
+    """
+    connection.execute_wrapper counting queries and bytes written.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.bytes_written = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        if sql.lstrip()[:6].upper() in ("INSERT", "UPDATE"):
+            self.bytes_written += _params_size(params, many)
+        return execute(sql, params, many, context)
+
+
+class ScenarioRun:
+    def __init__(self, counter):
+        self.counter = counter
+        self.client = AsyncClient()
+        self.steps = defaultdict(list)
+        self.queries = []
+        self.bytes_written = []
+        self.errors = 0
+
+    async def post(self, step, path, payload):
+        queries, written = self.counter.queries, self.counter.bytes_written
+        start = time.perf_counter()
+        response = await self.client.post(path, data=payload, content_type="application/json")
+        self.steps[step].append(time.perf_counter() - start)
+        self.queries.append(self.counter.queries - queries)
+        self.bytes_written.append(self.counter.bytes_written - written)
+        if not 200 <= response.status_code < 300:
+            self.errors += 1
+            return {}
+        return response.json()
+
+    async def message(self, step, interaction_id, text):
+        return await self.post(step, "/api/message/", {"message": text, "interaction_id": interaction_id})
+
+    def report(self):
+        samples = [sample for step in self.steps.values() for sample in step]
+        report = summarize(samples)
+        report.update({
+            "errors": self.errors,
+            "steps": {step: summarize(step_samples) for step, step_samples in self.steps.items()},
+            "queries_per_request": round(sum(self.queries) / len(self.queries), 2) if self.queries else 0,
+            "max_queries": max(self.queries, default=0),
+            "bytes_written_per_request": round(sum(self.bytes_written) / len(self.bytes_written)) if self.bytes_written else 0,
+        })
+        return report
+
+
+def _departments():
+    departments = list(Department.objects.order_by("id")[:2])
+    if len(departments) < 2:
+        raise RuntimeError("The benchmarks need at least two departments; run seed_departments")
+    return departments
+
+
+def _add_messages(interaction, count, start=0):
+    Message.objects.bulk_create([
+        Message.from_content(interaction, start + position, {
+            "role": "user" if position % 2 == 0 else "model",
+            "parts": [{"text": f"Earlier message {position} about the client's matter, with some detail to summarise."}],
+        })
+        for position in range(count)
+    ])
+
+
+def _new_client(serial):
+    return Client.objects.create(
+        name=f"Bench Client {serial}",
+        email=f"bench.client{serial}@example.com",
+        password=_hashed_password(),
+    )
+
+
+def _login_message(client, department):
+    return (
+        f"Hi, my name is {client.name}. My email is {client.email} and my password is {PASSWORD}. "
+        f"I need help from {department.name} with a contract dispute."
+    )
+
+
+class FirstTimeClient:
+    """
+    A new client registers in their first message, then follows up.
+    """
+
+    def setup(self):
+        serial = next(_serials)
+        department = _departments()[0]
+        return {
+            "interaction_id": Interaction.objects.create().id,
+            "message": (
+                f"Hi, my name is New Client. My email is new.client{serial}@example.com and my password is "
+                f"{PASSWORD}. I need help from {department.name} with a contract dispute."
+            ),
+        }
+
+    async def drive(self, run, state):
+        await run.message("register", state["interaction_id"], state["message"])
+        await run.message("follow_up", state["interaction_id"], "The other party stopped paying three months ago.")
+
+
+class ReturningClient:
+    """
+    A client with many earlier interactions, most of them already in their
+    history summary, logs in to a new interaction (waiting for the rest to be
+    folded in); then the same client continues a long ongoing conversation.
+    """
+
+    def setup(self):
+        department = _departments()[0]
+        client = _new_client(next(_serials))
+        for _ in range(HISTORY_INTERACTIONS):
+            interaction = Interaction.objects.create(client=client, department=department)
+            _add_messages(interaction, HISTORY_MESSAGES)
+        # Everything but the last three interactions is already summarised
+        summarised = Interaction.objects.filter(client=client).select_related("department").prefetch_related("messages").order_by("created_at")
+        ClientSummary.objects.create(
+            client=client,
+            summary="The client has had several earlier contract and employment questions.",
+            covered_until=timezone.now() - timedelta(minutes=1),
+            interaction_hashes={str(interaction.id): interaction_hash(interaction) for interaction in list(summarised)[:-3]},
+        )
+        ongoing = Interaction.objects.create(
+            client=client,
+            department=department,
+            system_instructions="This is the Clients first interaction with the onboarding system.",
+        )
+        _add_messages(ongoing, LONG_CONVERSATION_MESSAGES)
+        return {
+            "interaction_id": Interaction.objects.create().id,
+            "ongoing_id": ongoing.id,
+            "message": _login_message(client, department),
+        }
+
+    async def drive(self, run, state):
+        await run.message("login", state["interaction_id"], state["message"])
+        await run.message("follow_up", state["interaction_id"], "This is about the same supplier as last time.")
+        await run.message("long_conversation", state["ongoing_id"], "Here is one more detail about my matter.")
+
+
+class DepartmentChange:
+    """
+    A client mid-conversation asks for a different department.
+    """
+
+    def setup(self):
+        current, other = _departments()
+        client = _new_client(next(_serials))
+        interaction = Interaction.objects.create(
+            client=client,
+            department=current,
+            system_instructions="This is the Clients first interaction with the onboarding system.",
+        )
+        _add_messages(interaction, 6)
+        return {"interaction_id": interaction.id, "department": other.name}
+
+    async def drive(self, run, state):
+        await run.message("change", state["interaction_id"], f"Actually, I think I need help from {state['department']} instead.")
+        await run.message("after_change", state["interaction_id"], "The dispute is about a lease on our office.")
+
+
+class AttorneyAnalytics:
+    """
+    Attorney questions: reports answered from the ORM, a question for the
+    SQL agent, and the same question again from the response cache.
+    """
+
+    def setup(self):
+        serial = next(_serials)
+        department = _departments()[0]
+        client = _new_client(serial)
+        for _ in range(5):
+            Interaction.objects.create(client=client, department=department)
+        return {
+            "questions": [
+                ("routed", "How many intakes per department this month?"),
+                ("routed", f"How many intakes for {department.name} this week?"),
+                ("routed", f"Latest interactions for {client.name}"),
+                ("sql_agent", f"Which clients of {department.name} mentioned fraud in matter {serial}?"),
+                ("cached", f"Which clients of {department.name} mentioned fraud in matter {serial}?"),
+            ],
+        }
+
+    async def drive(self, run, state):
+        for step, question in state["questions"]:
+            await run.post(step, "/api/attorney_message/", {"message": question})
+
+
+SCENARIOS = {
+    "first_time_client": FirstTimeClient,
+    "returning_client": ReturningClient,
+    "department_change": DepartmentChange,
+    "attorney_analytics": AttorneyAnalytics,
+}
+
+
+async def _drive(scenario, run, states):
+    for state in states:
+        await scenario.drive(run, state)
+
+
+def run_scenario(scenario, iterations):
+    """
+    Timings, query counts and bytes written over `iterations` runs of `scenario`.
+    """
+    states = [scenario.setup() for _ in range(iterations)]
+    counter = QueryCounter()
+    run = ScenarioRun(counter)
+    timer = StageTimer()
+    with timer.installed(), connection.execute_wrapper(counter):
+        # async_to_sync keeps the async ORM on this thread, whose connection
+        # the query counter is installed on
+        async_to_sync(_drive)(scenario, run, states)
+    report = run.report()
+    report["stages"] = timer.report()
+    return report
+
+
+def measure_memory(scenario, iterations):
+    """
+    Peak and retained Python allocations in KiB over `iterations` runs.
+    """
+    states = [scenario.setup() for _ in range(iterations)]
+    run = ScenarioRun(QueryCounter())
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        async_to_sync(_drive)(scenario, run, states)
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "peak_kib": round((peak - before) / 1024, 1),
+        "retained_kib": round((after - before) / 1024, 1),
+        "errors": run.errors,
+    }
+
+
+def failed_requests(results):
+    """
+    {scenario: failed requests} of the scenarios that had any, counting the
+    memory runs too.
+    """
+    failed = {}
+    for name, result in results.items():
+        errors = result["errors"] + result.get("memory", {}).get("errors", 0)
+        if errors:
+            failed[name] = errors
+    return failed
+
+
+def run(names, iterations, memory_iterations=1):
+    results = {}
+    for name in names:
+        scenario = SCENARIOS[name]()
+        results[name] = run_scenario(scenario, iterations)
+        if memory_iterations:
+            results[name]["memory"] = measure_memory(scenario, memory_iterations)
+    return results
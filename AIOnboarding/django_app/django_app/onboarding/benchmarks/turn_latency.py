@@ -0,0 +1,80 @@
+"""
+Client-turn latency of gemini_prompt with sequential vs. overlapped Gemini
+calls, and with the combined turn-analysis call.
+"""
+from django.test.utils import override_settings
+
+from ..gemini import gemini_prompt
+from ..genai_client import get_client
+from ..models import Client, Department, Interaction
+from .harness import summarize, timer
+
+
+def _first_message(index, department):
+    return (
+        f"Hi, my name is Bench Client. My email is bench{index}@example.com and my password is "
+        f"secret{index}. I need help from {department.name} with a contract dispute."
+    )
+
+
+def first_message_turns(turns, department):
+    samples = []
+    for index in range(turns):
+        interaction = Interaction.objects.create()
+        with timer(samples):
+            gemini_prompt(_first_message(index, department), interaction_id=interaction.id)
+    return samples
+
+
+def steady_turns(turns, department):
+    client = Client.objects.create(name="Steady Client", email="steady@example.com", password="secret")
+    interaction = Interaction.objects.create(
+        client=client,
+        department=department,
+        system_instructions="This is the Clients first interaction with the onboarding system.",
+    )
+    samples = []
+    for index in range(turns):
+        with timer(samples):
+            gemini_prompt(f"Here is more detail about my matter, part {index}.", interaction_id=interaction.id)
+    return samples
+
+
+def department_change_turns(turns, department, other):
+    client = Client.objects.create(name="Moving Client", email="moving@example.com", password="secret")
+    samples = []
+    for index in range(turns):
+        interaction = Interaction.objects.create(
+            client=client,
+            department=department,
+            system_instructions="This is the Clients first interaction with the onboarding system.",
+        )
+        with timer(samples):
+            gemini_prompt(f"Actually I think this belongs with {other.name}.", interaction_id=interaction.id)
+    return samples
+
+
+MODES = {
+    "sequential": {"GEMINI_PARALLEL_TURNS": False, "GEMINI_COMBINED_ANALYSIS": False},
+    "parallel": {"GEMINI_PARALLEL_TURNS": True, "GEMINI_COMBINED_ANALYSIS": False},
+    "combined": {"GEMINI_PARALLEL_TURNS": True, "GEMINI_COMBINED_ANALYSIS": True},
+}
+
+
+def run(turns):
+    """
+    Run every scenario in each mode and return {mode: {scenario: summary}}.
+    """
+    department, other = Department.objects.order_by("id")[:2]
+    results = {}
+    for mode, mode_settings in MODES.items():
+        with override_settings(**mode_settings):
+            Client.objects.all().delete()
+            calls_before = get_client().calls
+            results[mode] = {
+                "first_message": summarize(first_message_turns(turns, department)),
+                "steady_turn": summarize(steady_turns(turns, department)),
+                "department_change": summarize(department_change_turns(turns, department, other)),
+            }
+            results[mode]["gemini_calls"] = get_client().calls - calls_before
+    return results
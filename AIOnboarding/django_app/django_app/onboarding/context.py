@@ -0,0 +1,173 @@
+"""
+How much of an interaction's conversation is replayed to Gemini each turn.
+
+Each department picks a context strategy (falling back to
+GEMINI_CONTEXT_STRATEGY):
+
+- "full": every message, as before.
+- "window": only the last N turns verbatim.
+- "summary": the last N turns verbatim, with older turns folded into a
+  running summary cached on the interaction. The summary is brought up to
+  date by a background job once the verbatim tail reaches 2N turns, so a turn
+  never waits on it.
+- "budget": as many of the most recent messages as fit in a token budget,
+  estimated locally from the text length.
+"""
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from google.genai import types
+
+from .genai_client import get_client, request_options
+from .models import Interaction, Message
+from .jobs import aenqueue, task
+
+# A rough but dependency-free token estimate: about four characters per token
+# for English text in Gemini's tokenizer.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def content_tokens(content):
+    return sum(estimate_tokens(part.get("text") or "") for part in content.get("parts", []))
+
+
+@dataclass
+class TurnContext:
+    history: list = field(default_factory=list)
+    # Position the turn's first new message is stored at
+    next_position: int = 0
+    # Running summary of turns left out of `history`, if any
+    summary: str = ""
+
+
+def context_settings(department):
+    strategy = (department.context_strategy if department else "") or settings.GEMINI_CONTEXT_STRATEGY
+    window = (department.context_window if department else None) or settings.GEMINI_CONTEXT_WINDOW
+    budget = (department.context_token_budget if department else None) or settings.GEMINI_CONTEXT_TOKEN_BUDGET
+    return strategy, window, budget
+
+
+def _starting_with_user(contents):
+    # A resumed chat should open with a user turn, not a dangling model reply
+    while contents and contents[0]["role"] != "user":
+        contents = contents[1:]
+    return contents
+
+
+async def build_context(interaction, department=None):
+    """
+    The history to resume `interaction`'s chat from under its department's
+    context strategy.
+    """
+    strategy, window, budget = context_settings(department)
+    messages = Message.objects.filter(interaction=interaction)
+
+    if strategy == "window":
+        rows = [message async for message in messages.order_by("-position")[:window * 2]]
+        rows.reverse()
+        next_position = rows[-1].position + 1 if rows else 0
+        return TurnContext(_starting_with_user([row.as_content() for row in rows]), next_position)
+
+    if strategy == "summary":
+        rows = [message async for message in messages.filter(position__gte=interaction.context_summary_until)]
+        next_position = rows[-1].position + 1 if rows else interaction.context_summary_until
+        history = _starting_with_user([row.as_content() for row in rows])
+        return TurnContext(history, next_position, interaction.context_summary)
+
+    if strategy == "budget":
+        history, used, next_position = [], 0, None
+        async for message in messages.order_by("-position"):
+            if next_position is None:
+                next_position = message.position + 1
+            content = message.as_content()
+            used += content_tokens(content)
+            if used > budget:
+                break
+            history.append(content)
+        history.reverse()
+        return TurnContext(_starting_with_user(history), next_position or 0)
+
+    rows = [message async for message in messages]
+    return TurnContext([row.as_content() for row in rows], rows[-1].position + 1 if rows else 0)
+
+
+def summary_instruction(summary):
+    return f"Summary of the earlier part of this conversation, which is not repeated below: {summary}"
+
+
+async def _fold(previous_summary, contents):
+    transcript = "\n".join(
+        f"{content['role']}: " + " ".join(part.get("text") or "" for part in content["parts"])
+        for content in contents
+    )
+    if previous_summary:
+        summary_prompt = (
+            "Please update this summary of an AI onboarding conversation with the messages below. "
+            "The response should be in paragraph form retaining relevant legal facts and anything the client was asked or told."
+            f"\nCurrent summary: {previous_summary}\nNew messages:\n{transcript}"
+        )
+    else:
+        summary_prompt = (
+            "Please summarise the start of this AI onboarding conversation. The response should be in paragraph form "
+            f"retaining relevant legal facts and anything the client was asked or told:\n{transcript}"
+        )
+    response = await get_client().aio.models.generate_content(
+        model="gemini-2.5-flash",
+        contents=summary_prompt,
+        config=types.GenerateContentConfig(http_options=request_options("summary")),
+    )
+    return response.text
+
+
+async def arefresh_context_summary(interaction_id, window):
+    """
+    Fold all but the last `window` turns of the interaction into its running
+    summary. Returns True if the summary changed.
+    """
+    interaction = await Interaction.objects.only("id", "context_summary", "context_summary_until").aget(id=interaction_id)
+    until = interaction.context_summary_until
+    tail = [message async for message in Message.objects.filter(interaction_id=interaction_id).order_by("-position")[:window * 2]]
+    if not tail:
+        return False
+    # Keep the verbatim tail starting on a user message
+    oldest_user = next((message for message in reversed(tail) if message.role == "user"), None)
+    cutoff = oldest_user.position if oldest_user else tail[0].position + 1
+    rows = [message async for message in Message.objects.filter(interaction_id=interaction_id, position__gte=until, position__lt=cutoff)]
+    if not rows:
+        return False
+    summary = await _fold(interaction.context_summary, [row.as_content() for row in rows])
+    # Only one refresh may move the summary forward from a given point
+    updated = await Interaction.objects.filter(id=interaction_id, context_summary_until=until).aupdate(
+        context_summary=summary,
+        context_summary_until=cutoff,
+    )
+    return bool(updated)
+
+
+@task(priority=-1)
+async def refresh_context_summary_job(interaction_id, window):
+    return {"changed": await arefresh_context_summary(interaction_id, window)}
+
+
+async def after_turn(interaction, department, context, added):
+    """
+    Called once a turn's `added` messages are stored. Queues a summary
+    refresh when the verbatim tail of a "summary" interaction has outgrown it.
+    """
+    strategy, window, _ = context_settings(department)
+    if strategy != "summary":
+        return None
+    verbatim = context.next_position + added - interaction.context_summary_until
+    if verbatim < window * 4:
+        return None
+    # One refresh per starting point, however many turns ask for it meanwhile
+    return await aenqueue(
+        refresh_context_summary_job,
+        interaction_id=interaction.id,
+        window=window,
+        idempotency_key=f"context-summary:{interaction.id}:{interaction.context_summary_until}",
+    )
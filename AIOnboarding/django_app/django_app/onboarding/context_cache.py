@@ -0,0 +1,169 @@
+"""
+Gemini context caching for the system instructions of steady-state turns.
+
+Once an interaction has its client and department, the system instructions
+sent with each turn (base instructions, client history summary and the
+department prompt) only change when the department or a summary does. Those
+instructions are stored once as Gemini cached content, and its handle is
+tracked in GeminiContextCache, keyed on a hash of the text.
+
+A turn never waits for a cache to be created or extended: a miss is sent
+with inline instructions while the cache is created by a task on the
+request's event loop for the next turn, and a cache close to expiry is
+extended the same way. The tasks use the loop's own Gemini client, whose
+connections can't be used from any other loop.
+Anything that goes wrong falls back to inline instructions. Cached contents
+whose handle is replaced or expired are deleted from Gemini when the next
+cache is created.
+"""
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+from google.genai import types
+
+from .context import estimate_tokens
+from .genai_client import get_client, request_options
+from .metrics import cache_result
+from .models import GeminiContextCache
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+# Cache keys being created or extended, and keys whose creation failed
+# recently (mapped to when to try again)
+_in_flight = set()
+_retry_after = {}
+# Running create/extend tasks; the loop only keeps weak references to them
+_tasks = set()
+
+
+def cache_key(model, system_instruction):
+    return hashlib.sha256(f"{model}\n{system_instruction}".encode("utf-8")).hexdigest()
+
+
+async def cached_content_for(model, system_instruction, department=None):
+    """
+    Name of a live cached content holding `system_instruction`, or None if the
+    turn should send the instructions inline.
+    """
+    if not settings.GEMINI_CONTEXT_CACHE or not system_instruction:
+        return None
+    token_estimate = estimate_tokens(system_instruction)
+    if token_estimate < settings.GEMINI_CONTEXT_CACHE_MIN_TOKENS:
+        # Gemini refuses to cache content below its minimum size
+        return None
+
+    key = cache_key(model, system_instruction)
+    now = timezone.now()
+    entry = await GeminiContextCache.objects.filter(key=key, expires_at__gt=now).afirst()
+    cache_result("gemini_context", entry is not None)
+    if entry is None:
+        _schedule(_create, key, model, system_instruction, department.id if department else None, token_estimate)
+        return None
+    if entry.expires_at - now < timedelta(seconds=settings.GEMINI_CONTEXT_CACHE_TTL / 4):
+        _schedule(_extend, key, entry.name)
+    return entry.name
+
+
+def _schedule(job, key, *args):
+    with _lock:
+        if key in _in_flight or _retry_after.get(key, 0) > time.monotonic():
+            return
+        _in_flight.add(key)
+    task = asyncio.create_task(_run(job, key, *args))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def _run(job, key, *args):
+    try:
+        await job(key, *args)
+        with _lock:
+            _retry_after.pop(key, None)
+    except Exception as e:
+        logger.warning("Context cache %s failed: %s", job.__name__.strip('_'), e)
+        with _lock:
+            _retry_after[key] = time.monotonic() + settings.GEMINI_CONTEXT_CACHE_RETRY
+    finally:
+        with _lock:
+            _in_flight.discard(key)
+
+
+async def _create(key, model, system_instruction, department_id, token_estimate):
+    ttl = settings.GEMINI_CONTEXT_CACHE_TTL
+    cached = await get_client().aio.caches.create(
+        model=model,
+        config=types.CreateCachedContentConfig(
+            system_instruction=system_instruction,
+            ttl=f"{ttl}s",
+            display_name=f"onboarding-{key[:16]}",
+            http_options=request_options("default"),
+        ),
+    )
+    now = timezone.now()
+    await _drop(GeminiContextCache.objects.filter(key=key))
+    try:
+        await GeminiContextCache.objects.acreate(
+            key=key,
+            name=cached.name,
+            model=model,
+            department_id=department_id,
+            token_estimate=token_estimate,
+            expires_at=now + timedelta(seconds=ttl),
+        )
+    except IntegrityError:
+        # Another process cached the same instructions meanwhile; theirs wins
+        await _delete_cached_contents([cached.name])
+        return
+    # Expired handles are useless
+    await _drop(GeminiContextCache.objects.filter(expires_at__lte=now))
+    logger.info("Created context cache %s (~%s tokens)", cached.name, token_estimate)
+
+
+async def _extend(key, name):
+    ttl = settings.GEMINI_CONTEXT_CACHE_TTL
+    await get_client().aio.caches.update(
+        name=name,
+        config=types.UpdateCachedContentConfig(ttl=f"{ttl}s", http_options=request_options("default")),
+    )
+    await GeminiContextCache.objects.filter(key=key, name=name).aupdate(
+        expires_at=timezone.now() + timedelta(seconds=ttl),
+        updated_at=timezone.now(),
+    )
+
+
+async def forget(name):
+    """
+    Stop using a cached content Gemini rejected (e.g. deleted early).
+    """
+    await _drop(GeminiContextCache.objects.filter(name=name))
+
+
+async def _drop(entries):
+    """
+    Delete the GeminiContextCache `entries` and their cached contents, which
+    Gemini would otherwise keep (and bill storage for) until their TTL ends.
+    """
+    names = [name async for name in entries.values_list("name", flat=True)]
+    if names:
+        await GeminiContextCache.objects.filter(name__in=names).adelete()
+        await _delete_cached_contents(names)
+
+
+async def _delete_cached_contents(names):
+    for name in names:
+        try:
+            await get_client().aio.caches.delete(
+                name=name,
+                config=types.DeleteCachedContentConfig(http_options=request_options("default")),
+            )
+        except Exception as e:
+            # Most likely expired or deleted already
+            logger.info("Could not delete context cache %s: %s", name, e)
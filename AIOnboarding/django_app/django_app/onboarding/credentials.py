@@ -0,0 +1,66 @@
+"""
+Client credentials.
+
+Emails are compared case-insensitively by storing them lowercased, so the
+login lookup is an exact match on the unique email index. Passwords are
+stored as PBKDF2 hashes with CLIENT_PASSWORD_ITERATIONS iterations. Hashing
+is deliberately slow, so the async helpers run it on a worker thread instead
+of blocking the event loop.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, check_password, identify_hasher, make_password
+
+
+def normalize_email(email):
+    return (email or "").strip().lower()
+
+
+def _hasher():
+    hasher = PBKDF2PasswordHasher()
+    hasher.iterations = settings.CLIENT_PASSWORD_ITERATIONS
+    return hasher
+
+
+def is_hashed(encoded):
+    try:
+        identify_hasher(encoded)
+    except ValueError:
+        return False
+    return True
+
+
+def hash_password(raw_password):
+    return make_password(raw_password, hasher=_hasher())
+
+
+def verify_password(raw_password, encoded):
+    """
+    (matches, rehashed) for `raw_password` against the stored `encoded`
+    value. `rehashed` is a new hash to store when the stored one uses a
+    different work factor, otherwise None.
+    """
+    if not raw_password or not encoded or not is_hashed(encoded):
+        return False, None
+    if not check_password(raw_password, encoded):
+        return False, None
+    hasher = _hasher()
+    if identify_hasher(encoded).algorithm != hasher.algorithm or hasher.must_update(encoded):
+        return True, hash_password(raw_password)
+    return True, None
+
+
+async def ahash_password(raw_password):
+    return await sync_to_async(hash_password, thread_sensitive=False)(raw_password)
+
+
+async def averify_client_password(client, raw_password):
+    """
+    Check `raw_password` for `client`, upgrading the stored hash to the
+    current work factor on a successful login.
+    """
+    matches, rehashed = await sync_to_async(verify_password, thread_sensitive=False)(raw_password, client.password)
+    if rehashed:
+        client.password = rehashed
+        await client.asave(update_fields=["password"])
+    return matches
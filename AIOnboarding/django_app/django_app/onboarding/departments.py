@@ -0,0 +1,129 @@
+"""
+In-process catalog of departments.
+
+The departments are loaded once into an immutable DepartmentCatalog and
+shared by every request until a Department is saved or deleted in this
+process (see apps.py). To catch changes made by other processes, the catalog
+is also reloaded after DEPARTMENT_CATALOG_TTL seconds. Each load gets a new
+version number, and the structured-output schemas listing the department
+names are built once per version.
+"""
+import copy
+import itertools
+import threading
+import time
+
+from django.conf import settings
+
+from .models import Department
+
+# Schema properties holding a department name
+DEPARTMENT_FIELDS = ("department", "change_department")
+
+_lock = threading.Lock()
+_versions = itertools.count(1)
+_catalog = None
+_generation = 0
+
+
+class DepartmentCatalog:
+    def __init__(self, departments, version):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.departments = tuple(departments)
+        self._by_id = {department.id: department for department in self.departments}
+        self._by_name = {department.name.casefold(): department for department in self.departments}
+        self._schemas = {}
+
+    @property
+    def names(self):
+        return [department.name for department in self.departments]
+
+    def get(self, key):
+        """
+        Department by id or case-insensitive name, or None.
+        """
+        if key is None or key == "":
+            return None
+        if isinstance(key, int):
+            return self._by_id.get(key)
+        key = str(key).strip()
+        if key.isdigit():
+            return self._by_id.get(int(key))
+        return self._by_name.get(key.casefold())
+
+    def find_in(self, text):
+        """
+        The department whose name appears in `text`, preferring the longest.
+        """
+        lowered = text.casefold()
+        matches = [department for name, department in self._by_name.items() if name in lowered]
+        return max(matches, key=lambda department: len(department.name), default=None)
+
+    def schema(self, model):
+        """
+        JSON schema of pydantic `model` with its department fields limited to
+        the current department names.
+        """
+        schema = self._schemas.get(model)
+        if schema is None:
+            schema = copy.deepcopy(model.model_json_schema())
+            for field in DEPARTMENT_FIELDS:
+                if field in schema.get("properties", {}):
+                    prop = schema["properties"][field]
+                    prop.pop("anyOf", None)
+                    prop.pop("type", None)
+                    prop["anyOf"] = [{"type": "string", "enum": self.names}, {"type": "null"}]
+            self._schemas[model] = schema
+        return schema
+
+
+def _is_current(catalog):
+    return catalog is not None and time.monotonic() - catalog.loaded_at < settings.DEPARTMENT_CATALOG_TTL
+
+
+def _install(departments, generation):
+    global _catalog
+    catalog = DepartmentCatalog(departments, next(_versions))
+    with _lock:
+        # Don't keep a catalog loaded before an invalidation that raced it
+        if generation == _generation:
+            _catalog = catalog
+    return catalog
+
+
+async def aget_catalog(reload=False):
+    catalog = _catalog
+    if not reload and _is_current(catalog):
+        return catalog
+    generation = _generation
+    return _install([department async for department in Department.objects.order_by("name")], generation)
+
+
+def get_catalog(reload=False):
+    catalog = _catalog
+    if not reload and _is_current(catalog):
+        return catalog
+    generation = _generation
+    return _install(list(Department.objects.order_by("name")), generation)
+
+
+async def aget_department(department_id):
+    """
+    Department by primary key. A miss reloads the catalog once, since the
+    department may have been created by another process.
+    """
+    department = (await aget_catalog()).get(department_id)
+    if department is None and department_id is not None:
+        department = (await aget_catalog(reload=True)).get(department_id)
+    return department
+
+
+def invalidate(**kwargs):
+    """
+    Signal receiver: a department was saved or deleted.
+    """
+    global _catalog, _generation
+    with _lock:
+        _catalog = None
+        _generation += 1
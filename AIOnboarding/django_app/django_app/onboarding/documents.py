@@ -0,0 +1,269 @@
+"""
+Document uploads and text extraction.
+
+Files are attached to an interaction by posting them to
+api/interactions/<id>/documents/, either as multipart form data (field
+"file") or as the raw request body with the name in an X-File-Name header.
+Either way the upload is streamed chunk by chunk into a temporary file and
+hashed (SHA-256) on the way, so it is never held in memory as a whole.
+
+A file the interaction already has is not stored again. A file uploaded to
+another interaction before shares that stored copy, and its extracted text
+once there is one.
+
+Text is extracted by the extract_document_text job on the "documents" queue,
+so the upload request returns as soon as the file is stored. Plain text is
+decoded as UTF-8; PDFs are read page by page with pypdf, which is optional
+(without it PDF extraction fails). The text is stored next to the file, as
+<file name>.txt, and indexed for retrieval (see retrieval.py).
+"""
+import codecs
+import hashlib
+import logging
+import mimetypes
+import posixpath
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .jobs import enqueue, task
+from .models import Document
+from .retrieval import queue_document_indexing
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+logger = logging.getLogger(__name__)
+
+QUEUE = "documents"
+CHUNK_SIZE = 64 * 1024
+TEXT_TYPES = ("text/", "application/json", "application/xml", "application/csv")
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UnsupportedDocument(Exception):
+    pass
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams multipart file parts to temporary files, hashing them and
+    stopping once they exceed DOCUMENT_MAX_UPLOAD_SIZE.
+    """
+
+    chunk_size = CHUNK_SIZE
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.too_large = False
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.DOCUMENT_MAX_UPLOAD_SIZE:
+            self.too_large = True
+            raise StopUpload(connection_reset=True)
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        upload = super().file_complete(file_size)
+        upload.content_hash = self.sha256.hexdigest()
+        return upload
+
+
+def _receive_raw(request, name):
+    content_type = request.content_type or mimetypes.guess_type(name)[0] or "application/octet-stream"
+    upload = TemporaryUploadedFile(name, content_type, 0, None)
+    sha256 = hashlib.sha256()
+    size = 0
+    while chunk := request.read(CHUNK_SIZE):
+        size += len(chunk)
+        if size > settings.DOCUMENT_MAX_UPLOAD_SIZE:
+            upload.close()
+            raise UploadTooLarge(name)
+        sha256.update(chunk)
+        upload.write(chunk)
+    upload.size = size
+    upload.seek(0)
+    upload.content_hash = sha256.hexdigest()
+    return upload
+
+
+def receive_upload(request):
+    """
+    The uploaded file of `request`, in a temporary file with its SHA-256 in
+    `content_hash`, or None if there is none. Raises UploadTooLarge.
+    """
+    if request.content_type == "multipart/form-data":
+        handler = HashingUploadHandler(request)
+        request.upload_handlers = [handler]
+        upload = request.FILES.get("file")
+        if handler.too_large:
+            raise UploadTooLarge(handler.file_name)
+        return upload
+    name = posixpath.basename(request.headers.get("X-File-Name", "").replace("\\", "/"))
+    if not name:
+        return None
+    return _receive_raw(request, name)
+
+
+def _file_type(upload):
+    if upload.content_type and upload.content_type != "application/octet-stream":
+        return upload.content_type[:50]
+    return (mimetypes.guess_type(upload.name)[0] or "application/octet-stream")[:50]
+
+
+def store_upload(interaction, upload):
+    """
+    Attach `upload` to `interaction` and queue its text extraction. Returns
+    (document, created); an identical file already attached is returned as is.
+    """
+    existing = interaction.documents.filter(content_hash=upload.content_hash).first()
+    if existing is not None:
+        return existing, False
+    document = Document(
+        interaction=interaction,
+        file_name=upload.name[:255],
+        file_type=_file_type(upload),
+        size=upload.size,
+        content_hash=upload.content_hash,
+    )
+    original = Document.objects.filter(content_hash=upload.content_hash).exclude(file="").order_by("id").first()
+    if original is not None and original.file.storage.exists(original.file.name):
+        document.file.name = original.file.name
+        if original.status == Document.READY:
+            document.text_file.name = original.text_file.name
+            document.text_length = original.text_length
+            document.status = Document.READY
+            document.extracted_at = original.extracted_at
+    else:
+        document.file.save(document.file_name, upload, save=False)
+    try:
+        with transaction.atomic():
+            document.save()
+            if document.status == Document.READY:
+                queue_document_indexing(document)
+            else:
+                queue_extraction(document)
+    except IntegrityError:
+        # The same file was attached by a concurrent upload
+        if document.file.name != (original.file.name if original else None):
+            document.file.delete(save=False)
+        return interaction.documents.get(content_hash=upload.content_hash), False
+    return document, True
+
+
+def queue_extraction(document, again=False):
+    """
+    Queue extracting the text of `document`, once unless `again` is set.
+    """
+    return enqueue(
+        extract_document_text,
+        queue=QUEUE,
+        document_id=document.id,
+        idempotency_key=None if again else f"document-text:{document.id}",
+    )
+
+
+def _is_pdf(document):
+    return document.file_type == "application/pdf" or document.file_name.lower().endswith(".pdf")
+
+
+def _is_text(document):
+    return document.file_type.startswith(TEXT_TYPES) or mimetypes.guess_type(document.file_name)[0] in (None, "text/plain")
+
+
+def _pages(document, source):
+    """
+    The document's text in pieces, read from `source` as they are needed.
+    """
+    if _is_pdf(document):
+        if pypdf is None:
+            raise UnsupportedDocument("PDF text extraction needs the pypdf package")
+        for page in pypdf.PdfReader(source).pages:
+            yield (page.extract_text() or "") + "\n"
+    elif _is_text(document):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while chunk := source.read(CHUNK_SIZE):
+            yield decoder.decode(chunk)
+        yield decoder.decode(b"", final=True)
+    else:
+        raise UnsupportedDocument(f"Can't extract text from {document.file_type or 'this file type'}")
+
+
+@task(priority=-2)
+def extract_document_text(document_id):
+    document = Document.objects.filter(id=document_id).first()
+    if document is None:
+        # The document was deleted after the job was queued
+        return {"characters": 0}
+    Document.objects.filter(id=document.id).update(status=Document.EXTRACTING, error="")
+    length = 0
+    try:
+        with document.file.open("rb") as source, tempfile.TemporaryFile("w+", encoding="utf-8") as text:
+            for piece in _pages(document, source):
+                text.write(piece)
+                length += len(piece)
+            text.seek(0)
+            document.text_file.save(f"{posixpath.basename(document.file.name)}.txt", File(text), save=False)
+    except UnsupportedDocument as e:
+        logger.warning("Document %s: %s", document.id, e)
+        Document.objects.filter(id=document.id).update(status=Document.FAILED, error=str(e))
+        return {"characters": 0, "error": str(e)}
+    except Exception as e:
+        # Left to be retried by the job queue
+        Document.objects.filter(id=document.id).update(status=Document.FAILED, error=str(e))
+        raise
+    Document.objects.filter(id=document.id).update(
+        status=Document.READY,
+        text_file=document.text_file.name,
+        text_length=length,
+        extracted_at=timezone.now(),
+        error="",
+    )
+    logger.info("Extracted %s characters from document %s", length, document.id)
+    queue_document_indexing(document)
+    return {"characters": length}
+
+
+def hash_file(document):
+    """
+    SHA-256 of a stored document, read in chunks.
+    """
+    sha256 = hashlib.sha256()
+    with document.file.open("rb") as source:
+        while chunk := source.read(CHUNK_SIZE):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def document_data(document):
+    return {
+        'id': document.id,
+        'interaction_id': document.interaction_id,
+        'file_name': document.file_name,
+        'file_type': document.file_type,
+        'size': document.size,
+        'content_hash': document.content_hash,
+        'status': document.status,
+        'text_length': document.text_length,
+        'text_url': document.text_file.url if document.text_file else None,
+        'error': document.error or None,
+        'created_at': document.created_at,
+        'extracted_at': document.extracted_at,
+    }
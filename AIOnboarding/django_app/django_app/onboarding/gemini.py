@@ -1,35 +1,55 @@
+import asyncio
 import json
-from google import genai
+import logging
+from asgiref.sync import async_to_sync, sync_to_async
 from google.genai import types
-from .models import Client, Interaction, Department
-from .api import api_key
-from langchain_community.agent_toolkits import create_sql_agent
-from langchain_community.utilities import SQLDatabase
-from langchain_google_genai import ChatGoogleGenerativeAI
-from django.db import connection
+from .models import Client, Interaction, Message
+from .genai_client import get_client, request_options
+from .orchestration import discard, start
+from .summaries import aclient_summary, aqueue_client_summary_refresh
+from .llm import get_backend
+from .analytics import route_question
+from .context import after_turn, build_context, summary_instruction
+from .context_cache import cached_content_for, forget as forget_cached_content
+from .departments import aget_catalog, aget_department
+from .credentials import ahash_password, averify_client_password, normalize_email
+from .metrics import collect_turn, end_turn, save_timings, span
+from .response_cache import attorney_cache, invalidate as invalidate_responses
+from .retrieval import aretrieve, grounded_prompt
+from .search import aindex_messages
+from django.db import IntegrityError, connection
 from django.conf import settings
-from sqlalchemy import create_engine
-from google import genai
+from django.utils import timezone
 from pydantic import BaseModel, Field
 from typing import List, Optional
 
+logger = logging.getLogger(__name__)
+
 class Information(BaseModel):
     name: Optional[str] = Field(description="This should be filled if the prompt contains the users name. Please be certain it is the users name and not a random name mentioned in the prompt.")
     password: Optional[str] = Field(description="This should be filled if the prompt contains the users password. It should be clear in the chat that the user wants to provide this password.")
     email: Optional[str] = Field(description="This should be filled if the prompt contains the users email. Please be certain it is the users email and not a random email mentioned in the prompt.")
     department: Optional[str] = Field(description=
                                       f"""This should be filled if the user indicates they want to be connected to a department in the current interaction. Previous interactions should not be considered for filling this field.
-                                      The possible deparments are Corporate Law, Litigation, Intellectual Property, Real Estate, Employment Law, Tax Law, Environmental Law, Healthcare Law, Family Law, Bankruptcy & Restructuring, International Law, Administrative Law, Energy Law, Construction Law, Financial Services. 
+                                      The possible departments are the values allowed by this field.
                                       If it is clear the user wants to interact with one of these departments, fill this field with the exact name of the department.""")
     
 class ChangeDepartment(BaseModel):
     department: Optional[str] = Field(description=f"""This should be filled if the user wants to interact with a different department in the current interaction than the current department.
-                                      The possible deparments are Corporate Law, Litigation, Intellectual Property, Real Estate, Employment Law, Tax Law, Environmental Law, Healthcare Law, Family Law, Bankruptcy & Restructuring, International Law, Administrative Law, Energy Law, Construction Law, Financial Services. 
+                                      The possible departments are the values allowed by this field.
                                       If it is clear the user wants to interact with one of these departments, fill this field with the exact name of the department.""")
 
 class InteractionCompleted(BaseModel):
     completed: bool = Field(description="This should be true when one of the interaction participants say goodbye.")
 
+class TurnAnalysis(Information):
+    """
+    Everything gemini_prompt needs to know about a client message, answered by a
+    single structured-output call (see GEMINI_COMBINED_ANALYSIS).
+    """
+    change_department: Optional[str] = Field(description=ChangeDepartment.model_fields["department"].description)
+    completed: bool = Field(description="This should be true when the user says goodbye or indicates they are done with the interaction.")
+
 def normalize_system_instruction(system_instruction):
     if not system_instruction:
         return None
@@ -40,207 +60,438 @@ def normalize_system_instruction(system_instruction):
 
 
 def gemini_prompt(prompt, interaction_id=None):
-    current_interaction = Interaction.objects.filter(id=interaction_id).first() if interaction_id else None
+    """
+    Synchronous entry point for callers outside the async request path.
+    """
+    return async_to_sync(agemini_prompt)(prompt, interaction_id=interaction_id)
+
+
+async def agemini_prompt(prompt, interaction_id=None):
+    chunks = []
+    async for chunk in agemini_prompt_stream(prompt, interaction_id=interaction_id, stream=False):
+        chunks.append(chunk)
+    return "".join(chunks)
+
+
+async def agemini_prompt_stream(prompt, interaction_id=None, stream=True):
+    """
+    Run one client turn, yielding the reply text as Gemini produces it. The
+    new messages are appended to the conversation once the reply is complete.
+    """
+    current_interaction = await Interaction.objects.select_related('client').filter(id=interaction_id).afirst() if interaction_id else None
+    timings = collect_turn()
+    catalog = await aget_catalog()
+    if current_interaction.department_id:
+        # Departments come from the in-process catalog instead of a join
+        current_interaction.department = await aget_department(current_interaction.department_id)
     user_prompt = prompt
     system_instructions = ["You are an AI legal assistant helping onboard clients to a law firm."
                            "Do not make up any legal advice or information. "
                            "Only get information that you might think is relevant to onboarding a client to a law firm."
                            "Once you have gathered enough information, please thank the user for providing the information and let them know a legal professional will reach out to them shortly."
                            f"Do not provide next steps or instructions to the user. Please say goodbye to the user once the interaction is complete."]
+    department = None
+    turn = None
+    completed = False
 
-    if not current_interaction.client or not current_interaction.department:
-        vars = extract_variables_gemini(user_prompt)
-
-        name = vars.get("name")
-        password = vars.get("password")
-        email = vars.get("email")
-        department = vars.get("department")
-        print(f"[Gemini] Extracted variables: name={name}, password={password}, email={email}, department={department}", flush=True)
-
-    # Assign client if not already assigned
-    if not current_interaction.client:
-        if not name or not password or not email:
-            return "Please clearly provide a name, password, and email to proceed."
-        client = Client.objects.filter(email=email).first() if name else None
-        if client and password != client.password:
-            return f"Incorrect password for client {name}."
-        if not client:
-            client = Client.objects.create(name=name, password=password, email=email)
-            #print(f"[Gemini] Created new client {client.name}", flush=True)
-            system_instructions.append("The client has been added to the system.")
-        else:
-            #print(f"[Gemini] Found existing client {client.name}", flush=True)
-            system_instructions.append("The client has been identified in the system.")
-        system_instructions.append(f"The client's name is {client.name}, their email is {client.email}, and their password is {client.password}.")
-        current_interaction.client = client
-        current_interaction.save()
-        
-        #print(f"[Gemini] Assigned client {client.name} to interaction {current_interaction.id}", flush=True)
-    
-    if not current_interaction.department and not department:
-        system_instructions.append(
-            "Please determine what the clients legal needs are and the appropriate department for this client based on their legal needs."
-            "Then confirm whith the client that this is the appropriate department."
-        )
+    # The classification calls only depend on the prompt, so start them now and
+    # let them run while the client lookup and history summary happen here.
+    needs_details = not current_interaction.client or not current_interaction.department
+    current_department = current_interaction.department.name if current_interaction.department else None
+    analysis_future = vars_future = change_future = completed_future = None
+    if settings.GEMINI_COMBINED_ANALYSIS:
+        # One structured call answers every question, so the futures share it
+        analysis_future = await start(aanalyze_turn, user_prompt, current_department)
+        vars_future = analysis_future if needs_details else None
+        change_future = analysis_future if current_department else None
+        completed_future = analysis_future
+    else:
+        if needs_details:
+            vars_future = await start(aextract_variables_gemini, user_prompt)
+        if current_department:
+            change_future = await start(_check_department_change, user_prompt, current_department)
+        if current_interaction.client_id:
+            # Only an identified client's interaction has a summary to refresh
+            completed_future = await start(acheck_completed, user_prompt)
 
-    if not current_interaction.system_instructions:
-        interactions = Interaction.objects.filter(client=current_interaction.client).exclude(id=current_interaction.id)
-        if not interactions.exists():
-            current_interaction.system_instructions = "This is the Clients first interaction with the onboarding system."
-        else:
-            temp = ""
-            for interaction in interactions:
-                temp += f"\nPrevious interaction this client had with {interaction.department.name if interaction.department else 'The system'}: {interaction.conversation}"
-            if interactions:
-                #print(f"[Gemini] Previous interactions: {temp}", flush=True)
-                summary_prompt = f"Please provide a summary of these previous AI onboarding conversations. The response should be in paragraph form retaining relevant legal facts: {temp}"
-                cli = genai.Client(api_key=api_key())
-                response = cli.models.generate_content(
-                    model="gemini-2.5-flash",
-                    contents=summary_prompt
-                )
-                #print(f"[Gemini] Summary of previous interactions: {response.text}", flush=True)
-                
+    try:
+        if vars_future:
+            with span("extraction"):
+                vars = await vars_future
+
+            name = vars.get("name")
+            password = vars.get("password")
+            email = vars.get("email")
+            department = catalog.get(vars.get("department"))
+            logger.debug("Extracted variables: name=%s, password=%s, email=%s, department=%s", name, '***' if password else None, email, department)
+
+        # Assign client if not already assigned
+        if not current_interaction.client:
+            if not name or not password or not email:
+                yield "Please clearly provide a name, password, and email to proceed."
+                return
+            with span("client_lookup"):
+                client, created = await _identify_client(name, email, password)
+            if client is None:
+                yield f"Incorrect password for client {name}."
+                return
+            if created:
+                #print(f"[Gemini] Created new client {client.name}", flush=True)
+                system_instructions.append("The client has been added to the system.")
+            else:
+                #print(f"[Gemini] Found existing client {client.name}", flush=True)
+                system_instructions.append("The client has been identified in the system.")
+            system_instructions.append(f"The client's name is {client.name} and their email is {client.email}.")
+            current_interaction.client = client
+            await current_interaction.asave()
+
+            #print(f"[Gemini] Assigned client {client.name} to interaction {current_interaction.id}", flush=True)
+
+        if not current_interaction.department and not department:
+            system_instructions.append(
+                "Please determine what the clients legal needs are and the appropriate department for this client based on their legal needs."
+                "Then confirm whith the client that this is the appropriate department."
+            )
+
+        if not current_interaction.system_instructions:
+            # Earlier interactions are folded into a stored rolling summary by
+            # a background job queued when each one ends, so the turn only
+            # waits for Gemini when that has not caught up yet
+            with span("summary"):
+                summary = await aclient_summary(current_interaction.client_id, current_interaction.id)
+            if not summary:
+                current_interaction.system_instructions = "This is the Clients first interaction with the onboarding system."
+            else:
                 current_interaction.system_instructions = (
                     "Summary of all previous interactions this client had with the onboarding system:"
-                    f"(this is not necessarily relevant for the current interaction): {response.text}"
+                    f"(this is not necessarily relevant for the current interaction): {summary}"
                 )
-        current_interaction.save()
-    system_instructions.append(current_interaction.system_instructions)
-    # Assign department if not already assigned
-    if not current_interaction.department and department:
-        department_obj = Department.objects.filter(name=department).first()
-        current_interaction.department = department_obj
-        current_interaction.save()
-        print(f"[Gemini] Assigned department {department_obj.name} to interaction {current_interaction.id}", flush=True)
-        system_instructions.append("The interatction has been assigned to a department." 
-                                    " The department instructions are: "
-                                    f"{department_obj.prompt}")
-    else:
-        # Check if the department needs to be changed
-        if current_interaction.department:
-            #print(f"[Gemini] Checking if current department for interaction is correct", flush=True)
-            new_department = change_department(user_prompt, current_interaction.department.name)
-            if new_department and new_department != current_interaction.department.name:
-                # Save the current interaction before changing the department
-                current_interaction.department = Department.objects.filter(name=new_department).first()
-                current_interaction.save()
-                system_instructions.append("The interatction has been assigned to a different department. Please redirect the conversation accordingly and inform the user." 
-                                            " The new department instructions are: " 
-                                            f"{current_interaction.department.prompt}")
-                print(f"[Gemini] Changed department to {new_department} for interaction {current_interaction.id}", flush=True)
-            else:
-                system_instructions.append(f"{current_interaction.department.prompt}")
-
-    history = current_interaction.conversation if current_interaction else []
-    gemini_client = genai.Client(api_key=api_key())
-    system_instruction_text = normalize_system_instruction(system_instructions)
-    config = types.GenerateContentConfig(system_instruction=system_instruction_text) if system_instruction_text else None
-    #print(f"[Gemini] System instructions: {system_instruction_text}", flush=True)
-    chat = gemini_client.chats.create(
-        model="gemini-2.5-flash",
-        history=history,
-        config=config,
-    )
-    response = chat.send_message(message=user_prompt)
-    if not current_interaction:
-        current_interaction = Interaction.objects.create(client=client, conversation=serialize_chat_history(chat.get_history()))
-    else:
-        current_interaction.conversation = serialize_chat_history(chat.get_history())
-        current_interaction.save()
-    return response.text
+            await current_interaction.asave()
+        system_instructions.append(current_interaction.system_instructions)
+        with span("context"):
+            context = await build_context(current_interaction, current_interaction.department)
+        history = context.history
+        if context.summary:
+            system_instructions.append(summary_instruction(context.summary))
+        # Only the document and transcript chunks relevant to this message are
+        # sent along with it, never whole documents
+        with span("retrieval"):
+            passages = await aretrieve(current_interaction.id, user_prompt, context.next_position - len(history))
+        # Assign department if not already assigned
+        if not current_interaction.department and department:
+            current_interaction.department = department
+            await current_interaction.asave()
+            logger.info("Assigned department %s to interaction %s", department.name, current_interaction.id)
+            system_instructions.append("The interatction has been assigned to a department." 
+                                        " The department instructions are: "
+                                        f"{department.prompt}")
+        else:
+            # Check if the department needs to be changed
+            if current_interaction.department:
+                #print(f"[Gemini] Checking if current department for interaction is correct", flush=True)
+                # Most turns keep the department, so send the chat turn with the
+                # current department prompt while the change check is in flight.
+                steady_instructions = system_instructions + [current_interaction.department.prompt]
+                cached_content = None
+                if not needs_details:
+                    # Nothing about the client or department changes this turn,
+                    # so the instructions can come from Gemini's context cache
+                    with span("context_cache") as cache_span:
+                        cached_content = await cached_content_for(
+                            "gemini-2.5-flash",
+                            normalize_system_instruction(steady_instructions),
+                            current_interaction.department,
+                        )
+                        cache_span.set(cache_hit=cached_content is not None)
+                speculative = None
+                if settings.GEMINI_PARALLEL_TURNS:
+                    speculative = ChatTurn(history, steady_instructions, user_prompt, stream, cached_content, passages)
+                with span("department_check"):
+                    new_department = catalog.get((await change_future).get("change_department"))
+                if new_department and new_department.id != current_interaction.department_id:
+                    if speculative is not None:
+                        speculative.cancel()
+                    # Save the current interaction before changing the department
+                    current_interaction.department = new_department
+                    await current_interaction.asave()
+                    system_instructions.append("The interatction has been assigned to a different department. Please redirect the conversation accordingly and inform the user." 
+                                                " The new department instructions are: " 
+                                                f"{current_interaction.department.prompt}")
+                    logger.info("Changed department to %s for interaction %s", new_department.name, current_interaction.id)
+                else:
+                    system_instructions = steady_instructions
+                    turn = speculative or ChatTurn(history, system_instructions, user_prompt, stream, cached_content, passages)
+
+        if turn is None:
+            turn = ChatTurn(history, system_instructions, user_prompt, stream, passages=passages)
+        with span("chat", model="gemini-2.5-flash", cache_hit=bool(turn.cached_content)):
+            async for chunk in turn.chunks():
+                yield chunk
+        if turn.cache_failed:
+            await forget_cached_content(turn.cached_content)
+        with span("save"):
+            added = await append_messages(current_interaction, context.next_position, turn.new_contents())
+            await after_turn(current_interaction, current_interaction.department, context, added)
+        if completed_future is not None and (await completed_future).get("completed"):
+            logger.info("Client ended interaction %s", current_interaction.id)
+            await aqueue_client_summary_refresh(current_interaction.client_id, current_interaction.id)
+        completed = True
+    finally:
+        # Stop collecting before the timings are saved, so their own insert
+        # isn't recorded into them
+        end_turn()
+        # Nothing started for this turn should outlive it, e.g. on an early
+        # return or when a streaming client disconnects
+        for future in (analysis_future, vars_future, change_future, completed_future):
+            discard(future)
+        if turn is not None:
+            turn.cancel()
+    if completed and timings is not None:
+        await save_timings(current_interaction.id, timings)
+
+async def _identify_client(name, email, password):
+    """
+    (client, created) for the login details, or (None, False) if the email
+    belongs to a client with a different password.
+    """
+    email = normalize_email(email)
+    client = await Client.objects.filter(email=email).afirst()
+    if client is None:
+        try:
+            client = await Client.objects.acreate(name=name, email=email, password=await ahash_password(password))
+            return client, True
+        except IntegrityError:
+            # Another turn registered the same email first
+            client = await Client.objects.aget(email=email)
+    if not await averify_client_password(client, password):
+        return None, False
+    return client, False
+
+class ChatTurn:
+    """
+    One chat turn resumed from `history`, sent as soon as it is created.
+
+    Reply text is buffered in a queue as it arrives, so a turn started
+    speculatively can be consumed later or cancelled without being read. It
+    makes no ORM calls.
+
+    With `cached_content` the system instructions are taken from that Gemini
+    cached content instead of being sent inline. If Gemini rejects the cache
+    before any reply text arrives, the turn is resent with the instructions
+    inline and `cache_failed` is set.
+
+    Retrieved `passages` are sent ahead of the prompt but not kept in the
+    stored conversation (see new_contents()).
+    """
+
+    def __init__(self, history, system_instructions, prompt, stream=False, cached_content=None, passages=()):
+        self.history = history
+        self.prompt = prompt
+        self.passages = passages
+        self.system_instruction_text = normalize_system_instruction(system_instructions)
+        self.cached_content = cached_content
+        self.cache_failed = False
+        self._replied = False
+        #print(f"[Gemini] System instructions: {self.system_instruction_text}", flush=True)
+        self.chat = self._create_chat(cached_content)
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._send(grounded_prompt(prompt, passages), stream))
+
+    def _create_chat(self, cached_content):
+        if cached_content:
+            config = types.GenerateContentConfig(
+                cached_content=cached_content,
+                http_options=request_options("default"),
+            )
+        else:
+            config = types.GenerateContentConfig(
+                system_instruction=self.system_instruction_text,
+                http_options=request_options("default"),
+            )
+        return get_client().aio.chats.create(
+            model="gemini-2.5-flash",
+            history=self.history,
+            config=config,
+        )
+
+    async def _send(self, prompt, stream):
+        try:
+            try:
+                await self._send_once(prompt, stream)
+            except Exception as e:
+                # Reply text already handed out can't be taken back, so only a
+                # cache failure before the first chunk is retried
+                if not self.cached_content or self._replied:
+                    raise
+                logger.warning("Cached content %s failed, sending instructions inline: %s", self.cached_content, e)
+                self.cache_failed = True
+                self.chat = self._create_chat(None)
+                await self._send_once(prompt, stream)
+        finally:
+            self._queue.put_nowait(None)
+
+    async def _send_once(self, prompt, stream):
+        if stream:
+            async for chunk in await self.chat.send_message_stream(message=prompt):
+                if chunk.text:
+                    self._put(chunk.text)
+        else:
+            response = await self.chat.send_message(message=prompt)
+            self._put(response.text)
+
+    def _put(self, text):
+        self._replied = True
+        self._queue.put_nowait(text)
+
+    def new_contents(self):
+        """
+        The messages this turn added to the chat, with the user's message as
+        they wrote it.
+        """
+        contents = self.chat.get_history()[len(self.history):]
+        if self.passages and contents:
+            contents[0] = types.Content(role=contents[0].role, parts=[types.Part(text=self.prompt)])
+        return contents
+
+    async def chunks(self):
+        while (chunk := await self._queue.get()) is not None:
+            yield chunk
+        # Re-raise anything the request failed with
+        await self._task
+
+    def cancel(self):
+        discard(self._task)
 
 def gemini_prompt_department(prompt):
-    response_from_sql = gemini_sql_query(prompt)
-    print(f"[Gemini] Response from SQL query: {response_from_sql}", flush=True)
+    return async_to_sync(agemini_prompt_department)(prompt)
+
+async def agemini_prompt_department(prompt):
+    # Common reporting questions are answered straight from the ORM
+    with span("route_question"):
+        routed_response = await route_question(prompt)
+    if routed_response is not None:
+        logger.info("Answered attorney question without the SQL agent")
+        return routed_response
+    with span("response_cache") as cache_span:
+        cached_response, cache_version = await attorney_cache.lookup(prompt)
+        cache_span.set(cache_hit=cached_response is not None)
+    if cached_response is not None:
+        logger.info("Answered attorney question from the response cache")
+        return cached_response
+    question = prompt
+    # The LangChain SQL agent is synchronous; run it on a worker thread so the
+    # event loop keeps serving other requests meanwhile.
+    with span("sql_agent"):
+        try:
+            response_from_sql = await sync_to_async(gemini_sql_query, thread_sensitive=False)(prompt, raise_errors=True)
+            cacheable = True
+        except Exception as e:
+            logger.exception("Error in gemini_sql_query: %s", e)
+            response_from_sql = f"Error executing SQL query: {str(e)}"
+            cacheable = False
+    logger.debug("Response from SQL query: %s", response_from_sql)
     prompt = f"\n\nResponse from an agentic SQL query: {response_from_sql}\n\n Use that to respond to this prompt: {prompt}"
-    client = genai.Client(api_key=api_key())
-    chat = client.chats.create(
+    chat = get_client().aio.chats.create(
         model="gemini-2.5-flash",
         history=[],
+        config=types.GenerateContentConfig(http_options=request_options("default")),
     )
-    response = chat.send_message(message=prompt)
+    with span("chat", model="gemini-2.5-flash"):
+        response = await chat.send_message(message=prompt)
+    # An answer written around a failed query is not reused for the next asker
+    if cacheable and response.text:
+        await attorney_cache.store(question, response.text, cache_version)
     return response.text
 
-def change_department(prompt, current_department: str):
+async def achange_department(prompt, current_department: str):
     prompt = f"""
     Analyze the following text and determine if the user wants to change their department.
     Current department: {current_department}
     Text: {prompt}
     """
-    client = genai.Client(api_key=api_key())
-    response = client.models.generate_content(
+    response = await get_client().aio.models.generate_content(
         model="gemini-2.5-flash",
         contents=prompt,
         config={
             "response_mime_type": "application/json",
-            "response_json_schema": ChangeDepartment.model_json_schema(),
+            "response_json_schema": (await aget_catalog()).schema(ChangeDepartment),
+            "http_options": request_options("classify"),
         },
     )
-    print(f"[Gemini] Change department response: {response.text}", flush=True)
+    logger.debug("Change department response: %s", response.text)
     return json.loads(response.text).get("department")
 
-def extract_variables_gemini(prompt):
+async def _check_department_change(prompt, current_department):
+    return {"change_department": await achange_department(prompt, current_department)}
+
+async def acheck_completed(prompt):
+    prompt = f"""
+    Analyze the following text and determine if the user wants to end the interaction.
+    Text: {prompt}
+    """
+    response = await get_client().aio.models.generate_content(
+        model="gemini-2.5-flash",
+        contents=prompt,
+        config={
+            "response_mime_type": "application/json",
+            "response_json_schema": InteractionCompleted.model_json_schema(),
+            "http_options": request_options("classify"),
+        },
+    )
+    logger.debug("Interaction completed response: %s", response.text)
+    return json.loads(response.text)
+
+async def aanalyze_turn(prompt, current_department=None):
+    """
+    Combined replacement for aextract_variables_gemini and achange_department:
+    one generate_content call returning a TurnAnalysis dict.
+    """
+    prompt = f"""
+    Analyze the following text and extract user details, the department the user wants and whether the user wants to change their department or end the interaction.
+    If a detail is missing or not mentioned, set the value to null (None).
+    Current department: {current_department or "None"}
+    Text: {prompt}
+    """
+    response = await get_client().aio.models.generate_content(
+        model="gemini-2.5-flash",
+        contents=prompt,
+        config={
+            "response_mime_type": "application/json",
+            "response_json_schema": (await aget_catalog()).schema(TurnAnalysis),
+            "http_options": request_options("classify"),
+        },
+    )
+    logger.debug("Turn analysis response: %s", response.text)
+    return json.loads(response.text)
+
+async def aextract_variables_gemini(prompt):
     prompt = f"""
     Analyze the following text and extract user details.
     If a detail is missing or not mentioned, set the value to null (None).
     
     Text: {prompt}
     """
-    client = genai.Client(api_key=api_key())
-    response = client.models.generate_content(
+    response = await get_client().aio.models.generate_content(
     model="gemini-2.5-flash",
     contents=prompt,
     config={
         "response_mime_type": "application/json",
-        "response_json_schema": Information.model_json_schema(),
+        "response_json_schema": (await aget_catalog()).schema(Information),
+        "http_options": request_options("classify"),
     },
     )
     
     # Gemini returns a JSON string, which we parse into a Dictionary
     return json.loads(response.text)
         
-def gemini_sql_query(prompt):
+def gemini_sql_query(prompt, raise_errors=False):
     """
-    Use Gemini with LangChain SQL agent to query the database.
+    Use Gemini with LangChain SQL agent to query the database. Errors are
+    returned as the answer unless `raise_errors` is set.
     """
     try:
-        # Initialize Gemini LLM
-        # "gemini-2.5-flash" for fast responses with tool calling
-        llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            temperature=0,
-            google_api_key=api_key()
-        )
-
-        # Get Django database configuration
-        db_config = settings.DATABASES['default']
-        db_engine = db_config['ENGINE']
-        
-        # Build SQLAlchemy connection string based on database type
-        if 'sqlite' in db_engine:
-            # SQLite
-            db_url = f"sqlite:///{db_config['NAME']}"
-        elif 'postgresql' in db_engine:
-            # PostgreSQL
-            db_url = f"postgresql://{db_config['USER']}:{db_config['PASSWORD']}@{db_config['HOST']}:{db_config['PORT']}/{db_config['NAME']}"
-        elif 'mysql' in db_engine:
-            # MySQL
-            db_url = f"mysql+pymysql://{db_config['USER']}:{db_config['PASSWORD']}@{db_config['HOST']}:{db_config['PORT']}/{db_config['NAME']}"
-        else:
-            raise ValueError(f"Unsupported database engine: {db_engine}")
-
-        # Create SQLAlchemy engine and SQLDatabase
-        engine = create_engine(db_url)
-        db = SQLDatabase(engine=engine)
-
-        # Create the SQL agent
-        agent_executor = create_sql_agent(
-            llm=llm,
-            db=db,
-            agent_type="openai-tools",  # This agent type works well with Gemini's tool calling
-            verbose=True
-        )
+        # The engine, reflected schema and agent are shared across questions
+        agent_executor = get_backend().sql_agent()
 
         # Execute the query
         response = agent_executor.invoke(
@@ -248,11 +499,13 @@ def gemini_sql_query(prompt):
         )
 
         output = response.get("output", "No response")
-        print(f"SQL Query Response: {output}", flush=True)
+        logger.debug("SQL Query Response: %s", output)
         return output
 
     except Exception as e:
-        print(f"Error in gemini_sql_query: {e}", flush=True)
+        if raise_errors:
+            raise
+        logger.exception("Error in gemini_sql_query: %s", e)
         return f"Error executing SQL query: {str(e)}"
 
 def serialize_chat_history(chat_history):
@@ -280,38 +533,22 @@ def serialize_chat_history(chat_history):
         
     return serialized_data
 
-def create_interactions():
-    # This function should create a dummy interaction for testing purposes it should have a conversation with gemini_prompt
-    interaction = Interaction.objects.create(conversation=[])
-    system_instruction = "You are role-playing as a lawfirm client that is seeking legal advice. Provide information about your legal issue as prompted by a legal assistant. Please provide realistic legal issues, but one that straddles the line between two or more legal areas, and respond to the legal assistant's questions accordingly."
-    gemini_client = genai.Client(api_key=api_key())
-    i = 0
-    end_interaction = False
-    print(f"[Gemini] Starting interaction loop for interaction {interaction.id}", flush=True)
-    client_chat = gemini_client.chats.create(
-            model="gemini-2.5-flash",
-            config=types.GenerateContentConfig(system_instruction=system_instruction),
-        )
-    client_response = client_chat.send_message(message="Please provide a very unique name, email, and password to get started.",)
-    client_text = client_response.text
-    while not end_interaction and i < 10:
-        i += 1
-        assistant_response = gemini_prompt(client_text, interaction_id=interaction.id)
-        client_response = client_chat.send_message(message=assistant_response)
-        client_text = client_response.text
-        end_interaction_response = gemini_client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=client_chat.get_history(),
-            config={
-                "response_mime_type": "application/json",
-                "response_json_schema": InteractionCompleted.model_json_schema(),
-            },
-        )
-        end_interaction = json.loads(end_interaction_response.text).get("completed")
-        #print(f"[Gemini] Interaction completed status: {end_interaction}", flush=True)
-
-    return {
-        "interaction_id": interaction.id,
-        "completed": bool(end_interaction),
-        "iterations": i,
-    }
\ No newline at end of file
+async def append_messages(interaction, start, contents):
+    """
+    Store the chat history entries added by a turn as new Message rows after
+    the `start` entries already saved, and mark the interaction as updated.
+    """
+    messages = [
+        Message.from_content(interaction, start + offset, entry)
+        for offset, entry in enumerate(serialize_chat_history(contents))
+    ]
+    if not messages:
+        return 0
+    await Message.objects.abulk_create(messages)
+    await aindex_messages(interaction.id, start, messages)
+    # Summaries look for interactions updated since they were last refreshed
+    interaction.updated_at = timezone.now()
+    await Interaction.objects.filter(id=interaction.id).aupdate(updated_at=interaction.updated_at)
+    # Bulk writes send no signals, so cached attorney answers are dropped here
+    invalidate_responses()
+    return len(messages)
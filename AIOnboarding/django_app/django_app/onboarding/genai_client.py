@@ -0,0 +1,125 @@
+"""
+Process-wide registry of Gemini clients.
+
+Building a genai.Client sets up a fresh httpx connection pool, so every call
+site in gemini.py shares the lazily built clients kept here instead of making
+its own. The pool size, keep-alive and per-call timeouts come from the
+GEMINI_* settings. Clients are built by the LLM backend (see llm.py), so the
+"stub" backend swaps in a local stand-in, and wrapped so every call is
+timed in the metrics.
+
+The async connections of a client belong to the event loop they were opened
+on, so each running loop gets a client of its own: the ASGI server's loop
+keeps one for the life of the process, and a loop that only runs one piece
+of work (a job under async_to_sync) closes its client with aclose_client().
+Sync callers outside any loop share one more.
+"""
+import asyncio
+import threading
+
+import httpx
+from django.conf import settings
+from google import genai
+from google.genai import types
+
+from .api import api_key
+from .llm import get_backend
+from .metrics import InstrumentedClient
+
+# Clients by (name, event loop or None)
+_clients = {}
+_overrides = {}
+_lock = threading.Lock()
+
+
+def _connection_limits():
+    return httpx.Limits(
+        max_connections=settings.GEMINI_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.GEMINI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.GEMINI_KEEPALIVE_EXPIRY,
+    )
+
+
+def build_client():
+    """
+    A real genai.Client with a bounded keep-alive pool.
+    """
+    limits = _connection_limits()
+    http_options = types.HttpOptions(
+        timeout=timeout_ms("default"),
+        client_args={"limits": limits},
+        # google-genai sends async requests through aiohttp when it is
+        # installed and drops httpx's `limits` on the way; a transport of our
+        # own keeps the calls on httpx and the pool bounded
+        async_client_args={"transport": httpx.AsyncHTTPTransport(limits=limits)},
+    )
+    return genai.Client(api_key=api_key(), http_options=http_options)
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def get_client(name="default"):
+    """
+    Return the client registered under `name` for the running event loop,
+    building it on first use.
+    """
+    key = (name, _running_loop())
+    client = _overrides.get(name) or _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        # Clients of finished loops can't be used again
+        for stale in [stale for stale in _clients if stale[1] is not None and stale[1].is_closed()]:
+            del _clients[stale]
+        client = _clients.get(key)
+        if client is None:
+            client = InstrumentedClient(get_backend().build_client())
+            _clients[key] = client
+    return client
+
+
+async def aclose_client(name="default"):
+    """
+    Close and forget the running loop's client, for a loop that ends with
+    the work it was started for.
+    """
+    with _lock:
+        client = _clients.pop((name, asyncio.get_running_loop()), None)
+    aclose = getattr(client.aio, "aclose", None) if client is not None else None
+    if aclose is not None:
+        await aclose()
+
+
+def set_client(client, name="default"):
+    """
+    Register `client` under `name` in place of the backend's, on every loop.
+    """
+    with _lock:
+        _overrides[name] = client
+
+
+def reset_clients():
+    """
+    Drop every registered client so the next get_client() builds a new one.
+    """
+    with _lock:
+        _clients.clear()
+        _overrides.clear()
+
+
+def timeout_ms(kind="default"):
+    timeouts = settings.GEMINI_TIMEOUTS
+    seconds = timeouts.get(kind, timeouts["default"])
+    return int(seconds * 1000)
+
+
+def request_options(kind="default"):
+    """
+    Per-call HttpOptions carrying the timeout configured for `kind`.
+    """
+    return types.HttpOptions(timeout=timeout_ms(kind))
@@ -0,0 +1,129 @@
+"""
+Idempotent message requests.
+
+The Chainlit agent retries a message whose request failed in transit, with
+the same Idempotency-Key header as the first attempt. The first request with
+a key claims a MessageRequest row and stores its reply there; a retry gets
+that reply back instead of running the turn, and its LLM calls, again. A
+retry that arrives while the first request is still running waits for it,
+up to IDEMPOTENCY_WAIT seconds, and gets a 409 after that.
+
+A request that failed, or whose row was not finished within
+IDEMPOTENCY_LEASE seconds (its process died or the client went away), can
+be claimed again. Keys are forgotten after IDEMPOTENCY_TTL seconds;
+`manage.py prune_message_requests` deletes the expired rows.
+"""
+import asyncio
+import functools
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils import timezone
+
+from .models import MessageRequest
+
+HEADER = "Idempotency-Key"
+POLL_INTERVAL = 0.25
+
+
+class RequestInProgress(Exception):
+    pass
+
+
+def request_key(request, scope):
+    """
+    The MessageRequest key of `request`, or None if it has no Idempotency-Key.
+    """
+    key = request.headers.get(HEADER, "").strip()
+    if not key:
+        return None
+    return f"{scope}:{key}"[:255]
+
+
+async def aclaim(key):
+    """
+    Claim `key` for the current request. Returns None if the request should
+    be processed, or the stored reply of an earlier request with the key.
+    Raises RequestInProgress if that request is still running.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.IDEMPOTENCY_WAIT
+    while True:
+        try:
+            await MessageRequest.objects.acreate(key=key)
+            return None
+        except IntegrityError:
+            pass
+        now = timezone.now()
+        reclaimable = (
+            Q(status=MessageRequest.FAILED)
+            | Q(status=MessageRequest.PROCESSING, updated_at__lt=now - timedelta(seconds=settings.IDEMPOTENCY_LEASE))
+            | Q(created_at__lt=now - timedelta(seconds=settings.IDEMPOTENCY_TTL))
+        )
+        taken = await MessageRequest.objects.filter(reclaimable, key=key).aupdate(
+            status=MessageRequest.PROCESSING, response=None, created_at=now, updated_at=now,
+        )
+        if taken:
+            return None
+        existing = await MessageRequest.objects.filter(key=key).values_list("status", "response").afirst()
+        if existing is None:
+            # Pruned in the meantime
+            continue
+        status, response = existing
+        if status == MessageRequest.SUCCEEDED:
+            return response
+        if loop.time() >= deadline:
+            raise RequestInProgress(key)
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+async def acomplete(key, response):
+    await MessageRequest.objects.filter(key=key).aupdate(
+        status=MessageRequest.SUCCEEDED, response=response, updated_at=timezone.now(),
+    )
+
+
+async def afail(key):
+    await MessageRequest.objects.filter(key=key).aupdate(status=MessageRequest.FAILED, updated_at=timezone.now())
+
+
+def in_progress_response():
+    return JsonResponse({
+        'status': 'error',
+        'message': 'This message is still being processed'
+    }, status=409)
+
+
+def idempotent(scope):
+    """
+    Make an async JSON view replay its successful reply to requests with an
+    Idempotency-Key it has already answered.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            key = request_key(request, scope)
+            if key is None:
+                return await view(request, *args, **kwargs)
+            try:
+                replay = await aclaim(key)
+            except RequestInProgress:
+                return in_progress_response()
+            if replay is not None:
+                return JsonResponse(replay)
+            try:
+                response = await view(request, *args, **kwargs)
+            except BaseException:
+                await afail(key)
+                raise
+            if response.status_code == 200:
+                await acomplete(key, json.loads(response.content))
+            else:
+                await afail(key)
+            return response
+        return wrapper
+    return decorator
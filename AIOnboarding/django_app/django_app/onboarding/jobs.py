@@ -0,0 +1,277 @@
+"""
+Database-backed background jobs.
+
+Work that doesn't have to happen inside a request is queued as a Job row and
+run by the `run_worker` management command, which can be scaled separately
+from the web server. There is no broker: workers claim jobs with
+SELECT ... FOR UPDATE SKIP LOCKED, highest priority first.
+
+A job names a function decorated with @task; plain and async functions both
+work, and each async one runs on an event loop of its own, so concurrent
+jobs never share a loop's Gemini client. Its keyword arguments and return value are stored as JSON. Failed jobs
+are retried with exponential backoff until max_attempts. A job whose
+idempotency key is already queued, running or done is not queued again.
+Jobs go to a named queue, and each worker only claims jobs from the queues
+it serves (JOB_QUEUES by default).
+With JOBS_RUN_IN_PROCESS, jobs are still recorded but run right away on the
+web process's thread pool, so no separate worker is needed.
+"""
+import inspect
+import json
+import logging
+import os
+import random
+import signal
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .genai_client import aclose_client
+from .models import Job
+from .orchestration import get_executor
+
+
+logger = logging.getLogger(__name__)
+
+
+class JobFailed(Exception):
+    pass
+
+
+def task(fn=None, *, priority=0, max_attempts=3):
+    """
+    Mark `fn` as runnable as a job, with default priority and attempts.
+    """
+    def decorate(fn):
+        fn.job_priority = priority
+        fn.job_max_attempts = max_attempts
+        return fn
+    return decorate(fn) if fn is not None else decorate
+
+
+def task_name(fn):
+    return f"{fn.__module__}.{fn.__qualname__}"
+
+
+def resolve(name):
+    fn = import_string(name)
+    if not hasattr(fn, "job_priority"):
+        raise JobFailed(f"{name} is not a job task")
+    return fn
+
+
+def _new_job(fn, queue, priority, delay, max_attempts, kwargs):
+    return {
+        "task": task_name(fn),
+        "queue": queue,
+        "kwargs": json.loads(json.dumps(kwargs, cls=DjangoJSONEncoder)),
+        "priority": fn.job_priority if priority is None else priority,
+        "max_attempts": fn.job_max_attempts if max_attempts is None else max_attempts,
+        "run_at": timezone.now() + timedelta(seconds=delay),
+    }
+
+
+def enqueue(fn, *, queue="default", priority=None, idempotency_key=None, delay=0, max_attempts=None, **kwargs):
+    """
+    Queue `fn(**kwargs)` on `queue` and return its Job.
+    """
+    fields = _new_job(fn, queue, priority, delay, max_attempts, kwargs)
+    if idempotency_key:
+        job, created = Job.objects.get_or_create(idempotency_key=idempotency_key, defaults=fields)
+        if not created and job.status == Job.FAILED:
+            # A failed job may be tried again under the same key
+            Job.objects.filter(id=job.id, status=Job.FAILED).update(
+                status=Job.QUEUED, queue=queue, attempts=0, run_at=fields["run_at"], last_error="", finished_at=None,
+            )
+            job.refresh_from_db()
+        elif not created and job.status == Job.QUEUED and job.queue != queue:
+            Job.objects.filter(id=job.id, status=Job.QUEUED).update(queue=queue)
+            job.refresh_from_db()
+    else:
+        job = Job.objects.create(**fields)
+    if settings.JOBS_RUN_IN_PROCESS and job.status == Job.QUEUED:
+        transaction.on_commit(lambda: get_executor().submit(_run_in_process, job.id))
+    return job
+
+
+async def aenqueue(fn, **options):
+    return await sync_to_async(enqueue)(fn, **options)
+
+
+def _requeue_stale(now):
+    """
+    Jobs whose worker died mid-run go back to the queue once their lease ends.
+    """
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=now - timedelta(seconds=settings.JOB_LEASE))
+    stale.filter(attempts__lt=F("max_attempts")).update(status=Job.QUEUED, run_at=now, locked_by="", locked_at=None)
+    stale.update(status=Job.FAILED, finished_at=now, last_error="Worker lost while running the job")
+
+
+def claim(worker, limit, job_id=None, queues=None):
+    """
+    Mark up to `limit` due jobs as running for `worker` and return them,
+    taking only jobs from `queues` if given.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        due = Job.objects.select_for_update(skip_locked=True).filter(status=Job.QUEUED, run_at__lte=now)
+        if queues is not None:
+            due = due.filter(queue__in=queues)
+        if job_id is not None:
+            due = due.filter(id=job_id)
+        ids = list(due.order_by("-priority", "run_at", "id").values_list("id", flat=True)[:limit])
+        # The status condition keeps two workers from claiming the same job
+        # on databases without row locks (SQLite)
+        Job.objects.filter(id__in=ids, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=worker, locked_at=now, attempts=F("attempts") + 1, updated_at=now,
+        )
+    return list(Job.objects.filter(id__in=ids, status=Job.RUNNING, locked_by=worker, locked_at=now))
+
+
+def backoff(attempts):
+    delay = settings.JOB_RETRY_BACKOFF * 2 ** max(attempts - 1, 0)
+    return min(delay, settings.JOB_RETRY_BACKOFF_MAX) * random.uniform(0.5, 1.5)
+
+
+def _leased(job):
+    """
+    `job` while still held by the claim it was run under. Once its lease
+    ended it may have been requeued and claimed again, and the outcome of
+    this run is not recorded.
+    """
+    return Job.objects.filter(id=job.id, status=Job.RUNNING, locked_by=job.locked_by, locked_at=job.locked_at)
+
+
+async def _run_async(fn, kwargs):
+    try:
+        return await fn(**kwargs)
+    finally:
+        # The loop ends with the job, and its Gemini client with it
+        await aclose_client()
+
+
+def run(job):
+    """
+    Run a claimed job and record the outcome. Returns the job's new status,
+    or None if its lease was lost meanwhile.
+    """
+    try:
+        fn = resolve(job.task)
+        if inspect.iscoroutinefunction(fn):
+            # Each async job gets an event loop of its own, even on a thread
+            # that has one already
+            result = async_to_sync(_run_async, force_new_loop=True)(fn, job.kwargs)
+        else:
+            result = fn(**job.kwargs)
+        result = json.loads(json.dumps(result, cls=DjangoJSONEncoder))
+    except Exception as e:
+        now = timezone.now()
+        error = traceback.format_exc()
+        logger.warning("%s #%s failed (attempt %s/%s): %s", job.task, job.id, job.attempts, job.max_attempts, e)
+        if job.attempts < job.max_attempts and not isinstance(e, JobFailed):
+            status = Job.QUEUED
+            updated = _leased(job).update(
+                status=status, run_at=now + timedelta(seconds=backoff(job.attempts)),
+                locked_by="", locked_at=None, last_error=error, updated_at=now,
+            )
+        else:
+            status = Job.FAILED
+            updated = _leased(job).update(status=status, finished_at=now, last_error=error, updated_at=now)
+    else:
+        now = timezone.now()
+        status = Job.SUCCEEDED
+        updated = _leased(job).update(status=status, result=result, finished_at=now, updated_at=now)
+    if not updated:
+        logger.warning("%s #%s outlived its lease; its outcome was not recorded", job.task, job.id)
+        return None
+    return status
+
+
+def _run_in_process(job_id):
+    worker = f"{socket.gethostname()}:{os.getpid()}:in-process"
+    try:
+        while True:
+            jobs = claim(worker, 1, job_id=job_id)
+            if not jobs or run(jobs[0]) != Job.QUEUED:
+                return
+            # Wait out the retry backoff on this thread
+            time.sleep(max((Job.objects.get(id=job_id).run_at - timezone.now()).total_seconds(), 0))
+    except Exception as e:
+        logger.exception("In-process job %s failed: %s", job_id, e)
+    finally:
+        connection.close()
+
+
+class Worker:
+    """
+    Claims due jobs from `queues` and runs them on a pool of `threads`
+    threads until stopped. With `burst`, returns once none of its queues has
+    a job queued or running.
+    """
+
+    def __init__(self, threads, poll_interval, burst=False, name=None, queues=None):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.burst = burst
+        self.queues = list(queues or settings.JOB_QUEUES)
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = threading.Event()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self.completed = 0
+
+    def stop(self, *args):
+        self.stopping.set()
+
+    def pending(self):
+        return Job.objects.filter(queue__in=self.queues, status__in=(Job.QUEUED, Job.RUNNING))
+
+    def _run_one(self, job):
+        try:
+            run(job)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self.completed += 1
+            connection.close()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="job")
+        last_stale_check = 0.0
+        logger.info("Worker %s started with %s threads on %s", self.name, self.threads, ', '.join(self.queues))
+        try:
+            while not self.stopping.is_set():
+                close_old_connections()
+                if time.monotonic() - last_stale_check > settings.JOB_LEASE / 2:
+                    _requeue_stale(timezone.now())
+                    last_stale_check = time.monotonic()
+                with self._lock:
+                    free = self.threads - self._in_flight
+                jobs = claim(self.name, free, queues=self.queues) if free else []
+                for job in jobs:
+                    with self._lock:
+                        self._in_flight += 1
+                    pool.submit(self._run_one, job)
+                if jobs:
+                    continue
+                if self.burst and not self._in_flight and not self.pending().exists():
+                    break
+                self.stopping.wait(self.poll_interval)
+        finally:
+            # Let running jobs finish; claimed ones are never abandoned
+            pool.shutdown(wait=True)
+            connection.close()
+        logger.info("Worker %s stopped after %s jobs", self.name, self.completed)
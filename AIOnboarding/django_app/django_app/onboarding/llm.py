@@ -0,0 +1,116 @@
+"""
+Pluggable LLM backends.
+
+A backend provides the two things the app asks a model for: a
+genai.Client-compatible client (chats, plain and structured
+generate_content, embeddings, context caches), shared through
+genai_client.get_client(), and the SQL agent behind attorney questions.
+LLM_BACKEND picks one:
+
+- "gemini": the Gemini API and the LangChain SQL agent (default).
+- "stub": llm_stub's local stand-ins, answering deterministically after
+  LLM_STUB_LATENCY seconds per call, so benchmarks and load tests run
+  without network access. LLM_STUB_SCRIPT optionally points at a JSON list
+  of {"match": regex, "reply": text} rules for chat replies.
+
+A dotted path to a backend class works too.
+"""
+import json
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .llm_stub import StubGenaiClient, StubSqlAgent
+
+_lock = threading.Lock()
+_backend = None
+
+
+class GeminiBackend:
+    name = "gemini"
+
+    def build_client(self):
+        from .genai_client import build_client
+
+        return build_client()
+
+    def sql_agent(self):
+        from .sql_agent import get_agent
+
+        return get_agent()
+
+    def warm_up(self):
+        from .sql_agent import warm_up_in_background
+
+        warm_up_in_background()
+
+
+class StubBackend:
+    name = "stub"
+
+    def __init__(self, latency=None, token_latency=None, script=None, departments=()):
+        self.latency = settings.LLM_STUB_LATENCY if latency is None else latency
+        self.token_latency = settings.LLM_STUB_TOKEN_LATENCY if token_latency is None else token_latency
+        if script is None:
+            script = load_script(settings.LLM_STUB_SCRIPT) if settings.LLM_STUB_SCRIPT else ()
+        # One client per backend, so its call and token counters cover every caller
+        self.client = StubGenaiClient(
+            latency=self.latency,
+            token_latency=self.token_latency,
+            departments=departments,
+            script=script,
+        )
+        self.agent = StubSqlAgent(latency=self.latency)
+
+    def build_client(self):
+        return self.client
+
+    def sql_agent(self):
+        return self.agent
+
+    def warm_up(self):
+        pass
+
+
+BACKENDS = {
+    GeminiBackend.name: GeminiBackend,
+    StubBackend.name: StubBackend,
+}
+
+
+def load_script(path):
+    """
+    (pattern, reply) pairs from a JSON list of {"match", "reply"} objects.
+    """
+    with open(path, encoding="utf-8") as f:
+        return [(rule["match"], rule["reply"]) for rule in json.load(f)]
+
+
+def get_backend():
+    """
+    The process's backend, built from LLM_BACKEND on first use.
+    """
+    global _backend
+    backend = _backend
+    if backend is not None:
+        return backend
+    with _lock:
+        if _backend is None:
+            name = settings.LLM_BACKEND
+            backend_class = BACKENDS.get(name) or import_string(name)
+            _backend = backend_class()
+        return _backend
+
+
+def set_backend(backend):
+    """
+    Use `backend` from now on (None: rebuild from settings on next use).
+    Clients built by the previous backend are dropped.
+    """
+    global _backend
+    from .genai_client import reset_clients
+
+    with _lock:
+        _backend = backend
+    reset_clients()
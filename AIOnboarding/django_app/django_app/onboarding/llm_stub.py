@@ -0,0 +1,323 @@
+"""
+Local stand-in for the Gemini API, used by the "stub" LLM backend.
+
+StubGenaiClient mimics the surface of google.genai.Client the app uses
+(models.generate_content / embed_content and chats.create / send_message /
+get_history, plus their `aio` counterparts and aio.caches) and sleeps for a
+fixed latency per call (plus an optional per-input-token cost for chat turns)
+instead of going over the network. Structured-output requests are answered
+from the JSON schema in the config using simple pattern matching, so the
+Information, ChangeDepartment, TurnAnalysis and InteractionCompleted schemas
+come back well-formed and the onboarding flow behaves deterministically.
+Free-text replies come from an optional script of (regex, reply) rules.
+StubSqlAgent stands in for the LangChain SQL agent the same way.
+"""
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+
+from google.genai import types
+
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+")
+PASSWORD_RE = re.compile(r"password(?:\s+is|:)?\s+(\S+)", re.IGNORECASE)
+NAME_RE = re.compile(r"my name is\s+([A-Z][a-z]+(?: [A-Z][a-z]+)*)")
+GOODBYE_RE = re.compile(r"\b(goodbye|bye)\b", re.IGNORECASE)
+
+
+class StubResponse:
+    def __init__(self, text, input_tokens=None):
+        self.text = text
+        # Usage is reported like Gemini's, on whole replies and the last stream chunk
+        self.usage_metadata = None
+        if input_tokens is not None:
+            self.usage_metadata = types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=input_tokens,
+                candidates_token_count=_estimate_tokens(text),
+            )
+
+
+def _estimate_tokens(text):
+    # Same four-characters-per-token estimate as onboarding.context
+    return len(text) // 4
+
+
+def _config_value(config, key):
+    if config is None:
+        return None
+    if isinstance(config, dict):
+        return config.get(key)
+    return getattr(config, key, None)
+
+
+def _contents_text(contents):
+    if isinstance(contents, str):
+        return contents
+    texts = []
+    for content in contents or []:
+        parts = content.get("parts", []) if isinstance(content, dict) else (content.parts or [])
+        for part in parts:
+            text = part.get("text") if isinstance(part, dict) else part.text
+            if text:
+                texts.append(text)
+    return "\n".join(texts)
+
+
+def _user_text(contents):
+    # Classification prompts wrap the user's message after a "Text:" marker
+    text = _contents_text(contents)
+    return text.rsplit("Text:", 1)[-1]
+
+
+def _enum(prop):
+    """
+    Allowed values of a schema property, e.g. the department names.
+    """
+    for option in [prop, *prop.get("anyOf", [])]:
+        if "enum" in option:
+            return option["enum"]
+    return None
+
+
+def _as_content(entry):
+    if isinstance(entry, dict):
+        return types.Content.model_validate(entry)
+    return entry
+
+
+class StubEmbedding:
+    def __init__(self, values):
+        self.values = values
+
+
+class StubEmbedResponse:
+    def __init__(self, vectors):
+        self.embeddings = [StubEmbedding(values) for values in vectors]
+
+
+class StubModels:
+    def __init__(self, client):
+        self._client = client
+
+    def generate_content(self, model, contents, config=None):
+        self._client.wait()
+        return self._client.answer(contents, config)
+
+    def embed_content(self, model, contents, config=None):
+        self._client.wait()
+        return StubEmbedResponse(self._client.embed_all(contents))
+
+
+class StubAsyncModels(StubModels):
+    async def generate_content(self, model, contents, config=None):
+        await self._client.async_wait()
+        return self._client.answer(contents, config)
+
+    async def embed_content(self, model, contents, config=None):
+        await self._client.async_wait()
+        return StubEmbedResponse(self._client.embed_all(contents))
+
+
+class StubChat:
+    def __init__(self, client, history, config=None):
+        self._client = client
+        self._history = [_as_content(entry) for entry in history or []]
+        # Instructions held in a cached content aren't input of the turn
+        self._instructions = "" if _config_value(config, "cached_content") else (_config_value(config, "system_instruction") or "")
+
+    def _input_tokens(self, message):
+        return _estimate_tokens(self._instructions + _contents_text(self._history) + message)
+
+    def _record(self, message, input_tokens):
+        text = self._client.reply(message)
+        self._history.append(types.Content(role="user", parts=[types.Part(text=message)]))
+        self._history.append(types.Content(role="model", parts=[types.Part(text=text)]))
+        return StubResponse(text, input_tokens)
+
+    def send_message(self, message, config=None):
+        input_tokens = self._input_tokens(message)
+        self._client.wait(input_tokens)
+        return self._record(message, input_tokens)
+
+    def get_history(self, curated=False):
+        return list(self._history)
+
+
+class StubAsyncChat(StubChat):
+    async def send_message(self, message, config=None):
+        input_tokens = self._input_tokens(message)
+        await self._client.async_wait(input_tokens)
+        return self._record(message, input_tokens)
+
+    async def send_message_stream(self, message, config=None):
+        input_tokens = self._input_tokens(message)
+        await self._client.async_wait(input_tokens)
+        response = self._record(message, input_tokens)
+
+        async def chunks():
+            words = response.text.split(" ")
+            for word in words[:-1]:
+                yield StubResponse(word + " ")
+            last = StubResponse(words[-1] + " ")
+            last.usage_metadata = response.usage_metadata
+            yield last
+
+        return chunks()
+
+
+class StubChats:
+    chat_class = StubChat
+
+    def __init__(self, client):
+        self._client = client
+
+    def create(self, model, config=None, history=None):
+        return self.chat_class(self._client, history, config)
+
+
+class StubCachedContent:
+    def __init__(self, name):
+        self.name = name
+
+
+class StubAsyncCaches:
+    def __init__(self, client):
+        self._client = client
+        self.created = 0
+        self.deleted = 0
+
+    async def create(self, model, config=None):
+        await self._client.async_wait()
+        self.created += 1
+        return StubCachedContent(f"cachedContents/stub-{self.created}")
+
+    async def update(self, name, config=None):
+        await self._client.async_wait()
+        return StubCachedContent(name)
+
+    async def delete(self, name, config=None):
+        await self._client.async_wait()
+        self.deleted += 1
+
+
+class StubAsyncChats(StubChats):
+    chat_class = StubAsyncChat
+
+
+class StubAsyncClient:
+    def __init__(self, client):
+        self.models = StubAsyncModels(client)
+        self.chats = StubAsyncChats(client)
+        self.caches = StubAsyncCaches(client)
+
+
+class StubGenaiClient:
+    """
+    Stand-in genai.Client sleeping `latency` seconds per call, plus
+    `token_latency` seconds per 1000 estimated input tokens of a chat turn.
+    Structured answers pick departments from the names the schema allows,
+    or from `departments` if given. `script` is a list of (pattern, reply)
+    pairs; a chat message matching a pattern gets that reply.
+    """
+
+    def __init__(self, latency=0.0, departments=(), token_latency=0.0, script=()):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.departments = list(departments)
+        self.script = [(re.compile(pattern, re.IGNORECASE), reply) for pattern, reply in script]
+        self.calls = 0
+        self.input_tokens = 0
+        self._lock = threading.Lock()
+        self.models = StubModels(self)
+        self.chats = StubChats(self)
+        self.aio = StubAsyncClient(self)
+
+    def _count(self, tokens):
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += tokens
+        return self.latency + self.token_latency * tokens / 1000
+
+    def wait(self, tokens=0):
+        delay = self._count(tokens)
+        if delay:
+            time.sleep(delay)
+
+    async def async_wait(self, tokens=0):
+        delay = self._count(tokens)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def answer(self, contents, config):
+        schema = _config_value(config, "response_json_schema")
+        text = _contents_text(contents)
+        if schema is None:
+            return StubResponse(self.reply(text), _estimate_tokens(text))
+        return StubResponse(json.dumps(self.structured(schema, _user_text(contents))), _estimate_tokens(text))
+
+    def reply(self, text):
+        for pattern, reply in self.script:
+            if pattern.search(text):
+                return reply
+        return f"Thank you. I have noted the {len(text)} characters you sent; could you tell me more?"
+
+    def embed(self, text, dimensions=64):
+        """
+        Hashed bag-of-words vector: texts sharing words come out similar.
+        """
+        values = [0.0] * dimensions
+        for word in re.findall(r"\w+", text.lower()):
+            values[int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % dimensions] += 1.0
+        return values
+
+    def embed_all(self, contents):
+        # A list of texts gets one embedding per text, like the Gemini API
+        if isinstance(contents, list) and all(isinstance(text, str) for text in contents):
+            return [self.embed(text) for text in contents]
+        return [self.embed(_contents_text(contents))]
+
+    def find_department(self, text, names=None):
+        lowered = text.lower()
+        for name in names or self.departments:
+            if name.lower() in lowered:
+                return name
+        return None
+
+    def structured(self, schema, text):
+        properties = schema.get("properties", {})
+        result = {key: None for key in properties}
+        if "name" in properties:
+            match = NAME_RE.search(text)
+            result["name"] = match.group(1) if match else None
+        if "email" in properties:
+            match = EMAIL_RE.search(text)
+            result["email"] = match.group(0).rstrip(".") if match else None
+        if "password" in properties:
+            match = PASSWORD_RE.search(text)
+            result["password"] = match.group(1).rstrip(".,") if match else None
+        if "department" in properties:
+            result["department"] = self.find_department(text, _enum(properties["department"]))
+        if "change_department" in properties:
+            result["change_department"] = self.find_department(text, _enum(properties["change_department"]))
+        if "completed" in properties:
+            result["completed"] = bool(GOODBYE_RE.search(text))
+        return result
+
+
+class StubSqlAgent:
+    """
+    Stand-in for the LangChain SQL agent: sleeps `latency` seconds and
+    answers with a fixed sentence.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def invoke(self, inputs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return {"output": f"[stub] SQL agent answer for: {inputs.get('input', '')}"}
@@ -0,0 +1,19 @@
+"""
+Sampling for the onboarding loggers.
+
+Per-message debug and info lines add up quickly under load, so only a
+fraction ONBOARDING_LOG_SAMPLE_RATE of records below WARNING is emitted.
+Warnings and errors always are.
+"""
+import logging
+import random
+
+
+class SampleFilter(logging.Filter):
+    def __init__(self, rate=1.0, level="WARNING"):
+        super().__init__()
+        self.rate = float(rate)
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+
+    def filter(self, record):
+        return record.levelno >= self.level or self.rate >= 1 or random.random() < self.rate
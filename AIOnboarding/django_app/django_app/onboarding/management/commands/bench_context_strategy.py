@@ -0,0 +1,38 @@
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django_app.onboarding.benchmarks import context_strategy
+from django_app.onboarding.benchmarks.harness import isolated_database, stub_backend
+from django_app.onboarding.models import Department
+
+
+class Command(BaseCommand):
+    help = 'Compare client-turn latency and input size of a long intake across context strategies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--latency', type=float, default=0.2, help='Seconds per stub Gemini call')
+        parser.add_argument('--token-latency', type=float, default=0.05, help='Extra seconds per 1000 chat input tokens')
+        parser.add_argument('--history-turns', type=int, default=60, help='Turns already in the intake')
+        parser.add_argument('--turns', type=int, default=10, help='Measured turns per strategy')
+        parser.add_argument('--window', type=int, default=10, help='GEMINI_CONTEXT_WINDOW for the run')
+        parser.add_argument('--budget', type=int, default=4000, help='GEMINI_CONTEXT_TOKEN_BUDGET for the run')
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            call_command('seed_departments', stdout=StringIO())
+            with stub_backend(latency=options['latency'], token_latency=options['token_latency']):
+                results = context_strategy.run(
+                    Department.objects.order_by('id').first(),
+                    options['history_turns'],
+                    options['turns'],
+                    options['window'],
+                    options['budget'],
+                )
+
+        self.stdout.write(json.dumps(results, indent=2))
+        for strategy, result in results.items():
+            self.stdout.write(self.style.SUCCESS(
+                f"{strategy}: mean {result['mean_ms']}ms, {result['mean_chat_input_tokens']} chat input tokens per turn"
+            ))
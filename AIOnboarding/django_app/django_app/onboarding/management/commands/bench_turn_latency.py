@@ -0,0 +1,26 @@
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django_app.onboarding.benchmarks import turn_latency
+from django_app.onboarding.benchmarks.harness import isolated_database, stub_backend
+
+
+class Command(BaseCommand):
+    help = 'Compare gemini_prompt turn latency across orchestration modes against the stub LLM backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--latency', type=float, default=0.2, help='Seconds per stub Gemini call')
+        parser.add_argument('--turns', type=int, default=10, help='Turns per scenario')
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            call_command('seed_departments', stdout=StringIO())
+            with stub_backend(latency=options['latency']):
+                results = turn_latency.run(options['turns'])
+
+        self.stdout.write(json.dumps(results, indent=2))
+        for scenario in ('first_message', 'steady_turn', 'department_change'):
+            means = ' -> '.join(f"{mode} {results[mode][scenario]['mean_ms']}ms" for mode in results)
+            self.stdout.write(self.style.SUCCESS(f"{scenario}: {means}"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from django_app.onboarding.benchmarks import compare
+
+from .run_benchmarks import report_comparison
+
+
+class Command(BaseCommand):
+    help = 'Compare two run_benchmarks result files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('baseline', help='Earlier results file')
+        parser.add_argument('current', help='Later results file')
+        parser.add_argument('--threshold', type=float, default=10.0, help='Percent increase reported as a regression')
+        parser.add_argument('--fail-on-regression', action='store_true', help='Exit with an error if anything regressed')
+
+    def handle(self, *args, **options):
+        regressions = report_comparison(self, compare.load(options['baseline']), compare.load(options['current']), options['threshold'])
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"{regressions} metrics regressed by more than {options['threshold']}%")
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError
+from django_app.onboarding.documents import extract_document_text, hash_file, queue_extraction
+from django_app.onboarding.models import Document
+
+
+class Command(BaseCommand):
+    help = 'Hash documents stored before uploads were hashed and queue text extraction for documents without text'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--failed', action='store_true', help='Also retry documents whose extraction failed')
+        parser.add_argument('--now', action='store_true', help='Extract in this process instead of queueing jobs')
+
+    def handle(self, *args, **options):
+        hashed = 0
+        for document in Document.objects.filter(content_hash='').exclude(file='').iterator():
+            if not document.file.storage.exists(document.file.name):
+                self.stderr.write(f"Document {document.id}: {document.file.name} is missing")
+                continue
+            document.content_hash = hash_file(document)
+            document.size = document.file.size
+            try:
+                document.save(update_fields=['content_hash', 'size'])
+                hashed += 1
+            except IntegrityError:
+                self.stderr.write(f"Document {document.id} duplicates another document of interaction {document.interaction_id}")
+
+        statuses = [Document.PENDING] + ([Document.FAILED] if options['failed'] else [])
+        pending = Document.objects.filter(status__in=statuses).exclude(file='').exclude(content_hash='')
+        queued = 0
+        for document in pending.iterator():
+            if options['now']:
+                result = extract_document_text(document_id=document.id)
+                self.stdout.write(f"Document {document.id}: {result}")
+            else:
+                queue_extraction(document, again=document.status == Document.FAILED)
+            queued += 1
+        action = 'Extracted' if options['now'] else 'Queued extraction of'
+        self.stdout.write(self.style.SUCCESS(f"Hashed {hashed} documents. {action} {queued} documents."))
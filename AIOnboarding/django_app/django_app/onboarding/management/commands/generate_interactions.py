@@ -0,0 +1,100 @@
+import re
+import threading
+import time
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from django_app.onboarding import synthetic
+from django_app.onboarding.benchmarks.harness import stub_backend
+from django_app.onboarding.jobs import Worker
+from django_app.onboarding.models import Job
+
+RUN_NAME_RE = re.compile(r"^[\w-]+$")
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic client interactions concurrently on the job queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10, help='Interactions in the run')
+        parser.add_argument('--run', help='Run name; give an earlier run to resume it (default: a timestamp)')
+        parser.add_argument('--concurrency', type=int, default=8, help='Conversations generated at once')
+        parser.add_argument('--rate', type=float, default=0, help='Max conversation turns started per second (0: unlimited)')
+        parser.add_argument('--max-turns', type=int, default=10, help='Turns before a conversation is cut off')
+        parser.add_argument('--fake', action='store_true', help='Scripted clients against the stub LLM backend, for offline runs')
+        parser.add_argument('--latency', type=float, default=0.5, help='Seconds per stub LLM call with --fake')
+        parser.add_argument('--enqueue-only', action='store_true', help='Queue the run for the run_worker processes instead of running it here')
+        parser.add_argument('--progress-interval', type=float, default=5, help='Seconds between progress lines')
+
+    def handle(self, *args, **options):
+        run = options['run'] or timezone.now().strftime('%Y%m%d-%H%M%S')
+        if not RUN_NAME_RE.match(run):
+            raise CommandError('Run names may only contain letters, digits, "_" and "-"')
+        if options['fake'] and options['enqueue_only']:
+            raise CommandError('--fake runs in this process; it cannot be combined with --enqueue-only')
+
+        # Runs generated here get a queue of their own so the run_worker
+        # processes never pick their jobs up
+        queue = 'synthetic' if options['enqueue_only'] else f'synthetic-{run}'
+        if not options['enqueue_only']:
+            # Only this command serves the run's queue, so anything still
+            # marked running was left behind by an interrupted earlier attempt
+            synthetic.run_jobs(run).filter(queue=queue, status=Job.RUNNING).update(
+                status=Job.QUEUED, locked_by='', locked_at=None,
+            )
+        pending = synthetic.enqueue_run(
+            run,
+            options['count'],
+            max_turns=options['max_turns'],
+            scripted=options['fake'],
+            rate=options['rate'],
+            queue=queue,
+        )
+        self.stdout.write(f"Run {run}: {pending} of {options['count']} interactions to generate")
+        if options['enqueue_only'] or not pending:
+            return
+
+        with ExitStack() as stack:
+            if options['fake']:
+                stack.enter_context(stub_backend(latency=options['latency']))
+            self._run(run, queue, options['concurrency'], options['progress_interval'])
+
+        progress = synthetic.run_progress(run)
+        style = self.style.SUCCESS if not progress[Job.FAILED] else self.style.WARNING
+        self.stdout.write(style(
+            f"Run {run}: {progress[Job.SUCCEEDED]} succeeded, {progress[Job.FAILED]} failed"
+            + (f" (rerun with --run {run} to retry them)" if progress[Job.FAILED] else "")
+        ))
+
+    def _run(self, run, queue, concurrency, interval):
+        worker = Worker(concurrency, poll_interval=0.2, burst=True, queues=[queue])
+        stopped = threading.Event()
+        # Conversations finished by earlier attempts of the run don't count towards the rate
+        progress = synthetic.run_progress(run)
+        initial = progress[Job.SUCCEEDED] + progress[Job.FAILED]
+        reporter = threading.Thread(target=self._report, args=(run, initial, interval, stopped), daemon=True)
+        reporter.start()
+        try:
+            worker.run()
+        finally:
+            stopped.set()
+            reporter.join()
+
+    def _report(self, run, initial, interval, stopped):
+        start = time.monotonic()
+        try:
+            while not stopped.wait(interval):
+                progress = synthetic.run_progress(run)
+                done = progress[Job.SUCCEEDED] + progress[Job.FAILED]
+                elapsed = time.monotonic() - start
+                rate = (done - initial) / elapsed if elapsed else 0
+                remaining = progress['total'] - done
+                eta = f", ~{remaining / rate:.0f}s left" if rate else ""
+                self.stdout.write(
+                    f"[Synthetic] {done}/{progress['total']} done ({progress[Job.FAILED]} failed, "
+                    f"{progress[Job.RUNNING]} running), {rate:.2f}/s{eta}"
+                )
+        finally:
+            connection.close()
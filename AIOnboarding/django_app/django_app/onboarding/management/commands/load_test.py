@@ -0,0 +1,42 @@
+import json
+from io import StringIO
+
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django_app.onboarding.benchmarks import load_test
+from django_app.onboarding.benchmarks.harness import isolated_database, stub_backend
+from django_app.onboarding.models import Department
+
+
+class Command(BaseCommand):
+    help = 'Drive the message endpoints with concurrent virtual users against a stub LLM'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='Concurrent sessions per endpoint')
+        parser.add_argument('--turns', type=int, default=3, help='Messages per session')
+        parser.add_argument('--concurrency', type=int, default=100, help='Max requests in flight per endpoint')
+        parser.add_argument('--latency', type=float, default=0.5, help='Seconds per stub LLM call')
+
+    def handle(self, *args, **options):
+        with isolated_database(), override_settings(ALLOWED_HOSTS=['testserver']):
+            call_command('seed_departments', stdout=StringIO())
+            names = list(Department.objects.values_list('name', flat=True))
+            with stub_backend(latency=options['latency']):
+                # async_to_sync keeps the async ORM on this thread, which owns
+                # the test database connection
+                results = async_to_sync(load_test.run)(
+                    options['users'], options['turns'], options['concurrency'], names[0]
+                )
+
+        failed = {endpoint: report['errors'] for endpoint, report in results.items() if report['errors']}
+        if failed:
+            raise CommandError("Requests failed: " + ", ".join(f"{endpoint} {errors}" for endpoint, errors in failed.items()))
+
+        self.stdout.write(json.dumps(results, indent=2))
+        for endpoint, report in results.items():
+            self.stdout.write(self.style.SUCCESS(
+                f"{endpoint}: p50 {report['p50_ms']}ms, p99 {report['p99_ms']}ms, "
+                f"peak concurrency {report['peak_concurrency']}, {report['throughput_rps']} req/s"
+            ))
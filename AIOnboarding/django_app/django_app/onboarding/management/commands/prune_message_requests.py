@@ -0,0 +1,15 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django_app.onboarding.models import MessageRequest
+
+
+class Command(BaseCommand):
+    help = 'Delete stored message replies whose Idempotency-Key is older than IDEMPOTENCY_TTL'
+
+    def handle(self, *args, **options):
+        expired = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_TTL)
+        deleted, _ = MessageRequest.objects.filter(created_at__lt=expired).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired message requests."))
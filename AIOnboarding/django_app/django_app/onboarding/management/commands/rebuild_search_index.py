@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, Q
+from django_app.onboarding.models import Interaction
+from django_app.onboarding.search import full_text_supported, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Build the full-text search vectors of interactions that have none or are missing messages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rebuild every interaction, not only out of date ones')
+
+    def handle(self, *args, **options):
+        if not full_text_supported():
+            raise CommandError('The search index needs PostgreSQL; other databases are searched without one')
+        interactions = Interaction.objects.all()
+        if not options['all']:
+            interactions = interactions.annotate(message_count=Count('messages')).filter(
+                Q(search__isnull=True) | Q(search__indexed_until__lt=F('message_count'))
+            )
+        rebuilt = 0
+        for interaction_id in interactions.values_list('id', flat=True).iterator():
+            rebuild(interaction_id)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the search vectors of {rebuilt} interactions."))
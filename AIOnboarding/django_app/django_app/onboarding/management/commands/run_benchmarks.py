@@ -0,0 +1,94 @@
+import json
+import platform
+import subprocess
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+from django_app.onboarding.benchmarks import compare, suite
+from django_app.onboarding.benchmarks.harness import isolated_database, stub_backend
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Run the end-to-end benchmark scenarios against the stub LLM backend and write the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=list(suite.SCENARIOS), help='Scenario to run (repeatable; default: all)')
+        parser.add_argument('--iterations', type=int, default=10, help='Runs of each scenario')
+        parser.add_argument('--memory-iterations', type=int, default=1, help='Runs of each scenario under tracemalloc (0 to skip)')
+        parser.add_argument('--latency', type=float, default=0.05, help='Seconds per stub LLM call')
+        parser.add_argument('--token-latency', type=float, default=0.0, help='Extra seconds per 1000 chat input tokens')
+        parser.add_argument('--output', help='File to write the results to')
+        parser.add_argument('--compare', help='Earlier results file to compare against')
+        parser.add_argument('--threshold', type=float, default=10.0, help='Percent increase reported as a regression')
+        parser.add_argument('--fail-on-regression', action='store_true', help='Exit with an error if anything regressed')
+
+    def handle(self, *args, **options):
+        names = options['scenario'] or list(suite.SCENARIOS)
+        with isolated_database(), override_settings(ALLOWED_HOSTS=['testserver']):
+            call_command('seed_departments', stdout=StringIO())
+            with stub_backend(latency=options['latency'], token_latency=options['token_latency']):
+                scenarios = suite.run(names, options['iterations'], options['memory_iterations'])
+
+        # Timings of runs with failed requests measure the failures, so none
+        # are reported
+        failed = suite.failed_requests(scenarios)
+        if failed:
+            raise CommandError("Requests failed, no results written: " + ", ".join(
+                f"{name} {errors}" for name, errors in failed.items()
+            ))
+
+        results = {
+            'meta': {
+                'commit': _commit(),
+                'created_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'iterations': options['iterations'],
+                'latency': options['latency'],
+                'token_latency': options['token_latency'],
+            },
+            'scenarios': scenarios,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+        else:
+            self.stdout.write(json.dumps(results, indent=2))
+
+        for name, result in scenarios.items():
+            self.stdout.write(self.style.SUCCESS(
+                f"{name}: mean {result['mean_ms']}ms, p95 {result['p95_ms']}ms, "
+                f"{result['queries_per_request']} queries and {result['bytes_written_per_request']} bytes written per request"
+                + (f", peak {result['memory']['peak_kib']} KiB" if 'memory' in result else "")
+            ))
+
+        if options['compare']:
+            regressions = report_comparison(self, compare.load(options['compare']), results, options['threshold'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f"{regressions} metrics regressed by more than {options['threshold']}%")
+
+
+def report_comparison(command, baseline, results, threshold):
+    """
+    Print the comparison of `results` with `baseline`; returns the number of regressions.
+    """
+    rows = compare.compare(baseline, results, threshold)
+    command.stdout.write(f"Compared with {baseline['meta'].get('commit') or 'baseline'}:")
+    for row in rows:
+        style = command.style.WARNING if row['regression'] else command.style.SUCCESS
+        command.stdout.write(style(compare.format_row(row)))
+    return sum(row['regression'] for row in rows)
@@ -0,0 +1,42 @@
+import multiprocessing
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django_app.onboarding.jobs import Worker
+
+
+def _work(threads, poll_interval, burst, queues):
+    Worker(threads, poll_interval, burst=burst, queues=queues).run()
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (summaries, simulations) until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=settings.JOB_WORKER_THREADS, help='Jobs run concurrently per process')
+        parser.add_argument('--processes', type=int, default=settings.JOB_WORKER_PROCESSES, help='Worker processes to fork')
+        parser.add_argument('--poll-interval', type=float, default=settings.JOB_POLL_INTERVAL, help='Seconds between polls of an empty queue')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty')
+        parser.add_argument('--queues', default=','.join(settings.JOB_QUEUES), help='Comma-separated queues to take jobs from')
+
+    def handle(self, *args, **options):
+        queues = [queue.strip() for queue in options['queues'].split(',') if queue.strip()]
+        worker_args = (options['threads'], options['poll_interval'], options['burst'], queues)
+        if options['processes'] <= 1:
+            _work(*worker_args)
+            return
+
+        # Forked children must not share the parent's database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=_work, args=worker_args) for _ in range(options['processes'])]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            # Children got the same SIGINT and finish their running jobs
+            for process in processes:
+                process.join()
@@ -0,0 +1,355 @@
+"""
+In-process metrics and per-turn stage timings.
+
+Code wraps the steps of a turn in span() and LLM calls and ORM writes are
+timed automatically (genai clients are wrapped by InstrumentedClient, and
+every database connection gets db_write_wrapper). Durations go into
+histograms, token counts and cache hits/misses into counters, and render()
+formats them in the Prometheus text format for the /metrics endpoint. Each
+process keeps its own metrics, so scrape every worker process.
+
+While a turn is being collected (collect_turn()), each span, LLM call and
+write is also kept as a record, and save_timings() stores them as
+StageTiming rows of the interaction, for METRICS_TIMING_SAMPLE_RATE of turns.
+"""
+import contextvars
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = []
+# Records of the turn being collected, or None
+_turn = contextvars.ContextVar("onboarding_turn_timings", default=None)
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [bucket counts..., sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, series):
+                    labels = _label_text(self.labels + ("le",), key + (repr(bound),))
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _label_text(self.labels + ("le",), key + ("+Inf",))
+                lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+                lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_label_text(self.labels, key)} {series[-1]}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("onboarding_stage_seconds", "Time spent in each step of a turn", ["stage"])
+STAGE_ERRORS = Counter("onboarding_stage_errors_total", "Steps of a turn that raised", ["stage"])
+LLM_SECONDS = Histogram("onboarding_llm_call_seconds", "Latency of LLM API calls", ["operation", "model", "status"])
+LLM_TOKENS = Counter("onboarding_llm_tokens_total", "Tokens reported by LLM API calls", ["operation", "model", "kind"])
+DB_WRITE_SECONDS = Histogram("onboarding_db_write_seconds", "Latency of database writes", ["statement", "table"])
+CACHE_REQUESTS = Counter("onboarding_cache_requests_total", "Cache lookups by outcome", ["cache", "result"])
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def _record(stage, duration, **attributes):
+    records = _turn.get()
+    if records is not None:
+        records.append({"stage": stage, "duration_ms": round(duration * 1000, 3), **attributes})
+
+
+class Span:
+    def __init__(self, stage, attributes):
+        self.stage = stage
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+@contextmanager
+def span(stage, **attributes):
+    """
+    Time the block as step `stage` of the current turn. Attributes set on
+    the yielded Span (model, tokens, cache_hit) are stored with its record.
+    """
+    current = Span(stage, attributes)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException:
+        current.set(error=True)
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_SECONDS.observe(duration, stage=stage)
+        _record(stage, duration, **current.attributes)
+
+
+def cache_result(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def collect_turn():
+    """
+    Start keeping the records of this turn if it is sampled. Returns the
+    list they are appended to, or None.
+    """
+    if random.random() >= settings.METRICS_TIMING_SAMPLE_RATE:
+        _turn.set(None)
+        return None
+    records = []
+    _turn.set(records)
+    return records
+
+
+def end_turn():
+    _turn.set(None)
+
+
+async def save_timings(interaction_id, records):
+    """
+    Store a turn's records; call end_turn() first so this insert isn't
+    recorded into them.
+    """
+    from .models import StageTiming
+
+    if not records or interaction_id is None:
+        return
+    await StageTiming.objects.abulk_create([
+        StageTiming(
+            interaction_id=interaction_id,
+            stage=record["stage"],
+            duration_ms=record["duration_ms"],
+            model=record.get("model", ""),
+            input_tokens=record.get("input_tokens"),
+            output_tokens=record.get("output_tokens"),
+            cached_tokens=record.get("cached_tokens"),
+            cache_hit=record.get("cache_hit"),
+            error=record.get("error", False),
+        )
+        for record in records
+    ])
+
+
+# LLM calls
+
+def _usage(response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return {}
+    tokens = {
+        "input_tokens": getattr(usage, "prompt_token_count", None),
+        "output_tokens": getattr(usage, "candidates_token_count", None),
+        "cached_tokens": getattr(usage, "cached_content_token_count", None),
+    }
+    return {key: value for key, value in tokens.items() if value is not None}
+
+
+def _observe_llm(operation, model, duration, error, tokens):
+    LLM_SECONDS.observe(duration, operation=operation, model=model, status="error" if error else "ok")
+    for key, value in tokens.items():
+        LLM_TOKENS.inc(value, operation=operation, model=model, kind=key[:-len("_tokens")])
+    _record(f"llm.{operation}", duration, model=model, error=error, **tokens)
+
+
+async def _timed_call(operation, model, call):
+    start = time.perf_counter()
+    response = None
+    error = True
+    try:
+        response = await call
+        error = False
+        return response
+    finally:
+        _observe_llm(operation, model, time.perf_counter() - start, error, _usage(response))
+
+
+class _InstrumentedModels:
+    def __init__(self, models):
+        self._models = models
+
+    async def generate_content(self, model, contents, config=None):
+        return await _timed_call("generate_content", model, self._models.generate_content(model=model, contents=contents, config=config))
+
+    async def embed_content(self, model, contents, config=None):
+        return await _timed_call("embed_content", model, self._models.embed_content(model=model, contents=contents, config=config))
+
+    def __getattr__(self, name):
+        return getattr(self._models, name)
+
+
+class _InstrumentedChat:
+    def __init__(self, chat, model):
+        self._chat = chat
+        self._model = model
+
+    async def send_message(self, message, config=None):
+        return await _timed_call("chat", self._model, self._chat.send_message(message=message, config=config))
+
+    async def send_message_stream(self, message, config=None):
+        start = time.perf_counter()
+        try:
+            stream = await self._chat.send_message_stream(message=message, config=config)
+        except BaseException:
+            _observe_llm("chat_stream", self._model, time.perf_counter() - start, True, {})
+            raise
+        return self._observed_stream(stream, start)
+
+    async def _observed_stream(self, stream, start):
+        tokens = {}
+        error = True
+        try:
+            async for chunk in stream:
+                # The last chunk carries the usage of the whole reply
+                tokens = _usage(chunk) or tokens
+                yield chunk
+            error = False
+        finally:
+            _observe_llm("chat_stream", self._model, time.perf_counter() - start, error, tokens)
+
+    def __getattr__(self, name):
+        return getattr(self._chat, name)
+
+
+class _InstrumentedChats:
+    def __init__(self, chats):
+        self._chats = chats
+
+    def create(self, model, config=None, history=None):
+        return _InstrumentedChat(self._chats.create(model=model, config=config, history=history), model)
+
+    def __getattr__(self, name):
+        return getattr(self._chats, name)
+
+
+class _InstrumentedCaches:
+    def __init__(self, caches):
+        self._caches = caches
+
+    async def create(self, model, config=None):
+        return await _timed_call("cache_create", model, self._caches.create(model=model, config=config))
+
+    async def update(self, name, config=None):
+        return await _timed_call("cache_update", "", self._caches.update(name=name, config=config))
+
+    def __getattr__(self, name):
+        return getattr(self._caches, name)
+
+
+class _InstrumentedAio:
+    def __init__(self, aio):
+        self._aio = aio
+        self.models = _InstrumentedModels(aio.models)
+        self.chats = _InstrumentedChats(aio.chats)
+        self.caches = _InstrumentedCaches(aio.caches)
+
+    def __getattr__(self, name):
+        return getattr(self._aio, name)
+
+
+class InstrumentedClient:
+    """
+    Wraps a genai.Client-compatible client so every async call is timed
+    and its token usage counted. Anything else is passed through.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self.aio = _InstrumentedAio(client.aio)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+# Database writes
+
+WRITE_RE = re.compile(r'^\s*(INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+["`]?(\w+)', re.IGNORECASE)
+
+
+def db_write_wrapper(execute, sql, params, many, context):
+    match = WRITE_RE.match(sql)
+    if match is None:
+        return execute(sql, params, many, context)
+    statement = match.group(1).split()[0].lower()
+    table = match.group(2)
+    start = time.perf_counter()
+    error = True
+    try:
+        result = execute(sql, params, many, context)
+        error = False
+        return result
+    finally:
+        duration = time.perf_counter() - start
+        DB_WRITE_SECONDS.observe(duration, statement=statement, table=table)
+        _record(f"db.{statement}.{table}", duration, error=error)
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """
+    connection_created receiver: time the writes made on `connection`.
+    """
+    if db_write_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_write_wrapper)
@@ -0,0 +1,26 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onboarding', '0005_add_system_instructions_to_interaction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('summary', models.TextField(blank=True, default='')),
+                ('interaction_hashes', models.JSONField(default=dict, help_text='Content hash of each interaction folded into the summary, keyed by interaction ID')),
+                ('covered_until', models.DateTimeField(blank=True, help_text='Interactions not updated since this time are already summarised', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='history_summary', to='onboarding.client')),
+            ],
+        ),
+    ]
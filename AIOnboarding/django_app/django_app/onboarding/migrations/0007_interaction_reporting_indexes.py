@@ -0,0 +1,25 @@
+# Generated by Django 6.0.1 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onboarding', '0006_client_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='interaction',
+            index=models.Index(fields=['department', 'created_at'], name='interaction_dept_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='interaction',
+            index=models.Index(fields=['client', '-created_at'], name='interaction_client_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='interaction',
+            index=models.Index(fields=['created_at'], name='interaction_created_idx'),
+        ),
+    ]
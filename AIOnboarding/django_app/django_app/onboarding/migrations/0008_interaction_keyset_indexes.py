@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onboarding', '0007_interaction_reporting_indexes'),
+    ]
+
+    # Keyset pagination orders on (created_at, id), so the reporting indexes
+    # of 0007 are replaced by ones with id appended; their (department,
+    # created_at) and (created_at) prefixes still serve the reporting queries.
+    # The new indexes are built before the old ones are dropped.
+    operations = [
+        migrations.AddIndex(
+            model_name='interaction',
+            index=models.Index(fields=['department', 'created_at', 'id'], name='interaction_dept_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='interaction',
+            index=models.Index(fields=['created_at', 'id'], name='interaction_keyset_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='interaction',
+            name='interaction_dept_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='interaction',
+            name='interaction_created_idx',
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 6.0.1 on 2026-10-18 17:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def split_conversations(apps, schema_editor):
+    Interaction = apps.get_model('onboarding', 'Interaction')
+    Message = apps.get_model('onboarding', 'Message')
+    batch = []
+    interactions = Interaction.objects.exclude(conversation=[]).only('id', 'conversation')
+    for interaction in interactions.iterator(chunk_size=500):
+        for position, entry in enumerate(interaction.conversation or []):
+            if not isinstance(entry, dict):
+                continue
+            batch.append(Message(
+                interaction_id=interaction.id,
+                position=position,
+                role=entry.get('role') or 'user',
+                parts=entry.get('parts') or [],
+            ))
+        if len(batch) >= 1000:
+            Message.objects.bulk_create(batch)
+            batch = []
+    Message.objects.bulk_create(batch)
+
+
+def join_conversations(apps, schema_editor):
+    Interaction = apps.get_model('onboarding', 'Interaction')
+    Message = apps.get_model('onboarding', 'Message')
+    conversations = {}
+    for message in Message.objects.order_by('interaction_id', 'position').iterator(chunk_size=1000):
+        conversations.setdefault(message.interaction_id, []).append({'role': message.role, 'parts': message.parts})
+    for interaction_id, conversation in conversations.items():
+        Interaction.objects.filter(id=interaction_id).update(conversation=conversation)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onboarding', '0008_interaction_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Message',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(help_text='Index of this entry in the conversation')),
+                ('role', models.CharField(max_length=16)),
+                ('parts', models.JSONField(default=list, help_text='Gemini content parts, e.g. [{"text": ...}]')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('interaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='onboarding.interaction')),
+            ],
+            options={
+                'ordering': ['position'],
+                'constraints': [models.UniqueConstraint(fields=('interaction', 'position'), name='message_interaction_position_uniq')],
+            },
+        ),
+        migrations.RunPython(split_conversations, join_conversations),
+        migrations.RemoveField(
+            model_name='interaction',
+            name='conversation',
+        ),
+    ]
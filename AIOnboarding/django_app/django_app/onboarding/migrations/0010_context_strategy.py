@@ -0,0 +1,38 @@
+# Generated by Django 6.0.1 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onboarding', '0009_interaction_messages'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='department',
+            name='context_strategy',
+            field=models.CharField(blank=True, choices=[('', 'Default (GEMINI_CONTEXT_STRATEGY)'), ('full', 'Full history'), ('window', 'Last N turns'), ('summary', 'Last N turns plus a running summary'), ('budget', 'Most recent messages within a token budget')], default='', help_text='How much of the conversation is sent to Gemini each turn', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='department',
+            name='context_token_budget',
+            field=models.PositiveIntegerField(blank=True, help_text='Estimated history tokens allowed by the budget strategy (default GEMINI_CONTEXT_TOKEN_BUDGET)', null=True),
+        ),
+        migrations.AddField(
+            model_name='department',
+            name='context_window',
+            field=models.PositiveIntegerField(blank=True, help_text='Turns kept verbatim by the window and summary strategies (default GEMINI_CONTEXT_WINDOW)', null=True),
+        ),
+        migrations.AddField(
+            model_name='interaction',
+            name='context_summary',
+            field=models.TextField(blank=True, default='', help_text='Running summary of the messages before context_summary_until'),
+        ),
+        migrations.AddField(
+            model_name='interaction',
+            name='context_summary_until',
+            field=models.PositiveIntegerField(default=0, help_text='Messages before this position are only sent to Gemini as the running summary'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0.1 on 2026-10-18 18:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onboarding', '0010_context_strategy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeminiContextCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='SHA-256 of the model and system instruction text', max_length=64, unique=True)),
+                ('name', models.CharField(help_text='Gemini resource name, e.g. cachedContents/...', max_length=255)),
+                ('model', models.CharField(max_length=64)),
+                ('token_estimate', models.PositiveIntegerField(default=0)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='context_caches', to='onboarding.department')),
+            ],
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 6.0.1 on 2026-10-18 19:05
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, identify_hasher, make_password
+from django.db import migrations, models
+
+
+def normalize_clients(apps, schema_editor):
+    Client = apps.get_model('onboarding', 'Client')
+    Interaction = apps.get_model('onboarding', 'Interaction')
+    ClientSummary = apps.get_model('onboarding', 'ClientSummary')
+    hasher = PBKDF2PasswordHasher()
+    hasher.iterations = getattr(settings, 'CLIENT_PASSWORD_ITERATIONS', hasher.iterations)
+
+    # Login used to pick the most recently created client for an email, so
+    # that one is kept and earlier duplicates are merged into it
+    kept = {}
+    for client in list(Client.objects.order_by('-created_at', '-id')):
+        email = (client.email or '').strip().lower()
+        survivor = kept.get(email)
+        if survivor is not None:
+            Interaction.objects.filter(client_id=client.id).update(client_id=survivor.id)
+            survivor.departments.add(*client.departments.all())
+            # The survivor's summary picks the moved interactions up on its next refresh
+            ClientSummary.objects.filter(client_id=client.id).delete()
+            client.delete()
+            continue
+        kept[email] = client
+        client.email = email
+        try:
+            identify_hasher(client.password)
+        except ValueError:
+            client.password = make_password(client.password, hasher=hasher)
+        client.save(update_fields=['email', 'password'])
+
+
+class Migration(migrations.Migration):
+    # Merging duplicates leaves deferred foreign key checks pending, and
+    # PostgreSQL won't alter a table in the transaction that has them, so
+    # the data step commits on its own before the schema changes
+    atomic = False
+
+    dependencies = [
+        ('onboarding', '0011_gemini_context_cache'),
+    ]
+
+    operations = [
+        # Plaintext passwords can't be recovered from their hashes, so there is
+        # nothing to undo on the way back
+        migrations.RunPython(normalize_clients, migrations.RunPython.noop, atomic=True),
+        migrations.AlterField(
+            model_name='client',
+            name='email',
+            field=models.EmailField(help_text='Stored lowercased; used to identify the client at login', max_length=254, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='client',
+            name='password',
+            field=models.CharField(help_text="PBKDF2 hash of the client's password", max_length=255),
+        ),
+    ]
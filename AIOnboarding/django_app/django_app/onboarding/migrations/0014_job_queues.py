@@ -0,0 +1,26 @@
+# Generated by Django 6.0.1 on 2026-10-18 20:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onboarding', '0013_job_queue'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='job',
+            name='job_claim_idx',
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='queue',
+            field=models.CharField(default='default', help_text='Only workers serving this queue run the job', max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['queue', 'status', '-priority', 'run_at'], name='job_claim_idx'),
+        ),
+    ]
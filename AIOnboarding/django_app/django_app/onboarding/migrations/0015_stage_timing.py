@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-18 20:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onboarding', '0014_job_queues'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StageTiming',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage', models.CharField(max_length=100)),
+                ('duration_ms', models.FloatField()),
+                ('model', models.CharField(blank=True, help_text='LLM model name, for LLM calls', max_length=100)),
+                ('input_tokens', models.PositiveIntegerField(blank=True, null=True)),
+                ('output_tokens', models.PositiveIntegerField(blank=True, null=True)),
+                ('cached_tokens', models.PositiveIntegerField(blank=True, null=True)),
+                ('cache_hit', models.BooleanField(blank=True, help_text='Whether the step was answered from a cache, where that applies', null=True)),
+                ('error', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('interaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stage_timings', to='onboarding.interaction')),
+            ],
+            options={
+                'ordering': ['created_at', 'id'],
+                'indexes': [models.Index(fields=['interaction', 'created_at'], name='stage_timing_interaction_idx'), models.Index(fields=['stage', 'created_at'], name='stage_timing_stage_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 6.0.1 on 2026-10-18 21:05
+
+import django_app.onboarding.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onboarding', '0015_stage_timing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 of the file; identical uploads share one stored copy', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='extracted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='size',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('extracting', 'Extracting'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='text_file',
+            field=models.FileField(blank=True, upload_to=django_app.onboarding.models.document_text_path),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='text_length',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='document',
+            constraint=models.UniqueConstraint(condition=models.Q(('content_hash', ''), _negated=True), fields=('interaction', 'content_hash'), name='document_unique_content_per_interaction'),
+        ),
+    ]
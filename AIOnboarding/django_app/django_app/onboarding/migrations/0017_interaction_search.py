@@ -0,0 +1,28 @@
+# Generated by Django 6.0.1 on 2026-10-18 21:30
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onboarding', '0016_document_ingestion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InteractionSearch',
+            fields=[
+                ('interaction', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search', serialize=False, to='onboarding.interaction')),
+                ('vector', django.contrib.postgres.search.SearchVectorField()),
+                ('indexed_until', models.PositiveIntegerField(default=0, help_text='Messages before this position are in the vector')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.GinIndex(fields=['vector'], name='interaction_search_vector_idx')],
+            },
+        ),
+    ]
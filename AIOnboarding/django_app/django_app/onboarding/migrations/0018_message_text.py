@@ -0,0 +1,32 @@
+# Generated by Django 6.0.1 on 2026-10-18 21:55
+
+from django.db import migrations, models
+
+
+def flatten_messages(apps, schema_editor):
+    Message = apps.get_model('onboarding', 'Message')
+    batch = []
+    for message in Message.objects.only('id', 'parts').iterator(chunk_size=1000):
+        parts = message.parts if isinstance(message.parts, list) else []
+        message.text = '\n'.join(part['text'] for part in parts if isinstance(part, dict) and part.get('text'))
+        batch.append(message)
+        if len(batch) >= 1000:
+            Message.objects.bulk_update(batch, ['text'])
+            batch = []
+    Message.objects.bulk_update(batch, ['text'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onboarding', '0017_interaction_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='text',
+            field=models.TextField(blank=True, default='', help_text='The text parts joined, for display and search'),
+        ),
+        migrations.RunPython(flatten_messages, migrations.RunPython.noop),
+    ]
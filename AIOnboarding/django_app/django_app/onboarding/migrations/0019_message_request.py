@@ -0,0 +1,28 @@
+# Generated by Django 6.0.1 on 2026-10-18 22:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onboarding', '0018_message_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='The endpoint and the Idempotency-Key header of the request', max_length=255, unique=True)),
+                ('status', models.CharField(choices=[('processing', 'Processing'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='processing', max_length=16)),
+                ('response', models.JSONField(blank=True, help_text='The JSON reply, returned again for retries', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['created_at'], name='message_request_created_idx')],
+            },
+        ),
+    ]
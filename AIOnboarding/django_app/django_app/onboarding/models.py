@@ -1,5 +1,11 @@
+import posixpath
+
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+
+from .credentials import hash_password, is_hashed, normalize_email
 
 
 class Department(models.Model):
@@ -7,10 +13,35 @@ class Department(models.Model):
     Department model representing organizational departments.
     Associated with multiple lawyers and clients.
     """
+    CONTEXT_STRATEGY_CHOICES = [
+        ('', 'Default (GEMINI_CONTEXT_STRATEGY)'),
+        ('full', 'Full history'),
+        ('window', 'Last N turns'),
+        ('summary', 'Last N turns plus a running summary'),
+        ('budget', 'Most recent messages within a token budget'),
+    ]
+
     name = models.CharField(max_length=255, unique=True)
     prompt = models.TextField(
         help_text="Associated AI prompt for this department"
     )
+    context_strategy = models.CharField(
+        max_length=16,
+        blank=True,
+        default='',
+        choices=CONTEXT_STRATEGY_CHOICES,
+        help_text="How much of the conversation is sent to Gemini each turn"
+    )
+    context_window = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Turns kept verbatim by the window and summary strategies (default GEMINI_CONTEXT_WINDOW)"
+    )
+    context_token_budget = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Estimated history tokens allowed by the budget strategy (default GEMINI_CONTEXT_TOKEN_BUDGET)"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -27,8 +58,14 @@ class Client(models.Model):
     Has many interactions and potentially multiple departments.
     """
     name = models.CharField(max_length=255)
-    email = models.EmailField()
-    password = models.CharField(max_length=255)
+    email = models.EmailField(
+        unique=True,
+        help_text="Stored lowercased; used to identify the client at login"
+    )
+    password = models.CharField(
+        max_length=255,
+        help_text="PBKDF2 hash of the client's password"
+    )
     departments = models.ManyToManyField(
         Department,
         related_name='clients',
@@ -40,6 +77,14 @@ class Client(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.email = normalize_email(self.email)
+        # Passwords set directly (admin, scripts) are hashed here; the login
+        # path hashes them off the event loop before saving
+        if self.password and not is_hashed(self.password):
+            self.password = hash_password(self.password)
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['-created_at']
 
@@ -70,9 +115,14 @@ class Interaction(models.Model):
         default="",
         help_text="System instructions used to initialize the interaction"
     )
-    conversation = models.JSONField(
-        default=list,
-        help_text="Stores the entire AI discussion as JSON array"
+    context_summary = models.TextField(
+        blank=True,
+        default="",
+        help_text="Running summary of the messages before context_summary_until"
+    )
+    context_summary_until = models.PositiveIntegerField(
+        default=0,
+        help_text="Messages before this position are only sent to Gemini as the running summary"
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -81,14 +131,195 @@ class Interaction(models.Model):
         client_name = self.client.name if self.client else "No Client"
         return f"{client_name} - {self.department.name}"
 
+    def history(self):
+        """
+        The conversation in Gemini's chat history format. Uses prefetched
+        messages when available.
+        """
+        return [message.as_content() for message in self.messages.all()]
+
+    async def ahistory(self):
+        return [message.as_content() async for message in self.messages.all()]
+
+    @property
+    def conversation(self):
+        return self.history()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Reporting queries in analytics.DepartmentStats and the keyset
+            # pagination of interactions_list, which orders on (created_at, id)
+            models.Index(fields=['department', 'created_at', 'id'], name='interaction_dept_keyset_idx'),
+            models.Index(fields=['client', '-created_at'], name='interaction_client_created_idx'),
+            models.Index(fields=['created_at', 'id'], name='interaction_keyset_idx'),
+        ]
+
+
+def message_text(parts):
+    """
+    The text parts of a Gemini content entry, joined.
+    """
+    if not isinstance(parts, list):
+        return ""
+    return "\n".join(part["text"] for part in parts if isinstance(part, dict) and part.get("text"))
+
+
+class Message(models.Model):
+    """
+    One entry of an interaction's conversation (a user or model turn).
+    Turns are appended as new rows; earlier ones are never rewritten, so
+    their text is flattened once, when they are stored.
+    """
+    interaction = models.ForeignKey(
+        Interaction,
+        on_delete=models.CASCADE,
+        related_name='messages'
+    )
+    position = models.PositiveIntegerField(
+        help_text="Index of this entry in the conversation"
+    )
+    role = models.CharField(max_length=16)
+    parts = models.JSONField(
+        default=list,
+        help_text="Gemini content parts, e.g. [{\"text\": ...}]"
+    )
+    text = models.TextField(
+        blank=True,
+        default='',
+        help_text="The text parts joined, for display and search"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.interaction_id} #{self.position} ({self.role})"
+
+    @classmethod
+    def from_content(cls, interaction, position, content):
+        return cls(
+            interaction=interaction,
+            position=position,
+            role=content["role"],
+            parts=content["parts"],
+            text=message_text(content["parts"]),
+        )
+
+    def as_content(self):
+        return {"role": self.role, "parts": self.parts}
+
+    class Meta:
+        ordering = ['position']
+        constraints = [
+            models.UniqueConstraint(fields=['interaction', 'position'], name='message_interaction_position_uniq'),
+        ]
+
+
+class InteractionSearch(models.Model):
+    """
+    Full-text search vector of an interaction's conversation (see search.py).
+    Kept apart from Interaction so loading an interaction never loads it.
+    """
+    interaction = models.OneToOneField(
+        Interaction,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search'
+    )
+    vector = SearchVectorField()
+    indexed_until = models.PositiveIntegerField(
+        default=0,
+        help_text="Messages before this position are in the vector"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Search vector of interaction {self.interaction_id}"
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['vector'], name='interaction_search_vector_idx'),
+        ]
+
+
+class GeminiContextCache(models.Model):
+    """
+    Handle of a Gemini cached content holding a turn's system instructions,
+    so steady-state turns can reference it instead of resending them.
+    """
+    key = models.CharField(
+        max_length=64,
+        unique=True,
+        help_text="SHA-256 of the model and system instruction text"
+    )
+    name = models.CharField(
+        max_length=255,
+        help_text="Gemini resource name, e.g. cachedContents/..."
+    )
+    model = models.CharField(max_length=64)
+    department = models.ForeignKey(
+        Department,
+        on_delete=models.SET_NULL,
+        related_name='context_caches',
+        null=True,
+        blank=True
+    )
+    token_estimate = models.PositiveIntegerField(default=0)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+
+class ClientSummary(models.Model):
+    """
+    Rolling summary of a client's earlier interactions.
+    Updated incrementally so each interaction is only summarised once.
+    """
+    client = models.OneToOneField(
+        Client,
+        on_delete=models.CASCADE,
+        related_name='history_summary'
+    )
+    summary = models.TextField(blank=True, default="")
+    interaction_hashes = models.JSONField(
+        default=dict,
+        help_text="Content hash of each interaction folded into the summary, keyed by interaction ID"
+    )
+    covered_until = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Interactions not updated since this time are already summarised"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Summary for {self.client.name}"
+
+
+def document_text_path(instance, filename):
+    # Extracted text is stored next to the file it came from
+    return posixpath.join(posixpath.dirname(instance.file.name), filename)
 
 
 class Document(models.Model):
     """
     Document model representing files/documents associated with interactions.
+    Uploads and text extraction are handled by documents.py.
     """
+    PENDING = 'pending'
+    EXTRACTING = 'extracting'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (EXTRACTING, 'Extracting'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    ]
+
     interaction = models.ForeignKey(
         Interaction,
         on_delete=models.CASCADE,
@@ -97,10 +328,171 @@ class Document(models.Model):
     file_name = models.CharField(max_length=255)
     file = models.FileField(upload_to='interaction_documents/%Y/%m/%d/')
     file_type = models.CharField(max_length=50, blank=True)
+    size = models.PositiveBigIntegerField(default=0)
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        db_index=True,
+        help_text="SHA-256 of the file; identical uploads share one stored copy"
+    )
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    text_file = models.FileField(upload_to=document_text_path, blank=True)
+    text_length = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    extracted_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.file_name} ({self.interaction.id})"
 
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            # The same file is attached to an interaction once
+            models.UniqueConstraint(
+                fields=['interaction', 'content_hash'],
+                condition=~models.Q(content_hash=''),
+                name='document_unique_content_per_interaction',
+            ),
+        ]
+
+
+class Job(models.Model):
+    """
+    Unit of background work run by the `run_worker` command (see jobs.py).
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    task = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict, blank=True)
+    queue = models.CharField(
+        max_length=100,
+        default='default',
+        help_text="Only workers serving this queue run the job"
+    )
+    priority = models.SmallIntegerField(
+        default=0,
+        help_text="Higher priorities run first"
+    )
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    idempotency_key = models.CharField(
+        max_length=255,
+        unique=True,
+        null=True,
+        blank=True,
+        help_text="Enqueueing again with the same key returns this job"
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_at = models.DateTimeField(
+        help_text="Not run before this time (used for retry backoff)"
+    )
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.task} #{self.id} ({self.status})"
+
+    @property
+    def done(self):
+        return self.status in (self.SUCCEEDED, self.FAILED)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Claiming the next job to run
+            models.Index(fields=['queue', 'status', '-priority', 'run_at'], name='job_claim_idx'),
+        ]
+
+
+class StageTiming(models.Model):
+    """
+    Time one step of a turn took: a stage of the turn, an LLM call
+    ("llm.<operation>") or a database write ("db.<statement>.<table>").
+    Recorded for a sample of turns (see metrics.py).
+    """
+    interaction = models.ForeignKey(
+        Interaction,
+        on_delete=models.CASCADE,
+        related_name='stage_timings'
+    )
+    stage = models.CharField(max_length=100)
+    duration_ms = models.FloatField()
+    model = models.CharField(
+        max_length=100,
+        blank=True,
+        help_text="LLM model name, for LLM calls"
+    )
+    input_tokens = models.PositiveIntegerField(null=True, blank=True)
+    output_tokens = models.PositiveIntegerField(null=True, blank=True)
+    cached_tokens = models.PositiveIntegerField(null=True, blank=True)
+    cache_hit = models.BooleanField(
+        null=True,
+        blank=True,
+        help_text="Whether the step was answered from a cache, where that applies"
+    )
+    error = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.interaction_id} {self.stage} ({self.duration_ms:.1f} ms)"
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['interaction', 'created_at'], name='stage_timing_interaction_idx'),
+            models.Index(fields=['stage', 'created_at'], name='stage_timing_stage_idx'),
+        ]
+
+
+class MessageRequest(models.Model):
+    """
+    A message request sent with an Idempotency-Key header, so a retry of it
+    gets the stored reply instead of running the turn again.
+    """
+    PROCESSING = 'processing'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PROCESSING, 'Processing'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    key = models.CharField(
+        max_length=255,
+        unique=True,
+        help_text="The endpoint and the Idempotency-Key header of the request"
+    )
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PROCESSING)
+    response = models.JSONField(
+        null=True,
+        blank=True,
+        help_text="The JSON reply, returned again for retries"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.status})"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Pruning expired requests
+            models.Index(fields=['created_at'], name='message_request_created_idx'),
+        ]
@@ -0,0 +1,51 @@
+"""
+Helpers used to overlap the independent Gemini round trips of a turn.
+
+Within a request the calls run as asyncio tasks on the request's event loop.
+Work that should outlive the request (e.g. summary refreshes) goes to a shared
+thread pool instead.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.GEMINI_MAX_WORKERS,
+                    thread_name_prefix="gemini",
+                )
+    return _executor
+
+
+async def start(fn, *args, **kwargs):
+    """
+    Start coroutine function `fn` as a task, or await it right away when
+    parallel turns are disabled. Either way the caller gets an awaitable back.
+    """
+    if settings.GEMINI_PARALLEL_TURNS:
+        return asyncio.create_task(fn(*args, **kwargs))
+    future = asyncio.get_running_loop().create_future()
+    try:
+        future.set_result(await fn(*args, **kwargs))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def discard(task):
+    """
+    Cancel a call whose result is no longer wanted. An in-flight request is
+    abandoned rather than waited for.
+    """
+    if task is not None and not task.done():
+        task.cancel()
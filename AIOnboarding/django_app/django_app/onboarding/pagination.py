@@ -0,0 +1,73 @@
+"""
+Keyset pagination over (created_at, id), newest first.
+
+A page is located by the (created_at, id) of the row it starts after or ends
+before instead of an OFFSET, so every page costs the same index range scan no
+matter how deep into the table it is.
+"""
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(obj):
+    return f"{obj.created_at.isoformat()}_{obj.pk}"
+
+
+def decode_cursor(cursor):
+    """
+    (created_at, id) from a cursor string, or None if it is malformed.
+    """
+    if not cursor:
+        return None
+    created_at, _, pk = cursor.rpartition("_")
+    try:
+        created_at = parse_datetime(created_at)
+        pk = int(pk)
+    except ValueError:
+        return None
+    if created_at is None:
+        return None
+    return created_at, pk
+
+
+class KeysetPage:
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    @property
+    def next_cursor(self):
+        if not (self.has_next and self.object_list):
+            return None
+        return encode_cursor(self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if not (self.has_previous and self.object_list):
+            return None
+        return encode_cursor(self.object_list[0])
+
+
+def keyset_paginate(queryset, per_page, after=None, before=None):
+    """
+    One page of `queryset` ordered by (-created_at, -id). `after` and `before`
+    are cursors from a previous page; with neither the newest page is returned.
+    """
+    after, before = decode_cursor(after), decode_cursor(before)
+    if before and not after:
+        created_at, pk = before
+        rows = list(
+            queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+            .order_by('created_at', 'id')[:per_page + 1]
+        )
+        has_previous = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        return KeysetPage(rows, has_next=True, has_previous=has_previous)
+
+    queryset = queryset.order_by('-created_at', '-id')
+    if after:
+        created_at, pk = after
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    rows = list(queryset[:per_page + 1])
+    return KeysetPage(rows[:per_page], has_next=len(rows) > per_page, has_previous=after is not None)
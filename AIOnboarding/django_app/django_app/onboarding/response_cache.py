@@ -0,0 +1,190 @@
+"""
+In-process cache of attorney answers.
+
+Answers are keyed on the normalised question text. When
+ATTORNEY_CACHE_SIMILARITY is set, a question that misses the exact key is
+embedded and matched against the cached questions by cosine similarity.
+Entries expire after ATTORNEY_CACHE_TTL seconds, the least recently used entry
+is evicted past ATTORNEY_CACHE_MAX_ENTRIES, and the whole cache is cleared
+whenever an Interaction, Message, Client or Department row changes: through
+signals (see apps.py), and explicitly by bulk writes, which send none
+(append_messages()).
+
+Other processes' writes send no signals here, so every lookup also reads a
+version of the data (data_version()) and clears the cache when it moved. An
+answer is stored with the version its lookup saw and dropped if the data
+changed meanwhile, so a slow query never puts a stale answer back.
+"""
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .genai_client import get_client, request_options
+from .metrics import cache_result
+from .models import Client, Department, Interaction
+
+logger = logging.getLogger(__name__)
+
+_NON_WORD_RE = re.compile(r"[^\w\s@.-]")
+
+# Version after clear(), matching no lookup's, so answers in flight are dropped
+_CLEARED = object()
+
+
+def normalize_question(question):
+    text = _NON_WORD_RE.sub(" ", question.lower())
+    return " ".join(text.split()).strip(" .")
+
+
+class _Entry:
+    __slots__ = ("answer", "expires_at", "embedding")
+
+    def __init__(self, answer, expires_at, embedding=None):
+        self.answer = answer
+        self.expires_at = expires_at
+        self.embedding = embedding
+
+
+class ResponseCache:
+    def __init__(self, max_entries=256, ttl=300, similarity=0.0, name="response", version=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.version = version
+        self._version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get_exact(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _get_similar(self, embedding, now):
+        best_key, best_score = None, self.similarity
+        for key, entry in list(self._entries.items()):
+            if entry.expires_at <= now:
+                del self._entries[key]
+                continue
+            if entry.embedding is None:
+                continue
+            score = float(np.dot(entry.embedding, embedding))
+            if score >= best_score:
+                best_key, best_score = key, score
+        if best_key is None:
+            return None
+        self._entries.move_to_end(best_key)
+        return self._entries[best_key]
+
+    async def lookup(self, question):
+        """
+        Cached answer for `question`, or None, along with the data version to
+        store a fresh answer with.
+        """
+        key = normalize_question(question)
+        version = await self.version() if self.version else None
+        now = time.monotonic()
+        with self._lock:
+            if version != self._version:
+                # The data changed, possibly in another process
+                self._entries.clear()
+                self._version = version
+            entry = self._get_exact(key, now)
+        if entry is None and self.similarity:
+            embedding = await _embed(key)
+            if embedding is not None:
+                with self._lock:
+                    entry = self._get_similar(embedding, now)
+        cache_result(self.name, entry is not None)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None, version
+            self.hits += 1
+            return entry.answer, version
+
+    async def store(self, question, answer, version=None):
+        """
+        Cache `answer` unless the data changed since the lookup that returned
+        `version`.
+        """
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        key = normalize_question(question)
+        embedding = await _embed(key) if self.similarity else None
+        with self._lock:
+            if version != self._version:
+                return
+            self._entries[key] = _Entry(answer, time.monotonic() + self.ttl, embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._version = _CLEARED
+
+    def __len__(self):
+        return len(self._entries)
+
+
+async def _embed(text):
+    """
+    Unit-length embedding of `text`, or None if embedding fails so callers
+    fall back to exact matching.
+    """
+    try:
+        response = await get_client().aio.models.embed_content(
+            model=settings.ATTORNEY_CACHE_EMBEDDING_MODEL,
+            contents=text,
+            config={"http_options": request_options("classify")},
+        )
+        vector = np.asarray(response.embeddings[0].values, dtype=np.float32)
+    except Exception as e:
+        logger.warning("Embedding for response cache failed: %s", e)
+        return None
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else None
+
+
+async def data_version():
+    """
+    Row count and latest update of the tables attorney answers are drawn
+    from. Storing messages updates their interaction, so any write or delete
+    in any process changes it.
+    """
+    version = []
+    for model in (Interaction, Client, Department):
+        version += (await model.objects.aaggregate(count=Count("id"), updated=Max("updated_at"))).values()
+    return tuple(version)
+
+
+attorney_cache = ResponseCache(
+    max_entries=settings.ATTORNEY_CACHE_MAX_ENTRIES,
+    ttl=settings.ATTORNEY_CACHE_TTL,
+    similarity=settings.ATTORNEY_CACHE_SIMILARITY,
+    name="attorney",
+    version=data_version,
+)
+
+
+def invalidate(**kwargs):
+    """
+    The data behind cached answers changed. Also a signal receiver.
+    """
+    attorney_cache.clear()
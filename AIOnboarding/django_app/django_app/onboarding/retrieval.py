@@ -0,0 +1,502 @@
+"""
+Per-interaction retrieval over uploaded documents and earlier transcript.
+
+Documents are never pasted into the prompt whole. Each client turn is sent
+with only the RETRIEVAL_TOP_K chunks most relevant to the client's message,
+within RETRIEVAL_MAX_TOKENS, so the prompt stays bounded however many pages
+are uploaded.
+
+Every interaction has its own index directory under RETRIEVAL_INDEX_ROOT:
+
+- chunks.jsonl: one {"source", "text"} line per chunk;
+- vectors.f16: with RETRIEVAL_EMBEDDINGS, one unit-length float16 embedding
+  per chunk, memory-mapped when searched;
+- meta.json: how many chunks (and bytes of chunks.jsonl) are complete, the
+  embedding size, and what has been indexed so far.
+
+Indexes only grow. A document's chunks are appended by the index_document
+job once its text is extracted; transcript messages are appended by the
+index_transcript job once they fall out of the history replayed to Gemini.
+Writers append under a file lock and publish by rewriting meta.json, so a
+reader never sees a partial append. Chunks are ranked by BM25, plus the
+cosine similarity of their embeddings when every chunk has one. Searching
+processes keep the parsed indexes of recently used interactions in memory
+and only read what was appended since.
+"""
+import codecs
+import fcntl
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .context import CHARS_PER_TOKEN, estimate_tokens
+from .genai_client import get_client, request_options
+from .jobs import aenqueue, enqueue, task
+from .models import Document, Message
+
+logger = logging.getLogger(__name__)
+
+QUEUE = "documents"
+CHUNKS = "chunks.jsonl"
+VECTORS = "vectors.f16"
+META = "meta.json"
+EMBED_BATCH = 64
+# Transcript messages are indexed in batches of at least this many
+TRANSCRIPT_BATCH = 10
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+_WORD_RE = re.compile(r"\w+")
+_SPACE_RE = re.compile(r"\s+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he her his i if in into is it its me my no not of on or our "
+    "she so that the their them they this to was we were what when which who will with you your".split()
+)
+
+
+def tokenize(text):
+    return [word for word in _WORD_RE.findall(text.lower()) if word not in STOPWORDS]
+
+
+def index_directory(interaction_id):
+    return os.path.join(settings.RETRIEVAL_INDEX_ROOT, str(interaction_id))
+
+
+def _empty_meta():
+    return {"chunks": 0, "bytes": 0, "dimensions": None, "documents": [], "messages_until": 0}
+
+
+def read_meta(directory):
+    try:
+        with open(os.path.join(directory, META), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return _empty_meta()
+
+
+def _write_meta(directory, meta):
+    path = os.path.join(directory, META)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(f"{path}.tmp", path)
+
+
+# Chunking
+
+def chunk_text(pieces, size=None, overlap=None):
+    """
+    Split text arriving in `pieces` into chunks of about `size` characters,
+    each repeating the last `overlap` characters of the one before, broken
+    at spaces. Only a chunk's worth of text is held at a time.
+    """
+    size = size or settings.RETRIEVAL_CHUNK_TOKENS * CHARS_PER_TOKEN
+    overlap = min(settings.RETRIEVAL_CHUNK_OVERLAP_TOKENS * CHARS_PER_TOKEN if overlap is None else overlap, size // 4)
+    buffer = ""
+    carried = 0
+    for piece in pieces:
+        buffer += _SPACE_RE.sub(" ", piece)
+        while len(buffer) > size:
+            cut = buffer.rfind(" ", size // 2, size)
+            if cut == -1:
+                cut = size
+            chunk = buffer[:cut].strip()
+            if chunk:
+                yield chunk
+            start = buffer.find(" ", cut - overlap, cut)
+            start = cut if start == -1 else start + 1
+            carried = cut - start
+            buffer = buffer[start:]
+    tail = buffer.strip()
+    if len(tail) > carried:
+        yield tail
+
+
+def _text_pieces(document):
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    with document.text_file.open("rb") as source:
+        while data := source.read(64 * 1024):
+            yield decoder.decode(data)
+    yield decoder.decode(b"", final=True)
+
+
+def _speaker(message):
+    return "Client" if message.role == "user" else "Assistant"
+
+
+def _transcript_chunks(messages):
+    """
+    (source, text) chunks of consecutive messages, each source recording the
+    positions it covers.
+    """
+    size = settings.RETRIEVAL_CHUNK_TOKENS * CHARS_PER_TOKEN
+    lines, first, length = [], None, 0
+    for message in messages:
+        text = message.text.strip()
+        if not text:
+            continue
+        line = f"{_speaker(message)}: {text}"
+        if lines and length + len(line) > size:
+            yield {"messages": [first, message.position - 1]}, "\n".join(lines)
+            lines, first, length = [], None, 0
+        if len(line) > size:
+            for chunk in chunk_text([line]):
+                yield {"messages": [message.position, message.position]}, chunk
+            continue
+        if first is None:
+            first = message.position
+        lines.append(line)
+        length += len(line)
+    if lines:
+        yield {"messages": [first, messages[-1].position]}, "\n".join(lines)
+
+
+# Writing
+
+def _embed_batch(texts, task_type):
+    response = get_client().models.embed_content(
+        model=settings.RETRIEVAL_EMBEDDING_MODEL,
+        contents=list(texts),
+        config={
+            "task_type": task_type,
+            "output_dimensionality": settings.RETRIEVAL_EMBEDDING_DIMENSIONS,
+            "http_options": request_options("default"),
+        },
+    )
+    vectors = np.asarray([embedding.values for embedding in response.embeddings], dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.where(norms == 0, 1, norms)).astype(np.float16)
+
+
+@contextmanager
+def _locked(directory):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _append(directory, meta, entries):
+    """
+    Append (source, text) entries, embedding them in batches if enabled, and
+    return the meta to publish. The caller holds the lock.
+    """
+    chunks_path = os.path.join(directory, CHUNKS)
+    vectors_path = os.path.join(directory, VECTORS)
+    meta = dict(meta)
+    embed = settings.RETRIEVAL_EMBEDDINGS and (meta["chunks"] == 0 or meta["dimensions"])
+    with open(chunks_path, "ab") as chunks_file, (open(vectors_path, "ab") if embed else _nothing()) as vectors_file:
+        # Anything past the published counts is a partial append by a writer that died
+        chunks_file.truncate(meta["bytes"])
+        if vectors_file is not None:
+            vectors_file.truncate(meta["chunks"] * (meta["dimensions"] or 0) * 2)
+        batch = []
+        for entry in entries:
+            batch.append(entry)
+            if len(batch) >= EMBED_BATCH:
+                _write_batch(meta, batch, chunks_file, vectors_file)
+                batch = []
+        if batch:
+            _write_batch(meta, batch, chunks_file, vectors_file)
+        chunks_file.flush()
+        os.fsync(chunks_file.fileno())
+        if vectors_file is not None:
+            vectors_file.flush()
+            os.fsync(vectors_file.fileno())
+    return meta
+
+
+@contextmanager
+def _nothing():
+    yield None
+
+
+def _write_batch(meta, batch, chunks_file, vectors_file):
+    if vectors_file is not None:
+        vectors = _embed_batch([text for _, text in batch], "RETRIEVAL_DOCUMENT")
+        if meta["dimensions"] and vectors.shape[1] != meta["dimensions"]:
+            raise ValueError(f"Embeddings have {vectors.shape[1]} dimensions, the index {meta['dimensions']}")
+        meta["dimensions"] = int(vectors.shape[1])
+        vectors_file.write(vectors.tobytes())
+    for source, text in batch:
+        line = (json.dumps({"source": source, "text": text}) + "\n").encode("utf-8")
+        chunks_file.write(line)
+        meta["bytes"] += len(line)
+    meta["chunks"] += len(batch)
+
+
+@task(priority=-3)
+def index_document(document_id):
+    document = Document.objects.filter(id=document_id, status=Document.READY).first()
+    if document is None or not document.text_file:
+        return {"chunks": 0}
+    directory = index_directory(document.interaction_id)
+    with _locked(directory):
+        meta = read_meta(directory)
+        if document.id in meta["documents"]:
+            return {"chunks": 0}
+        source = {"document": document.id, "name": document.file_name}
+        new_meta = _append(directory, meta, ((source, chunk) for chunk in chunk_text(_text_pieces(document))))
+        new_meta["documents"] = meta["documents"] + [document.id]
+        _write_meta(directory, new_meta)
+    return {"chunks": new_meta["chunks"] - meta["chunks"]}
+
+
+@task(priority=-3)
+def index_transcript(interaction_id, until):
+    """
+    Index the interaction's messages before position `until`.
+    """
+    directory = index_directory(interaction_id)
+    with _locked(directory):
+        meta = read_meta(directory)
+        if until <= meta["messages_until"]:
+            return {"chunks": 0}
+        messages = list(Message.objects.filter(
+            interaction_id=interaction_id,
+            position__gte=meta["messages_until"],
+            position__lt=until,
+        ).only("position", "role", "text").order_by("position"))
+        new_meta = _append(directory, meta, _transcript_chunks(messages))
+        new_meta["messages_until"] = until
+        _write_meta(directory, new_meta)
+    return {"chunks": new_meta["chunks"] - meta["chunks"]}
+
+
+def queue_document_indexing(document):
+    if not settings.RETRIEVAL_ENABLED:
+        return None
+    return enqueue(index_document, queue=QUEUE, document_id=document.id, idempotency_key=f"retrieval-document:{document.id}")
+
+
+# Searching
+
+@dataclass
+class Passage:
+    source: dict
+    text: str
+    score: float
+
+    @property
+    def label(self):
+        if "document" in self.source:
+            return f"Document: {self.source.get('name') or self.source['document']}"
+        return "Earlier in this conversation"
+
+
+class LoadedIndex:
+    """
+    An interaction's index as read so far: chunk texts and sources, BM25
+    postings, and the memory-mapped embeddings.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.offset = 0
+        self.sources = []
+        self.texts = []
+        self.lengths = []
+        # term -> ([chunk indexes], [term frequencies])
+        self.postings = defaultdict(lambda: ([], []))
+        self.vectors = None
+
+    def refresh(self, meta):
+        if meta["bytes"] > self.offset:
+            with open(os.path.join(self.directory, CHUNKS), "rb") as f:
+                f.seek(self.offset)
+                data = f.read(meta["bytes"] - self.offset)
+            for line in data.splitlines():
+                record = json.loads(line)
+                index = len(self.texts)
+                terms = Counter(tokenize(record["text"]))
+                for term, count in terms.items():
+                    chunk_indexes, frequencies = self.postings[term]
+                    chunk_indexes.append(index)
+                    frequencies.append(count)
+                self.sources.append(record["source"])
+                self.texts.append(record["text"])
+                self.lengths.append(sum(terms.values()))
+            self.offset = meta["bytes"]
+        count, dimensions = len(self.texts), meta.get("dimensions")
+        if not dimensions or not count:
+            self.vectors = None
+        elif self.vectors is None or len(self.vectors) != count:
+            path = os.path.join(self.directory, VECTORS)
+            # Chunks indexed while embeddings were off have none
+            if os.path.exists(path) and os.path.getsize(path) >= count * dimensions * 2:
+                self.vectors = np.memmap(path, dtype=np.float16, mode="r", shape=(count, dimensions))
+            else:
+                self.vectors = None
+
+    def bm25(self, terms):
+        count = len(self.texts)
+        scores = np.zeros(count, dtype=np.float32)
+        if not count:
+            return scores
+        lengths = np.asarray(self.lengths, dtype=np.float32)
+        average = max(float(lengths.mean()), 1.0)
+        for term in set(terms):
+            if term not in self.postings:
+                continue
+            chunk_indexes, frequencies = self.postings[term]
+            indexes = np.asarray(chunk_indexes)
+            tf = np.asarray(frequencies, dtype=np.float32)
+            idf = math.log(1 + (count - len(indexes) + 0.5) / (len(indexes) + 0.5))
+            scores[indexes] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * lengths[indexes] / average))
+        return scores
+
+    def search(self, query, query_vector=None, limit=None, allowed=None):
+        """
+        Passages for `query`, best first. `allowed(source)` filters them.
+        """
+        scores = self.bm25(tokenize(query))
+        relevant = scores > 0
+        if scores.any():
+            scores = scores / scores.max()
+        if query_vector is not None and self.vectors is not None and len(query_vector) == self.vectors.shape[1]:
+            similarities = np.asarray(self.vectors, dtype=np.float32) @ query_vector
+            relevant |= similarities >= settings.RETRIEVAL_MIN_SIMILARITY
+            scores = scores + np.clip(similarities, 0, None)
+        passages = []
+        for index in np.argsort(-scores, kind="stable"):
+            if not relevant[index]:
+                continue
+            source = self.sources[index]
+            if allowed is not None and not allowed(source):
+                continue
+            passages.append(Passage(source, self.texts[index], float(scores[index])))
+            if limit is not None and len(passages) >= limit:
+                break
+        return passages
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def load_index(interaction_id):
+    """
+    The interaction's index, brought up to date, or None if it has none.
+    """
+    directory = index_directory(interaction_id)
+    meta = read_meta(directory)
+    if not meta["chunks"]:
+        return None
+    with _indexes_lock:
+        index = _indexes.get(directory)
+        if index is None:
+            index = _indexes[directory] = LoadedIndex(directory)
+        _indexes.move_to_end(directory)
+        while len(_indexes) > settings.RETRIEVAL_CACHED_INDEXES:
+            _indexes.popitem(last=False)
+    with index.lock:
+        index.refresh(meta)
+    return index
+
+
+def _select(passages, top_k, max_tokens):
+    selected, tokens = [], 0
+    for passage in passages:
+        cost = estimate_tokens(passage.text)
+        if tokens + cost > max_tokens:
+            continue
+        selected.append(passage)
+        tokens += cost
+        if len(selected) >= top_k:
+            break
+    return selected
+
+
+def search(interaction_id, query, query_vector=None, before=None, document_ids=None):
+    """
+    The top passages of the interaction for `query`, skipping transcript
+    chunks from position `before` on and documents not in `document_ids`.
+    """
+    index = load_index(interaction_id)
+    if index is None:
+        return []
+
+    def allowed(source):
+        if "messages" in source:
+            return before is None or source["messages"][1] < before
+        return document_ids is None or source.get("document") in document_ids
+
+    with index.lock:
+        passages = index.search(query, query_vector, limit=settings.RETRIEVAL_TOP_K * 4, allowed=allowed)
+    return _select(passages, settings.RETRIEVAL_TOP_K, settings.RETRIEVAL_MAX_TOKENS)
+
+
+async def _embed_query(query):
+    try:
+        response = await get_client().aio.models.embed_content(
+            model=settings.RETRIEVAL_EMBEDDING_MODEL,
+            contents=query,
+            config={
+                "task_type": "RETRIEVAL_QUERY",
+                "output_dimensionality": settings.RETRIEVAL_EMBEDDING_DIMENSIONS,
+                "http_options": request_options("classify"),
+            },
+        )
+        vector = np.asarray(response.embeddings[0].values, dtype=np.float32)
+    except Exception as e:
+        logger.warning("Embedding for retrieval failed, ranking by BM25 only: %s", e)
+        return None
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else None
+
+
+async def aretrieve(interaction_id, query, before):
+    """
+    Passages to ground a turn of the interaction with. Messages before
+    position `before` are no longer replayed, so they are queued for
+    indexing once enough have piled up.
+    """
+    if not settings.RETRIEVAL_ENABLED:
+        return []
+    directory = index_directory(interaction_id)
+    meta = await sync_to_async(read_meta, thread_sensitive=False)(directory)
+    if before - meta["messages_until"] >= TRANSCRIPT_BATCH:
+        await aenqueue(
+            index_transcript,
+            queue=QUEUE,
+            interaction_id=interaction_id,
+            until=before,
+            idempotency_key=f"retrieval-transcript:{interaction_id}:{before}",
+        )
+    if not meta["chunks"]:
+        return []
+    query_vector = await _embed_query(query) if meta["dimensions"] else None
+    document_ids = None
+    if meta["documents"]:
+        # Deleted documents stay in the index but aren't used
+        document_ids = {document_id async for document_id in Document.objects.filter(interaction_id=interaction_id).values_list("id", flat=True)}
+    return await sync_to_async(search, thread_sensitive=False)(interaction_id, query, query_vector, before, document_ids)
+
+
+def grounded_prompt(prompt, passages):
+    """
+    The client's message preceded by the retrieved passages.
+    """
+    if not passages:
+        return prompt
+    excerpts = "\n\n".join(f"[{passage.label}]\n{passage.text}" for passage in passages)
+    return (
+        "Excerpts from the client's documents and earlier conversation that may be relevant to their message. "
+        "Use them only where they are relevant, and do not quote them back unprompted.\n\n"
+        f"{excerpts}\n\nClient's message: {prompt}"
+    )
@@ -0,0 +1,216 @@
+"""
+Full-text search over interaction conversations.
+
+On PostgreSQL each interaction's conversation is kept as a tsvector in
+InteractionSearch, behind a GIN index, so a search is an index lookup instead
+of a scan of every message. append_messages() folds a turn's new messages into
+the vector as it stores them (aindex_messages()); a failure there is logged
+and repaired on the next turn, never failing the turn itself.
+`manage.py rebuild_search_index` builds vectors from the stored messages, e.g.
+for interactions from before the index existed.
+
+Queries use web search syntax ("quoted phrases", or, -word) in the
+SEARCH_CONFIG text search configuration and are ranked with ts_rank_cd.
+Other databases (SQLite in development) keep no index and fall back to
+matching every word of the query against the message text, newest first.
+asearch_interactions() backs api/search/, the admin's interaction search, the
+attorney search route in analytics.py and the SQL agent's search tool.
+"""
+import logging
+import re
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector, SearchVectorField
+from django.db import connection
+from django.db.models import Exists, F, FloatField, OuterRef, Q, Value
+from django.db.models.expressions import CombinedExpression
+from django.utils import timezone
+
+from .models import Interaction, InteractionSearch, Message
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r"\w+")
+SNIPPET_CONTEXT = 80
+
+
+def full_text_supported():
+    return connection.vendor == "postgresql"
+
+
+def _vector(text):
+    return SearchVector(Value(text), config=settings.SEARCH_CONFIG)
+
+
+def search_query(query):
+    return SearchQuery(query, search_type="websearch", config=settings.SEARCH_CONFIG)
+
+
+def _words(query):
+    return [word for word in WORD_RE.findall(query) if word.lower() != "or"]
+
+
+def matching_filter(query):
+    """
+    Q selecting the interactions whose conversation matches `query`.
+    """
+    if full_text_supported():
+        return Q(search__vector=search_query(query))
+    condition = Q()
+    for word in _words(query):
+        condition &= Exists(Message.objects.filter(interaction=OuterRef("pk"), text__icontains=word))
+    return condition
+
+
+async def aindex_messages(interaction_id, start, messages):
+    """
+    Fold `messages`, stored from position `start` on, into the interaction's
+    vector. A vector that isn't exactly up to `start` is rebuilt instead.
+    """
+    if not full_text_supported():
+        return
+    try:
+        text = "\n".join(message.text for message in messages)
+        updated = await InteractionSearch.objects.filter(interaction_id=interaction_id, indexed_until=start).aupdate(
+            vector=CombinedExpression(F("vector"), "||", _vector(text), output_field=SearchVectorField()),
+            indexed_until=start + len(messages),
+        )
+        if not updated:
+            await arebuild(interaction_id)
+    except Exception as e:
+        # The vector stays behind, so the next turn rebuilds it
+        logger.exception("Error indexing interaction %s for search: %s", interaction_id, e)
+
+
+async def arebuild(interaction_id):
+    """
+    Build the interaction's vector from all of its stored messages.
+    """
+    if not full_text_supported():
+        return
+    texts, until = [], 0
+    async for position, text in Message.objects.filter(interaction_id=interaction_id).order_by("position").values_list("position", "text"):
+        texts.append(text)
+        until = position + 1
+    await InteractionSearch.objects.aupdate_or_create(
+        interaction_id=interaction_id,
+        defaults={"vector": _vector("\n".join(texts)), "indexed_until": until},
+    )
+
+
+def rebuild(interaction_id):
+    return async_to_sync(arebuild)(interaction_id)
+
+
+def matching_interactions(query, department=None, since=None):
+    """
+    Interactions whose conversation matches `query`, best first, with
+    their `rank` (0 without full-text search).
+    """
+    interactions = Interaction.objects.filter(matching_filter(query))
+    if department is not None:
+        interactions = interactions.filter(department=department)
+    if since is not None:
+        interactions = interactions.filter(created_at__gte=since)
+    if not full_text_supported():
+        return interactions.annotate(rank=Value(0.0, output_field=FloatField())).order_by("-created_at")
+    return interactions.annotate(
+        rank=SearchRank(F("search__vector"), search_query(query), cover_density=True),
+    ).order_by("-rank", "-created_at")
+
+
+def _excerpt(text, word):
+    start = text.lower().find(word.lower())
+    if start < 0:
+        return text[:2 * SNIPPET_CONTEXT]
+    end = start + len(word)
+    prefix = "..." if start > SNIPPET_CONTEXT else ""
+    suffix = "..." if end + SNIPPET_CONTEXT < len(text) else ""
+    return (
+        f"{prefix}{text[max(start - SNIPPET_CONTEXT, 0):start]}**{text[start:end]}**"
+        f"{text[end:end + SNIPPET_CONTEXT]}{suffix}"
+    )
+
+
+async def _snippets(query, interaction_ids):
+    """
+    (position, highlighted excerpt) of the first matching message of each
+    interaction.
+    """
+    if not full_text_supported():
+        words = _words(query)
+        if not words:
+            return {}
+        snippets = {}
+        messages = (
+            Message.objects.filter(interaction_id__in=interaction_ids, text__icontains=words[0])
+            .order_by("interaction_id", "position")
+            .values_list("interaction_id", "position", "text")
+        )
+        async for interaction_id, position, text in messages:
+            if interaction_id not in snippets:
+                snippets[interaction_id] = (position, _excerpt(text, words[0]))
+        return snippets
+    parsed = search_query(query)
+    text = F("text")
+    messages = (
+        Message.objects.filter(interaction_id__in=interaction_ids)
+        .annotate(matched=SearchVector(text, config=settings.SEARCH_CONFIG))
+        .filter(matched=parsed)
+        .annotate(snippet=SearchHeadline(
+            text, parsed,
+            config=settings.SEARCH_CONFIG,
+            start_sel="**", stop_sel="**",
+            max_words=30, min_words=10, max_fragments=2,
+        ))
+        .order_by("interaction_id", "position")
+        .distinct("interaction_id")
+        .values_list("interaction_id", "position", "snippet")
+    )
+    return {interaction_id: (position, snippet) async for interaction_id, position, snippet in messages}
+
+
+async def asearch_interactions(query, department=None, since=None, limit=20):
+    """
+    The best `limit` interactions for `query`, as dicts with a highlighted
+    excerpt of the first message that matched.
+    """
+    limit = min(limit, settings.SEARCH_MAX_RESULTS)
+    interactions = matching_interactions(query, department=department, since=since).select_related("client", "department").only(
+        "id", "title", "created_at", "client__name", "department__name",
+    )
+    found = [interaction async for interaction in interactions[:limit]]
+    snippets = await _snippets(query, [interaction.id for interaction in found]) if found else {}
+    results = []
+    for interaction in found:
+        position, snippet = snippets.get(interaction.id, (None, ""))
+        results.append({
+            "interaction_id": interaction.id,
+            "client": interaction.client.name if interaction.client else None,
+            "department": interaction.department.name if interaction.department else None,
+            "title": interaction.title,
+            "created_at": interaction.created_at,
+            "rank": round(interaction.rank, 4),
+            "position": position,
+            "snippet": snippet,
+        })
+    return results
+
+
+def search_interactions(query, department=None, since=None, limit=20):
+    return async_to_sync(asearch_interactions)(query, department=department, since=since, limit=limit)
+
+
+def format_results(query, results):
+    """
+    Plain-text list of search results, for attorneys and the SQL agent.
+    """
+    if not results:
+        return f'No conversations mention "{query}".'
+    lines = [
+        f"- Interaction {result['interaction_id']} ({result['client'] or 'No client'}, {result['department'] or 'Unassigned'}, "
+        f"{timezone.localtime(result['created_at']):%Y-%m-%d}): {result['snippet']}"
+        for result in results
+    ]
+    return f'Conversations mentioning "{query}", best match first:\n' + "\n".join(lines)
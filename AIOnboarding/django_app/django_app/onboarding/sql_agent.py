@@ -0,0 +1,139 @@
+"""
+Process-wide SQL agent for the attorney path.
+
+The SQLAlchemy engine, the reflected SQLDatabase and the LangChain agent are
+built once and reused by every attorney question. The reflected schema is
+tied to the latest applied Django migration and rebuilt when that changes,
+whether the migration ran in this process or another one.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from langchain_community.agent_toolkits import create_sql_agent
+from langchain_community.utilities import SQLDatabase
+from langchain_core.tools import tool
+from langchain_google_genai import ChatGoogleGenerativeAI
+from sqlalchemy import create_engine, text
+
+from .api import api_key
+from .orchestration import get_executor
+from .search import format_results, search_interactions
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_engine = None
+_agent = None
+_schema_version = None
+
+
+def database_url():
+    # Get Django database configuration
+    db_config = settings.DATABASES['default']
+    db_engine = db_config['ENGINE']
+
+    # Build SQLAlchemy connection string based on database type
+    if 'sqlite' in db_engine:
+        # SQLite
+        return f"sqlite:///{db_config['NAME']}"
+    elif 'postgresql' in db_engine:
+        # PostgreSQL
+        return f"postgresql://{db_config['USER']}:{db_config['PASSWORD']}@{db_config['HOST']}:{db_config['PORT']}/{db_config['NAME']}"
+    elif 'mysql' in db_engine:
+        # MySQL
+        return f"mysql+pymysql://{db_config['USER']}:{db_config['PASSWORD']}@{db_config['HOST']}:{db_config['PORT']}/{db_config['NAME']}"
+    raise ValueError(f"Unsupported database engine: {db_engine}")
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                url = database_url()
+                options = {"pool_pre_ping": True}
+                if not url.startswith("sqlite"):
+                    options.update(
+                        pool_size=settings.SQL_AGENT_POOL_SIZE,
+                        max_overflow=settings.SQL_AGENT_MAX_OVERFLOW,
+                        pool_recycle=settings.SQL_AGENT_POOL_RECYCLE,
+                    )
+                _engine = create_engine(url, **options)
+    return _engine
+
+
+def schema_version():
+    """
+    ID of the latest applied migration; changes whenever the schema does.
+    """
+    with get_engine().connect() as conn:
+        return conn.execute(text("SELECT MAX(id) FROM django_migrations")).scalar()
+
+
+@tool
+def search_conversations(query: str) -> str:
+    """
+    Full-text search of what was said in client interactions. Use this, not
+    LIKE or ILIKE over message text, to find interactions that mention
+    something. The input is search words; "quoted phrases", "or" and -word
+    work. Returns interaction IDs, client, department, date and a matching
+    excerpt, best match first.
+    """
+    return format_results(query, search_interactions(query))
+
+
+def _build_agent():
+    # "gemini-2.5-flash" for fast responses with tool calling
+    llm = ChatGoogleGenerativeAI(
+        model="gemini-2.5-flash",
+        temperature=0,
+        google_api_key=api_key()
+    )
+    # SQLDatabase reflects the schema here, once per schema version
+    db = SQLDatabase(engine=get_engine())
+    return create_sql_agent(
+        llm=llm,
+        db=db,
+        agent_type="openai-tools",  # This agent type works well with Gemini's tool calling
+        # Conversation text is searched through the full-text index
+        extra_tools=[search_conversations],
+        verbose=True
+    )
+
+
+def get_agent():
+    global _agent, _schema_version
+    version = schema_version()
+    if _agent is None or version != _schema_version:
+        with _lock:
+            if _agent is None or version != _schema_version:
+                _agent = _build_agent()
+                _schema_version = version
+    return _agent
+
+
+def invalidate(**kwargs):
+    """
+    Drop the cached agent and reflected schema. Connected to post_migrate.
+    """
+    global _agent, _schema_version
+    with _lock:
+        _agent = None
+        _schema_version = None
+
+
+def warm_up():
+    try:
+        get_agent()
+        logger.info("SQL agent ready")
+    except Exception as e:
+        logger.warning("SQL agent warm-up failed: %s", e)
+
+
+def warm_up_in_background():
+    """
+    Build the engine, schema and agent off the startup path so the first
+    attorney question doesn't pay for them.
+    """
+    return get_executor().submit(warm_up)
@@ -0,0 +1,137 @@
+"""
+Incrementally maintained summaries of a client's earlier interactions.
+
+Each ClientSummary remembers the content hash of every interaction folded into
+it, so a refresh only sends Gemini the existing summary plus the interactions
+that are new or changed since the last refresh.
+"""
+import hashlib
+import json
+
+from asgiref.sync import async_to_sync
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from google.genai import types
+
+from .genai_client import get_client, request_options
+from .models import Client, ClientSummary, Interaction, Message
+from .jobs import aenqueue, task
+
+def interaction_hash(interaction):
+    department = interaction.department.name if interaction.department else ""
+    payload = json.dumps([department, interaction.history()], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _unsummarised(summary, exclude_interaction_id=None):
+    """
+    Interactions of the client that may have changed since `summary` was
+    refreshed.
+    """
+    interactions = (
+        Interaction.objects.filter(client_id=summary.client_id)
+        .filter(Exists(Message.objects.filter(interaction=OuterRef("pk"))))
+    )
+    if exclude_interaction_id:
+        interactions = interactions.exclude(id=exclude_interaction_id)
+    if summary.covered_until:
+        known_ids = [int(key) for key in summary.interaction_hashes]
+        interactions = interactions.filter(Q(updated_at__gt=summary.covered_until) | ~Q(id__in=known_ids))
+    return interactions
+
+
+async def _pending_interactions(summary, exclude_interaction_id=None):
+    """
+    Interactions of the client that are not yet folded into `summary`, along
+    with their content hashes.
+    """
+    interactions = (
+        _unsummarised(summary, exclude_interaction_id)
+        .select_related("department")
+        .prefetch_related("messages")
+        .order_by("created_at")
+    )
+    pending = []
+    async for interaction in interactions:
+        content_hash = interaction_hash(interaction)
+        if summary.interaction_hashes.get(str(interaction.id)) != content_hash:
+            pending.append((interaction, content_hash))
+    return pending
+
+
+async def _summarize(previous_summary, interactions):
+    temp = ""
+    for interaction in interactions:
+        temp += f"\nPrevious interaction this client had with {interaction.department.name if interaction.department else 'The system'}: {interaction.history()}"
+    if previous_summary:
+        summary_prompt = (
+            "Please update this summary of previous AI onboarding conversations with the conversations below. "
+            "The response should be in paragraph form retaining relevant legal facts."
+            f"\nCurrent summary: {previous_summary}\nNew conversations: {temp}"
+        )
+    else:
+        summary_prompt = f"Please provide a summary of these previous AI onboarding conversations. The response should be in paragraph form retaining relevant legal facts: {temp}"
+    response = await get_client().aio.models.generate_content(
+        model="gemini-2.5-flash",
+        contents=summary_prompt,
+        config=types.GenerateContentConfig(http_options=request_options("summary")),
+    )
+    return response.text
+
+
+async def arefresh_client_summary(client_id, exclude_interaction_id=None):
+    """
+    Fold the client's unsummarised interactions into their ClientSummary and
+    return it. Only calls Gemini when something new needs summarising.
+    """
+    summary, _ = await ClientSummary.objects.aget_or_create(client_id=client_id)
+    covered_until = timezone.now()
+    pending = await _pending_interactions(summary, exclude_interaction_id)
+    if pending:
+        summary.summary = await _summarize(summary.summary, [interaction for interaction, _ in pending])
+        for interaction, content_hash in pending:
+            summary.interaction_hashes[str(interaction.id)] = content_hash
+    # Saved even when nothing changed, so interactions that were only
+    # touched aren't checked again by the next one
+    summary.covered_until = covered_until
+    await summary.asave()
+    return summary
+
+
+def refresh_client_summary(client_id, exclude_interaction_id=None):
+    return async_to_sync(arefresh_client_summary)(client_id, exclude_interaction_id)
+
+
+@task(priority=-1)
+async def refresh_client_summary_job(client_id):
+    if not await Client.objects.filter(id=client_id).aexists():
+        # The client was deleted after the job was queued
+        return {"interactions": 0}
+    summary = await arefresh_client_summary(client_id)
+    return {"interactions": len(summary.interaction_hashes)}
+
+
+async def aclient_summary(client_id, exclude_interaction_id=None):
+    """
+    The client's summary for the start of a new interaction. Usually the
+    stored one, refreshed when their last interaction ended; if interactions
+    are missing from it (or there is none yet, e.g. for clients from before
+    summaries were stored) the refresh is awaited instead, so the interaction
+    never starts from a stale summary.
+    """
+    summary = await ClientSummary.objects.filter(client_id=client_id).afirst()
+    if summary is None or await _unsummarised(summary, exclude_interaction_id).aexists():
+        summary = await arefresh_client_summary(client_id, exclude_interaction_id)
+    return summary.summary
+
+
+async def aqueue_client_summary_refresh(client_id, interaction_id):
+    """
+    Queue a refresh once an interaction has ended, so the client's next
+    interaction finds an up-to-date summary. Queued once per interaction.
+    """
+    return await aenqueue(
+        refresh_client_summary_job,
+        client_id=client_id,
+        idempotency_key=f"client-summary:{client_id}:{interaction_id}",
+    )
@@ -0,0 +1,226 @@
+"""
+Synthetic client intakes for load-testing.
+
+Each simulated conversation is one job on the job queue, keyed by its run
+name and index ("synthetic:<run>:<index>"), so generating N interactions runs
+them concurrently on the workers' thread pools, each on an event loop and
+Gemini client of its own (see jobs.run). Enqueueing the same run again
+resumes it: finished conversations are skipped and failed ones are retried.
+A failed attempt deletes its partial interaction before the retry starts.
+
+The client side is played either by Gemini (SimulatedClient) or, for
+offline runs, by a deterministic script seeded from the run and index
+(ScriptedClient). The assistant side always goes through the normal turn
+path, agemini_prompt.
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+
+from django.db import transaction
+from django.db.models import Count
+from google.genai import types
+
+from .departments import aget_catalog
+from .gemini import InteractionCompleted, agemini_prompt
+from .genai_client import get_client, request_options
+from .jobs import enqueue, task
+from .models import Interaction, Job
+
+PERSONA_INSTRUCTION = (
+    "You are role-playing as a lawfirm client that is seeking legal advice. Provide information about your "
+    "legal issue as prompted by a legal assistant. Please provide realistic legal issues, but one that straddles "
+    "the line between two or more legal areas, and respond to the legal assistant's questions accordingly."
+)
+
+FIRST_NAMES = ["Avery", "Jordan", "Morgan", "Riley", "Casey", "Quinn", "Harper", "Rowan", "Elliot", "Sasha"]
+LAST_NAMES = ["Okafor", "Lindqvist", "Moreau", "Tanaka", "Castillo", "Brennan", "Novak", "Adeyemi", "Hale", "Serrano"]
+DETAILS = [
+    "It started about six months ago and has been getting worse.",
+    "The other party has stopped answering my emails.",
+    "I have a written contract, but some of it was agreed verbally.",
+    "There is a deadline coming up in the next few weeks.",
+    "Several other people are affected in the same way.",
+    "I already tried to settle this informally and it didn't work.",
+    "I'm worried about what this will cost me if it goes to court.",
+]
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class RateLimiter:
+    """
+    Spaces calls to acquire() at most `rate` per second, across every thread
+    of the process.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    async def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+def rate_limiter(rate):
+    """
+    The process-wide limiter for `rate` turns per second, or None for no limit.
+    """
+    if not rate or rate <= 0:
+        return None
+    with _limiters_lock:
+        limiter = _limiters.get(rate)
+        if limiter is None:
+            limiter = _limiters[rate] = RateLimiter(rate)
+    return limiter
+
+
+class SimulatedClient:
+    """
+    A client played by Gemini.
+    """
+
+    def __init__(self):
+        self.chat = get_client().aio.chats.create(
+            model="gemini-2.5-flash",
+            config=types.GenerateContentConfig(
+                system_instruction=PERSONA_INSTRUCTION,
+                http_options=request_options("default"),
+            ),
+        )
+
+    async def start(self):
+        response = await self.chat.send_message("Please provide a very unique name, email, and password to get started.")
+        return response.text
+
+    async def respond(self, reply):
+        response = await self.chat.send_message(reply)
+        return response.text
+
+    async def finished(self):
+        response = await get_client().aio.models.generate_content(
+            model="gemini-2.5-flash",
+            contents=self.chat.get_history(),
+            config={
+                "response_mime_type": "application/json",
+                "response_json_schema": InteractionCompleted.model_json_schema(),
+                "http_options": request_options("classify"),
+            },
+        )
+        return bool(json.loads(response.text).get("completed"))
+
+
+class ScriptedClient:
+    """
+    A client whose messages are picked from fixed lists by a generator seeded
+    from `run` and `index`, so the same run always produces the same intakes.
+    """
+
+    def __init__(self, run, index, max_turns):
+        self.rng = random.Random(f"{run}:{index}")
+        first, last = self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+        self.name = f"{first} {last}"
+        self.email = f"{first}.{last}.{run}.{index}@example.com".lower().replace(" ", "-")
+        self.password = f"synthetic-{self.rng.getrandbits(48):012x}"
+        self.turns = self.rng.randint(min(3, max_turns), max_turns)
+        self.sent = 0
+
+    async def start(self):
+        names = sorted((await aget_catalog()).names)
+        departments = self.rng.sample(names, min(2, len(names)))
+        matter = f" I need help from {departments[0]}." if departments else ""
+        if len(departments) > 1:
+            matter += f" It may also involve {departments[1]}."
+        self.sent = 1
+        return (
+            f"Hi, my name is {self.name}. My email is {self.email} and my password is {self.password}.{matter} "
+            f"{self.rng.choice(DETAILS)}"
+        )
+
+    async def respond(self, reply):
+        self.sent += 1
+        if self.sent >= self.turns:
+            return "Thank you for your help, goodbye."
+        return self.rng.choice(DETAILS)
+
+    async def finished(self):
+        return self.sent >= self.turns
+
+
+@task(priority=-5)
+async def generate_interaction(run, index, max_turns=10, scripted=False, rate=0):
+    """
+    Play one synthetic intake against the assistant and return its summary.
+    """
+    client = ScriptedClient(run, index, max_turns) if scripted else SimulatedClient()
+    limiter = rate_limiter(rate)
+    interaction = await Interaction.objects.acreate()
+    turns = 0
+    completed = False
+    try:
+        message = await client.start()
+        while not completed and turns < max_turns:
+            turns += 1
+            if limiter:
+                await limiter.acquire()
+            reply = await agemini_prompt(message, interaction_id=interaction.id)
+            message = await client.respond(reply)
+            completed = await client.finished()
+    except Exception:
+        # A retry starts the conversation over, so drop the partial one
+        await Interaction.objects.filter(id=interaction.id).adelete()
+        raise
+    return {
+        "interaction_id": interaction.id,
+        "completed": completed,
+        "turns": turns,
+    }
+
+
+def run_key(run, index):
+    return f"synthetic:{run}:{index}"
+
+
+def run_jobs(run):
+    return Job.objects.filter(idempotency_key__startswith=run_key(run, ""))
+
+
+def enqueue_run(run, count, *, max_turns=10, scripted=False, rate=0, queue="synthetic"):
+    """
+    Queue conversations 0..count-1 of `run`. Returns how many of them were
+    still to do (queued, running, or failed and queued again).
+    """
+    pending = 0
+    with transaction.atomic():
+        for index in range(count):
+            job = enqueue(
+                generate_interaction,
+                queue=queue,
+                idempotency_key=run_key(run, index),
+                run=run,
+                index=index,
+                max_turns=max_turns,
+                scripted=scripted,
+                rate=rate,
+            )
+            pending += not job.done
+    return pending
+
+
+def run_progress(run):
+    """
+    Job counts of `run` by status.
+    """
+    counts = dict(run_jobs(run).order_by().values_list("status").annotate(count=Count("id")))
+    progress = {status: counts.get(status, 0) for status, _ in Job.STATUS_CHOICES}
+    progress["total"] = sum(counts.values())
+    return progress
@@ -1,3 +1,549 @@
-from django.test import TestCase
+import asyncio
+import inspect
+import json
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.urls import reverse
+from django.utils import timezone
+
+from . import context_cache, gemini, genai_client, jobs, search, summaries, synthetic, views
+from .benchmarks.harness import stub_backend
+from .benchmarks.suite import failed_requests
+from .credentials import is_hashed
+from .jobs import task
+from .llm import StubBackend, set_backend
+from .llm_stub import StubGenaiClient
+from .models import Client, ClientSummary, GeminiContextCache, Interaction, Job, Message, MessageRequest
+from .pagination import keyset_paginate
+from .response_cache import attorney_cache
+
+LOGIN = "Hi, my name is Test. My email is test@example.com and my password is secret."
+
+
+@task(max_attempts=2)
+def failing_task():
+    raise ValueError("always fails")
+
+
+@task(max_attempts=1)
+async def ask_gemini():
+    response = await genai_client.get_client().aio.models.generate_content(model="gemini-2.5-flash", contents="Hello")
+    return response.text
+
+
+def add_messages(interaction, *texts):
+    for position, text in enumerate(texts):
+        role = "user" if position % 2 == 0 else "model"
+        parts = [{"text": text}] if text else []
+        Message.from_content(interaction, position, {"role": role, "parts": parts}).save()
+
+
+class LoopBoundClient:
+    """
+    A StubGenaiClient whose async calls fail on any event loop but the one
+    they were first made on, like the connection pool of a real client.
+    """
+
+    def __init__(self):
+        self.stub = StubGenaiClient()
+        self.loop = None
+        self.aio = _LoopBound(self, self.stub.aio)
+
+    def __getattr__(self, name):
+        return getattr(self.stub, name)
+
+    def check_loop(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is None:
+            self.loop = loop
+        elif loop is not self.loop:
+            raise RuntimeError("got Future attached to a different loop")
+
+
+class _LoopBound:
+    def __init__(self, client, target):
+        self._client = client
+        self._target = target
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if inspect.iscoroutinefunction(value):
+            async def checked(*args, **kwargs):
+                self._client.check_loop()
+                return await value(*args, **kwargs)
+            return checked
+        if callable(value):
+            return lambda *args, **kwargs: self._wrap(value(*args, **kwargs))
+        return self._wrap(value)
+
+    def _wrap(self, value):
+        if isinstance(value, (int, float, str, list, dict, type(None))):
+            return value
+        return _LoopBound(self._client, value)
+
+
+class LoopBoundBackend(StubBackend):
+    """
+    The stub backend with LoopBoundClients: a new one per build_client()
+    like the Gemini backend, or with `shared`, one for every caller.
+    """
+
+    def __init__(self, shared=False):
+        super().__init__(latency=0, token_latency=0)
+        self.shared = shared
+        self.built = []
+
+    def build_client(self):
+        if self.shared and self.built:
+            return self.built[0]
+        self.built.append(LoopBoundClient())
+        return self.built[-1]
+
+
+class GeminiClientTests(SimpleTestCase):
+    @override_settings(GEMINI_MAX_CONNECTIONS=7, GEMINI_MAX_KEEPALIVE_CONNECTIONS=3)
+    def test_connection_limits_reach_the_async_transport(self):
+        with mock.patch.object(genai_client, "api_key", return_value="test-key"):
+            client = genai_client.build_client()
+        api_client = client._api_client
+        # aiohttp would bypass the limits
+        self.assertFalse(api_client._use_aiohttp())
+        pool = api_client._async_httpx_client._transport._pool
+        self.assertEqual((pool._max_connections, pool._max_keepalive_connections), (7, 3))
+
+    def test_each_event_loop_gets_its_own_client(self):
+        async def clients():
+            return genai_client.get_client(), genai_client.get_client()
+
+        with stub_backend():
+            first, again = async_to_sync(clients)()
+            second, _ = async_to_sync(clients)()
+        self.assertIs(first, again)
+        self.assertIsNot(first, second)
+
+    def test_closed_client_is_rebuilt(self):
+        async def close_and_get():
+            client = genai_client.get_client()
+            await genai_client.aclose_client()
+            return client, genai_client.get_client()
+
+        with stub_backend():
+            closed, rebuilt = async_to_sync(close_and_get)()
+        self.assertIsNot(closed, rebuilt)
+
+
+@override_settings(GEMINI_CONTEXT_CACHE=True, GEMINI_CONTEXT_CACHE_MIN_TOKENS=0)
+class ContextCacheTests(TestCase):
+    model = "gemini-2.5-flash"
+
+    def setUp(self):
+        self.addCleanup(context_cache._retry_after.clear)
+
+    def create(self, key):
+        async_to_sync(context_cache._create)(key, self.model, f"instructions {key}", None, 5000)
+
+    def test_cache_is_created_on_the_requests_loop(self):
+        async def two_turns():
+            self.assertIsNone(await context_cache.cached_content_for(self.model, "instructions"))
+            await asyncio.gather(*context_cache._tasks)
+            return await context_cache.cached_content_for(self.model, "instructions")
+
+        set_backend(LoopBoundBackend(shared=True))
+        self.addCleanup(set_backend, None)
+        self.assertEqual(async_to_sync(two_turns)(), GeminiContextCache.objects.get().name)
+
+    def test_replaced_cache_is_deleted_from_gemini(self):
+        with stub_backend(latency=0) as backend:
+            self.create("a")
+            self.create("a")
+        caches = backend.client.aio.caches
+        self.assertEqual(caches.deleted, 1)
+        self.assertEqual(GeminiContextCache.objects.get(key="a").name, f"cachedContents/stub-{caches.created}")
+
+    def test_expired_caches_are_deleted_from_gemini(self):
+        with stub_backend(latency=0) as backend:
+            self.create("a")
+            GeminiContextCache.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+            self.create("b")
+        self.assertEqual(backend.client.aio.caches.deleted, 1)
+        self.assertEqual(list(GeminiContextCache.objects.values_list("key", flat=True)), ["b"])
+
+
+@override_settings(JOBS_RUN_IN_PROCESS=False)
+class JobTests(TestCase):
+    def after_lease(self):
+        return timezone.now() + timedelta(seconds=settings.JOB_LEASE + 1)
+
+    def test_idempotency_key_queues_once(self):
+        first = jobs.enqueue(failing_task, idempotency_key="once")
+        second = jobs.enqueue(failing_task, idempotency_key="once")
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_failed_job_is_retried_then_failed(self):
+        job = jobs.enqueue(failing_task)
+        [claimed] = jobs.claim("worker", 1)
+        self.assertEqual(jobs.run(claimed), Job.QUEUED)
+        job.refresh_from_db()
+        self.assertGreater(job.run_at, timezone.now())
+        Job.objects.update(run_at=timezone.now())
+        [claimed] = jobs.claim("worker", 1)
+        self.assertEqual(jobs.run(claimed), Job.FAILED)
+        job.refresh_from_db()
+        self.assertIn("always fails", job.last_error)
+
+    def test_stale_job_is_requeued_until_out_of_attempts(self):
+        job = jobs.enqueue(failing_task, max_attempts=1)
+        jobs.claim("worker", 1)
+        jobs._requeue_stale(self.after_lease())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+
+        job = jobs.enqueue(failing_task, max_attempts=2)
+        jobs.claim("worker", 1)
+        jobs._requeue_stale(self.after_lease())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), (Job.QUEUED, ""))
+
+    def test_run_that_lost_its_lease_records_nothing(self):
+        job = jobs.enqueue(failing_task, max_attempts=3)
+        [first] = jobs.claim("first", 1)
+        jobs._requeue_stale(self.after_lease())
+        Job.objects.update(run_at=timezone.now())
+        [second] = jobs.claim("second", 1)
+
+        self.assertIsNone(jobs.run(first))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), (Job.RUNNING, "second"))
+        self.assertEqual(jobs.run(second), Job.QUEUED)
+
+
+# Workers claim jobs with SKIP LOCKED and write from several threads at once
+@skipUnlessDBFeature("has_select_for_update_skip_locked")
+@override_settings(JOBS_RUN_IN_PROCESS=False)
+class WorkerTests(TransactionTestCase):
+    def test_overlapping_async_jobs_each_get_a_client(self):
+        backend = LoopBoundBackend()
+        set_backend(backend)
+        self.addCleanup(set_backend, None)
+        for _ in range(4):
+            jobs.enqueue(ask_gemini)
+
+        jobs.Worker(4, poll_interval=0.01, burst=True, queues=["default"]).run()
+        self.assertEqual(set(Job.objects.values_list("status", flat=True)), {Job.SUCCEEDED})
+        # Every job's client was closed along with its loop
+        self.assertFalse([loop for _, loop in genai_client._clients if loop is not None])
+
+
+@skipUnlessDBFeature("has_select_for_update_skip_locked")
+@override_settings(JOBS_RUN_IN_PROCESS=False)
+class SyntheticTests(TransactionTestCase):
+    def test_simulated_conversations_run_concurrently(self):
+        set_backend(LoopBoundBackend())
+        self.addCleanup(set_backend, None)
+        self.assertEqual(synthetic.enqueue_run("test", 3, max_turns=2, queue="synthetic-test"), 3)
+
+        jobs.Worker(3, poll_interval=0.01, burst=True, queues=["synthetic-test"]).run()
+        progress = synthetic.run_progress("test")
+        self.assertEqual((progress[Job.SUCCEEDED], progress["total"]), (3, 3))
+        self.assertEqual(Interaction.objects.count(), 3)
+
+
+class ClientTurnTests(TestCase):
+    def setUp(self):
+        self.enterContext(stub_backend(latency=0, token_latency=0))
+
+    def turn(self, interaction, message):
+        return async_to_sync(gemini.agemini_prompt)(message, interaction_id=interaction.id)
+
+    def test_finished_interaction_queues_a_summary_refresh(self):
+        for combined in (False, True):
+            with self.subTest(combined=combined), override_settings(GEMINI_COMBINED_ANALYSIS=combined):
+                interaction = Interaction.objects.create()
+                self.turn(interaction, LOGIN)
+                interaction.refresh_from_db()
+                key = f"client-summary:{interaction.client_id}:{interaction.id}"
+                self.assertFalse(Job.objects.filter(idempotency_key=key).exists())
+                self.turn(interaction, "Thank you, goodbye.")
+                self.assertTrue(Job.objects.filter(idempotency_key=key).exists())
+
+    def test_first_turn_waits_for_a_missing_summary(self):
+        # A client from before summaries were stored
+        client = Client.objects.create(name="Test", email="test@example.com", password="secret")
+        add_messages(Interaction.objects.create(client=client), "I was injured at work.", "I'm sorry to hear that.")
+        interaction = Interaction.objects.create()
+        self.turn(interaction, LOGIN)
+        interaction.refresh_from_db()
+        self.assertIn("Summary of all previous interactions", interaction.system_instructions)
+        self.assertEqual(len(ClientSummary.objects.get(client=client).interaction_hashes), 1)
+
+    def test_first_turn_uses_an_up_to_date_summary(self):
+        client = Client.objects.create(name="Test", email="test@example.com", password="secret")
+        add_messages(Interaction.objects.create(client=client), "I was injured at work.", "I'm sorry to hear that.")
+        summary = async_to_sync(summaries.arefresh_client_summary)(client.id)
+        interaction = Interaction.objects.create()
+        with mock.patch.object(summaries, "_summarize", side_effect=AssertionError("summarised again")):
+            self.turn(interaction, LOGIN)
+        interaction.refresh_from_db()
+        self.assertIn(summary.summary, interaction.system_instructions)
+
+    def test_login_with_the_wrong_password_is_refused(self):
+        Client.objects.create(name="Test", email="test@example.com", password="other")
+        interaction = Interaction.objects.create()
+        self.assertIn("Incorrect password", self.turn(interaction, LOGIN))
+
+
+class AttorneyCacheTests(TestCase):
+    question = "What should I know about the firm's clients?"
+
+    def setUp(self):
+        self.backend = self.enterContext(stub_backend(latency=0, token_latency=0))
+        attorney_cache.clear()
+        self.addCleanup(attorney_cache.clear)
+
+    def ask(self):
+        return async_to_sync(gemini.agemini_prompt_department)(self.question)
+
+    def test_answer_is_reused(self):
+        first = self.ask()
+        self.assertEqual(self.ask(), first)
+        self.assertEqual(self.backend.agent.calls, 1)
+
+    def test_storing_a_turn_clears_the_cache(self):
+        interaction = Interaction.objects.create()
+        self.ask()
+        async_to_sync(gemini.append_messages)(interaction, 0, [{"role": "user", "parts": [{"text": "Hello"}]}])
+        self.assertEqual(len(attorney_cache), 0)
+
+    def test_client_change_clears_the_cache(self):
+        self.ask()
+        Client.objects.create(name="New", email="new@example.com", password="secret")
+        self.assertEqual(len(attorney_cache), 0)
+
+    def test_change_in_another_process_is_noticed(self):
+        interaction = Interaction.objects.create()
+        self.ask()
+        # Sends no signals, like a write from another process
+        Interaction.objects.filter(id=interaction.id).update(updated_at=timezone.now())
+        self.ask()
+        self.assertEqual(self.backend.agent.calls, 2)
+
+    def test_answer_finished_after_a_change_is_not_cached(self):
+        _, version = async_to_sync(attorney_cache.lookup)(self.question)
+        Client.objects.create(name="New", email="new@example.com", password="secret")
+        async_to_sync(attorney_cache.store)(self.question, "stale", version)
+        self.assertEqual(len(attorney_cache), 0)
+
+    def test_answer_around_a_failed_query_is_not_cached(self):
+        with mock.patch.object(self.backend.agent, "invoke", side_effect=RuntimeError("database is down")):
+            self.ask()
+        self.assertEqual(len(attorney_cache), 0)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        start = timezone.now() - timedelta(days=1)
+        self.interactions = [Interaction.objects.create() for _ in range(5)]
+        for minutes, interaction in enumerate(self.interactions):
+            Interaction.objects.filter(id=interaction.id).update(created_at=start + timedelta(minutes=minutes))
+        # Two interactions created at the same moment are ordered by id
+        Interaction.objects.filter(id=self.interactions[1].id).update(created_at=start)
+        self.newest_first = list(Interaction.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+
+    def test_pages_cover_every_row_once(self):
+        seen, cursor = [], None
+        while True:
+            page = keyset_paginate(Interaction.objects.all(), 2, after=cursor)
+            seen += [interaction.id for interaction in page.object_list]
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(seen, self.newest_first)
+
+    def test_before_returns_the_previous_page(self):
+        first = keyset_paginate(Interaction.objects.all(), 2)
+        second = keyset_paginate(Interaction.objects.all(), 2, after=first.next_cursor)
+        back = keyset_paginate(Interaction.objects.all(), 2, before=second.previous_cursor)
+        self.assertEqual(back.object_list, first.object_list)
+        self.assertFalse(back.has_previous)
+
+    def test_malformed_cursor_gives_the_first_page(self):
+        page = keyset_paginate(Interaction.objects.all(), 2, after="nonsense")
+        self.assertEqual([interaction.id for interaction in page.object_list], self.newest_first[:2])
+
+    @mock.patch.object(views, "INTERACTIONS_PER_PAGE", 2)
+    def test_list_view_follows_cursors(self):
+        response = self.client.get(reverse("interactions_list"))
+        self.assertEqual([interaction.id for interaction in response.context["interactions"]], self.newest_first[:2])
+        response = self.client.get(reverse("interactions_list"), {"after": response.context["page"].next_cursor})
+        self.assertEqual([interaction.id for interaction in response.context["interactions"]], self.newest_first[2:4])
+        self.assertIn("before=", response.context["previous_query"])
+
+
+class ClientMigrationTests(TransactionTestCase):
+    before = [("onboarding", "0011_gemini_context_cache")]
+    after = [("onboarding", "0012_client_email_unique_password_hash")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        super().tearDown()
+
+    def test_duplicate_clients_are_merged(self):
+        apps = self.migrate(self.before)
+        OldClient = apps.get_model("onboarding", "Client")
+        OldInteraction = apps.get_model("onboarding", "Interaction")
+        older = OldClient.objects.create(name="Old", email="Dup@Example.com", password="first")
+        newer = OldClient.objects.create(name="New", email="dup@example.com ", password="second")
+        OldClient.objects.filter(id=older.id).update(created_at=timezone.now() - timedelta(days=1))
+        OldInteraction.objects.create(client_id=older.id)
+        OldInteraction.objects.create(client_id=newer.id)
+
+        apps = self.migrate(self.after)
+        NewClient = apps.get_model("onboarding", "Client")
+        [client] = NewClient.objects.all()
+        self.assertEqual((client.id, client.email), (newer.id, "dup@example.com"))
+        self.assertTrue(is_hashed(client.password))
+        self.assertEqual(apps.get_model("onboarding", "Interaction").objects.filter(client_id=client.id).count(), 2)
+
+
+class BenchmarkTests(SimpleTestCase):
+    def test_failed_requests_include_memory_runs(self):
+        results = {
+            "ok": {"errors": 0, "memory": {"errors": 0}},
+            "flaky": {"errors": 1, "memory": {"errors": 2}},
+            "memoryless": {"errors": 3},
+        }
+        self.assertEqual(failed_requests(results), {"flaky": 3, "memoryless": 3})
+
+
+class SearchTests(TestCase):
+    def test_finds_interactions_by_message_text(self):
+        match = Interaction.objects.create()
+        add_messages(match, "My landlord kept the deposit", "I can help with that")
+        other = Interaction.objects.create()
+        add_messages(other, "I was in a car accident")
+        if search.full_text_supported():
+            search.rebuild(match.id)
+            search.rebuild(other.id)
+
+        response = self.client.get(reverse("search"), {"q": "deposit"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result["interaction_id"] for result in response.json()["results"]], [match.id])
+
+    def test_query_is_required(self):
+        self.assertEqual(self.client.get(reverse("search")).status_code, 400)
+
+
+class TranscriptTests(TestCase):
+    def setUp(self):
+        self.interaction = Interaction.objects.create()
+        add_messages(self.interaction, "first", "", "second", "third")
+
+    def test_detail_is_not_modified_until_the_interaction_changes(self):
+        url = reverse("interaction_detail", args=[self.interaction.id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(url, headers={"If-None-Match": etag}).status_code, 304)
+
+        self.interaction.save()
+        self.assertEqual(self.client.get(url, headers={"If-None-Match": etag}).status_code, 200)
+
+    def test_messages_are_paged_by_position(self):
+        url = reverse("interaction_messages", args=[self.interaction.id])
+        page = self.client.get(url, {"limit": 2}).json()
+        # Messages without text are skipped
+        self.assertEqual([message["text"] for message in page["messages"]], ["first", "second"])
+        self.assertEqual(page["next_after"], 2)
+        page = self.client.get(url, {"limit": 2, "after": page["next_after"]}).json()
+        self.assertEqual([message["text"] for message in page["messages"]], ["third"])
+        self.assertIsNone(page["next_after"])
+
+    def test_messages_are_not_modified_until_the_interaction_changes(self):
+        url = reverse("interaction_messages", args=[self.interaction.id])
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, headers={"If-None-Match": etag}).status_code, 304)
+
+    def test_unknown_interaction(self):
+        self.assertEqual(self.client.get(reverse("interaction_messages", args=[0])).status_code, 404)
+
+
+class IdempotentMessageTests(TransactionTestCase):
+    def setUp(self):
+        self.enterContext(stub_backend(latency=0, token_latency=0))
+
+    def post(self, path, key, message=LOGIN):
+        return self.client.post(
+            path, {"message": message}, content_type="application/json", headers={"Idempotency-Key": key},
+        )
+
+    def stream_events(self, response):
+        async def read():
+            return b"".join([chunk async for chunk in response.streaming_content])
+
+        return [json.loads(line) for line in async_to_sync(read)().decode().splitlines() if line]
+
+    def test_retry_gets_the_first_reply(self):
+        first = self.post(reverse("receive_message"), "retry")
+        messages = Message.objects.count()
+        retry = self.post(reverse("receive_message"), "retry")
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        # The turn didn't run again
+        self.assertEqual(Message.objects.count(), messages)
+        self.assertEqual(MessageRequest.objects.get(key="message:retry").status, MessageRequest.SUCCEEDED)
+
+    def test_other_keys_are_separate_requests(self):
+        first = self.post(reverse("receive_message"), "one")
+        second = self.post(reverse("receive_message"), "two")
+        self.assertNotEqual(first.json()["interaction_id"], second.json()["interaction_id"])
+
+    @override_settings(IDEMPOTENCY_WAIT=0)
+    def test_retry_while_the_first_is_running_conflicts(self):
+        MessageRequest.objects.create(key="message:busy")
+        response = self.post(reverse("receive_message"), "busy")
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Message.objects.exists())
+
+    def test_failed_request_is_run_again(self):
+        MessageRequest.objects.create(key="message:failed", status=MessageRequest.FAILED)
+        response = self.post(reverse("receive_message"), "failed")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(MessageRequest.objects.get(key="message:failed").status, MessageRequest.SUCCEEDED)
+
+    def test_abandoned_request_is_run_again_after_its_lease(self):
+        MessageRequest.objects.create(key="message:lost")
+        MessageRequest.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        with override_settings(IDEMPOTENCY_LEASE=60, IDEMPOTENCY_WAIT=0):
+            response = self.post(reverse("receive_message"), "lost")
+        self.assertEqual(response.status_code, 200)
+
+    def test_stream_retry_replays_the_reply(self):
+        first = self.stream_events(self.post(reverse("receive_message_stream"), "stream"))
+        retry = self.stream_events(self.post(reverse("receive_message_stream"), "stream"))
+        self.assertEqual(first[-1]["type"], "done")
+        self.assertEqual(retry[-1], first[-1])
+        self.assertEqual(retry[0]["text"], first[-1]["gemini_response"])
+
+    def test_stream_releases_its_key_when_the_turn_fails(self):
+        async def broken(prompt, interaction_id=None):
+            raise RuntimeError("Gemini is down")
+            yield
+
+        with mock.patch.object(views, "agemini_prompt_stream", broken):
+            events = self.stream_events(self.post(reverse("receive_message_stream"), "broken"))
+        self.assertEqual(events[-1]["type"], "error")
+        self.assertEqual(MessageRequest.objects.get(key="message-stream:broken").status, MessageRequest.FAILED)
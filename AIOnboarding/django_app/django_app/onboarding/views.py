@@ -1,11 +1,26 @@
 from django.shortcuts import render, get_object_or_404
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.template import loader
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import condition, require_http_methods
 from django.views.decorators.csrf import csrf_exempt
-from .models import Client, Interaction, Department
+from .models import Client, Interaction, Department, Document, Job, Message
+from .departments import get_catalog
+from .pagination import keyset_paginate
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 import json
-from .gemini import gemini_prompt, gemini_prompt_department, create_interactions
+import logging
+import re
+from django.conf import settings
+from .gemini import agemini_prompt, agemini_prompt_department, agemini_prompt_stream
+from .synthetic import enqueue_run, run_progress
+from .documents import UploadTooLarge, document_data, receive_upload, store_upload
+from .search import search_interactions
+from .idempotency import RequestInProgress, acomplete, aclaim, afail, idempotent, in_progress_response, request_key
+from . import metrics
+
+logger = logging.getLogger(__name__)
 
 
 def index(request):
@@ -20,71 +35,179 @@ def departments(request):
     return HttpResponse(template.render())
 
 
+INTERACTIONS_PER_PAGE = 50
+
+
+def _parse_day(value):
+    try:
+        day = parse_date(value or "")
+    except ValueError:
+        return None
+    if day is None:
+        return None
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
 def interactions_list(request):
-    interactions = Interaction.objects.select_related('client', 'department').all()
+    """
+    Interactions newest first, one keyset page at a time. Only the columns the
+    table shows are loaded; the system instructions are not.
+    """
+    interactions = Interaction.objects.select_related('client', 'department').only(
+        'id', 'created_at', 'updated_at', 'client__name', 'department__name',
+    )
+
+    department_id = request.GET.get('department', '')
+    if department_id.isdigit():
+        interactions = interactions.filter(department_id=int(department_id))
+    elif department_id == 'none':
+        interactions = interactions.filter(department__isnull=True)
+    date_from = _parse_day(request.GET.get('from'))
+    if date_from:
+        interactions = interactions.filter(created_at__gte=date_from)
+    date_to = _parse_day(request.GET.get('to'))
+    if date_to:
+        # Inclusive of the whole "to" day
+        interactions = interactions.filter(created_at__lt=date_to + timedelta(days=1))
+
+    page = keyset_paginate(
+        interactions,
+        INTERACTIONS_PER_PAGE,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+
+    # Page links keep the filters and swap the cursor
+    filters = request.GET.copy()
+    filters.pop('after', None)
+    filters.pop('before', None)
+    next_query = previous_query = None
+    if page.next_cursor:
+        next_query = filters.copy()
+        next_query['after'] = page.next_cursor
+        next_query = next_query.urlencode()
+    if page.previous_cursor:
+        previous_query = filters.copy()
+        previous_query['before'] = page.previous_cursor
+        previous_query = previous_query.urlencode()
+
     context = {
-        "interactions": interactions,
+        "interactions": page.object_list,
+        "page": page,
+        "next_query": next_query,
+        "previous_query": previous_query,
+        "departments": get_catalog().departments,
+        "selected_department": department_id,
+        "date_from": request.GET.get('from', ''),
+        "date_to": request.GET.get('to', ''),
     }
     return render(request, "interactions_list.html", context)
 
 
-def _flatten_conversation(conversation):
-    messages = []
-    if not isinstance(conversation, list):
-        return messages
-    for entry in conversation:
-        role = entry.get("role", "user") if isinstance(entry, dict) else "user"
-        parts = entry.get("parts", []) if isinstance(entry, dict) else []
-        texts = []
-        for part in parts:
-            text = part.get("text") if isinstance(part, dict) else None
-            if text:
-                texts.append(text)
-        if texts:
-            messages.append({
-                "role": role,
-                "text": "\n".join(texts),
-            })
-    return messages
+MESSAGES_PER_PAGE = 100
+MAX_MESSAGES_PER_PAGE = 500
 
 
+def _parse_position(value):
+    return int(value) if value and value.isdigit() else None
+
+
+def _message_page(interaction_id, after=None, limit=MESSAGES_PER_PAGE):
+    """
+    Up to `limit` of the interaction's messages with text after position
+    `after`, and the position to continue after (None on the last page).
+    """
+    messages = Message.objects.filter(interaction_id=interaction_id).exclude(text='').order_by('position')
+    if after is not None:
+        messages = messages.filter(position__gt=after)
+    rows = list(messages.values('position', 'role', 'text', 'created_at')[:limit + 1])
+    next_after = rows[limit - 1]['position'] if len(rows) > limit else None
+    return rows[:limit], next_after
+
+
+def _interaction_etag(request, interaction_id):
+    # Every stored turn and department change bumps updated_at, and stored
+    # messages never change, so pages of an unchanged interaction are reused
+    updated_at = Interaction.objects.filter(id=interaction_id).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None
+    return f"{interaction_id}-{updated_at.timestamp()}"
+
+
+@condition(etag_func=_interaction_etag)
 def interaction_detail(request, interaction_id):
+    """
+    An interaction and the first page of its transcript (or the page after
+    ?after=<position>). Further pages are loaded from api/interactions/<id>/messages/.
+    """
     interaction = get_object_or_404(
         Interaction.objects.select_related('client', 'department'),
         id=interaction_id,
     )
+    messages, next_after = _message_page(interaction.id, after=_parse_position(request.GET.get('after')))
     context = {
         "interaction": interaction,
-        "messages": _flatten_conversation(interaction.conversation),
+        "messages": messages,
+        "next_after": next_after,
     }
     return render(request, "interaction_detail.html", context)
 
 
+@require_http_methods(["GET"])
+@condition(etag_func=_interaction_etag)
+def interaction_messages(request, interaction_id):
+    """
+    API endpoint for an interaction's transcript, a page at a time.
+    GET ?after=<position>&limit=<n> returns the messages after `after` and
+    `next_after` to ask for the following page with (null on the last one).
+    """
+    get_object_or_404(Interaction.objects.only('id'), id=interaction_id)
+    limit = _parse_position(request.GET.get('limit')) or MESSAGES_PER_PAGE
+    messages, next_after = _message_page(
+        interaction_id,
+        after=_parse_position(request.GET.get('after')),
+        limit=min(limit, MAX_MESSAGES_PER_PAGE),
+    )
+    return JsonResponse({
+        'status': 'success',
+        'interaction_id': interaction_id,
+        'messages': messages,
+        'next_after': next_after,
+    })
+
+
+async def _get_or_create_interaction_id(interaction_id):
+    # If the interaction_id is null then create a new interaction
+    if not interaction_id:
+        current_interaction = await Interaction.objects.acreate()
+        logger.info("Created new interaction with ID %s", current_interaction.id)
+    else:
+        try:
+            current_interaction = await Interaction.objects.aget(id=interaction_id)
+        except Interaction.DoesNotExist:
+            logger.warning("Interaction %s not found, creating new one", interaction_id)
+            current_interaction = await Interaction.objects.acreate()
+    return current_interaction.id
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
-def receive_message(request):
+@idempotent("message")
+async def receive_message(request):
     """
     API endpoint to receive prompts/messages.
     Processes the prompt and returns a "message received" confirmation.
+    A retry with the same Idempotency-Key header gets the same reply.
     """
     try:
-        print("[Django] Received a message request" + str(request.body), flush=True)
+        # Bodies carry login details, so only their size is logged
+        logger.debug("Received a message request (%s bytes)", len(request.body))
         data = json.loads(request.body)
         prompt = data.get('prompt') or data.get('message')
         interaction_id = data.get('interaction_id')
 
-        print(f"[Django] Interaction ID from chainlit: {interaction_id}", flush=True)
-            # If the interaction_id is null then create a new interaction
-        if not interaction_id:
-            current_interaction = Interaction.objects.create(conversation=[])
-            print(f"[Django] Created new interaction with ID {current_interaction.id}", flush=True)
-        else:
-            try:
-                current_interaction = Interaction.objects.get(id=interaction_id)
-            except Interaction.DoesNotExist:
-                print(f"[Gemini] Interaction {interaction_id} not found, creating new one", flush=True)
-                current_interaction = Interaction.objects.create(conversation=[])
-        interaction_id = current_interaction.id
+        logger.debug("Interaction ID from chainlit: %s", interaction_id)
+        interaction_id = await _get_or_create_interaction_id(interaction_id)
         if not prompt:
             return JsonResponse({
                 'status': 'error',
@@ -93,11 +216,11 @@ def receive_message(request):
         
         # Process the prompt using configured operations
         # Pass interaction_id to gemini_prompt
-        gemini_response = gemini_prompt(prompt, interaction_id=interaction_id)
+        gemini_response = await agemini_prompt(prompt, interaction_id=interaction_id)
         
         # Log the original and processed prompt
-        print(f"[Django] Received prompt: {prompt}", flush=True)
-        print(f"[Django] Processed prompt: {gemini_response}", flush=True)
+        logger.debug("Received prompt: %s", prompt)
+        logger.debug("Processed prompt: %s", gemini_response)
         
         return JsonResponse({
             'status': 'success',
@@ -112,22 +235,96 @@ def receive_message(request):
             'message': 'Invalid JSON'
         }, status=400)
     except Exception as e:
-        print(f"[Django] Error receiving message: {e}", flush=True)
+        logger.exception("Error receiving message: %s", e)
         return JsonResponse({
             'status': 'error',
             'message': str(e)
         }, status=500)
 
+@csrf_exempt
+@require_http_methods(["POST"])
+async def receive_message_stream(request):
+    """
+    Streaming variant of receive_message.
+    Responds with NDJSON: a "chunk" event for each piece of the reply as Gemini
+    produces it, then a "done" event with the full response and interaction_id.
+    A retry with the same Idempotency-Key header gets the stored reply as a
+    single chunk.
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Invalid JSON'
+        }, status=400)
+    prompt = data.get('prompt') or data.get('message')
+    if not prompt:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'No prompt provided'
+        }, status=400)
+    key = request_key(request, "message-stream")
+    if key:
+        try:
+            replay = await aclaim(key)
+        except RequestInProgress:
+            return in_progress_response()
+        if replay is not None:
+            return _ndjson_response(_replayed_events(replay))
+    interaction_id = await _get_or_create_interaction_id(data.get('interaction_id'))
+
+    async def events():
+        chunks = []
+        completed = False
+        try:
+            async for chunk in agemini_prompt_stream(prompt, interaction_id=interaction_id):
+                chunks.append(chunk)
+                yield json.dumps({'type': 'chunk', 'text': chunk}) + "\n"
+            done = {
+                'type': 'done',
+                'status': 'success',
+                'gemini_response': "".join(chunks),
+                'interaction_id': interaction_id
+            }
+            if key:
+                await acomplete(key, done)
+            completed = True
+            yield json.dumps(done) + "\n"
+        except Exception as e:
+            logger.exception("Error streaming message: %s", e)
+            yield json.dumps({'type': 'error', 'message': str(e), 'interaction_id': interaction_id}) + "\n"
+        finally:
+            # Also when the client went away and the stream was cancelled, so
+            # its retry runs the turn instead of waiting out the lease
+            if key and not completed:
+                await afail(key)
+
+    return _ndjson_response(events())
+
+
+async def _replayed_events(done):
+    yield json.dumps({'type': 'chunk', 'text': done['gemini_response'], 'interaction_id': done['interaction_id']}) + "\n"
+    yield json.dumps(done) + "\n"
+
+
+def _ndjson_response(events):
+    response = StreamingHttpResponse(events, content_type='application/x-ndjson')
+    # Stop proxies from buffering the stream
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @csrf_exempt
 @require_http_methods(["POST"])   
-def receive_message_department(request):
+@idempotent("attorney-message")
+async def receive_message_department(request):
     """
     API endpoint to receive prompts/messages for the attorney/department.
     Processes the prompt and returns a "message received" confirmation.
     """
-    print("[Django] Processing a message request for department", flush=True)
     try:
-        print("[Django] Received a message request for department" + str(request.body), flush=True)
+        logger.debug("Received a message request for department (%s bytes)", len(request.body))
         data = json.loads(request.body)
         prompt = data.get('prompt') or data.get('message')
         
@@ -139,11 +336,11 @@ def receive_message_department(request):
         
         # Process the prompt using configured operations
         # Pass interaction_id to gemini_prompt
-        gemini_response = gemini_prompt_department(prompt)
+        gemini_response = await agemini_prompt_department(prompt)
         
         # Log the original and processed prompt
-        print(f"[Django] Received prompt: {prompt}", flush=True)
-        print(f"[Django] Processed prompt: {gemini_response}", flush=True)
+        logger.debug("Received prompt: %s", prompt)
+        logger.debug("Processed prompt: %s", gemini_response)
         
         return JsonResponse({
             'status': 'success',
@@ -157,7 +354,7 @@ def receive_message_department(request):
             'message': 'Invalid JSON'
         }, status=400)
     except Exception as e:
-        print(f"[Django] Error receiving message for department: {e}", flush=True)
+        logger.exception("Error receiving message for department: %s", e)
         return JsonResponse({
             'status': 'error',
             'message': str(e)
@@ -167,20 +364,156 @@ def receive_message_department(request):
 @csrf_exempt
 @require_http_methods(["GET", "POST"])
 def create_interactions_endpoint(request):
-    return JsonResponse({
+    """
+    API endpoint to generate synthetic interactions for load-testing.
+    POST {"count", "run", "max_turns", "rate"} queues a run for the workers
+    (posting an existing run resumes it); GET ?run=<name> reports its progress.
+    """
+    if request.method == "GET":
+        run = request.GET.get('run')
+        if not run:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'No run provided'
+            }, status=400)
+        return JsonResponse({'status': 'success', 'run': run, 'progress': run_progress(run)})
+
+    try:
+        data = json.loads(request.body or b"{}")
+        count = int(data.get('count', 10))
+        max_turns = int(data.get('max_turns', 10))
+        rate = float(data.get('rate', 0))
+    except (json.JSONDecodeError, TypeError, ValueError):
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Invalid JSON'
+        }, status=400)
+    run = str(data.get('run') or timezone.now().strftime('%Y%m%d-%H%M%S'))
+    if not re.match(r'^[\w-]+$', run) or not 0 < count <= settings.SYNTHETIC_MAX_COUNT or max_turns < 1:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'Give a run name of letters, digits, "_" and "-", and a count from 1 to {settings.SYNTHETIC_MAX_COUNT}'
+        }, status=400)
+    try:
+        pending = enqueue_run(run, count, max_turns=max_turns, rate=rate)
+    except Exception as e:
+        logger.exception("Error creating interactions: %s", e)
+        return JsonResponse({
             'status': 'error',
-            'message': 'Creating interactions is currently disabled'
+            'message': str(e)
         }, status=500)
+    return JsonResponse({
+        'status': 'success',
+        'run': run,
+        'pending': pending,
+        'progress': run_progress(run),
+    }, status=202)
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def interaction_documents(request, interaction_id):
     """
-    API endpoint to create a dummy interaction for testing.
+    API endpoint for the documents of an interaction. GET lists them; POST
+    uploads one, as multipart form data (field "file") or as the raw body
+    with an X-File-Name header, and queues its text extraction.
     """
+    interaction = get_object_or_404(Interaction, id=interaction_id)
+    if request.method == "GET":
+        return JsonResponse({
+            'status': 'success',
+            'documents': [document_data(document) for document in interaction.documents.all()],
+        })
+
+    try:
+        upload = receive_upload(request)
+    except UploadTooLarge:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'Documents can be at most {settings.DOCUMENT_MAX_UPLOAD_SIZE} bytes'
+        }, status=413)
+    if upload is None:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'No file provided'
+        }, status=400)
     try:
-        for _ in range(10):
-            create_interactions()
-        return interactions_list(request)
+        document, created = store_upload(interaction, upload)
     except Exception as e:
-        print(f"[Django] Error creating interaction: {e}", flush=True)
+        logger.exception("Error storing document: %s", e)
         return JsonResponse({
             'status': 'error',
             'message': str(e)
-        }, status=500)
\ No newline at end of file
+        }, status=500)
+    finally:
+        upload.close()
+    return JsonResponse({
+        'status': 'success',
+        'duplicate': not created,
+        'document': document_data(document),
+    }, status=202 if created else 200)
+
+
+@require_http_methods(["GET"])
+def document_status(request, document_id):
+    """
+    API endpoint reporting an uploaded document and its text extraction.
+    """
+    document = get_object_or_404(Document, id=document_id)
+    return JsonResponse({'status': 'success', 'document': document_data(document)})
+
+
+@require_http_methods(["GET"])
+def search_endpoint(request):
+    """
+    API endpoint for full-text search of interaction conversations.
+    GET ?q=<query>[&department=<id>][&from=<YYYY-MM-DD>][&limit=<n>] returns
+    the best matches with a highlighted excerpt each.
+    """
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'No query provided'
+        }, status=400)
+    department = None
+    department_id = request.GET.get('department', '')
+    if department_id:
+        department = get_catalog().get(department_id)
+        if department is None:
+            return JsonResponse({
+                'status': 'error',
+                'message': f'Unknown department {department_id}'
+            }, status=400)
+    limit = request.GET.get('limit', '')
+    limit = int(limit) if limit.isdigit() else 20
+    results = search_interactions(query, department=department, since=_parse_day(request.GET.get('from')), limit=limit)
+    return JsonResponse({'status': 'success', 'query': query, 'results': results})
+
+
+@require_http_methods(["GET"])
+def job_status(request, job_id):
+    """
+    API endpoint reporting the state of a background job.
+    """
+    job = get_object_or_404(Job, id=job_id)
+    return JsonResponse({
+        'id': job.id,
+        'task': job.task,
+        'status': job.status,
+        'attempts': job.attempts,
+        'result': job.result,
+        'error': job.last_error.strip().splitlines()[-1] if job.status == Job.FAILED and job.last_error else None,
+        'created_at': job.created_at,
+        'finished_at': job.finished_at,
+    })
+
+
+@require_http_methods(["GET"])
+def metrics_endpoint(request):
+    """
+    Prometheus scrape endpoint with this process's metrics.
+    """
+    if not settings.METRICS_ENABLED:
+        return HttpResponse(status=404)
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -86,6 +86,171 @@ DATABASES = {
     }
 }
 
+# Message requests with an Idempotency-Key header (onboarding.idempotency).
+# A retry gets the stored reply for IDEMPOTENCY_TTL seconds, waiting up to
+# IDEMPOTENCY_WAIT seconds for a first attempt that is still running; one not
+# finished within IDEMPOTENCY_LEASE seconds is assumed lost and runs again.
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', '86400'))
+IDEMPOTENCY_WAIT = float(os.environ.get('IDEMPOTENCY_WAIT', '60'))
+IDEMPOTENCY_LEASE = int(os.environ.get('IDEMPOTENCY_LEASE', '300'))
+
+# Full-text search over interaction conversations (onboarding.search), with
+# a GIN-indexed tsvector per interaction in PostgreSQL.
+SEARCH_CONFIG = os.environ.get('SEARCH_CONFIG', 'english')
+SEARCH_MAX_RESULTS = int(os.environ.get('SEARCH_MAX_RESULTS', '50'))
+
+# Retrieval over an interaction's documents and earlier transcript
+# (onboarding.retrieval). Each client turn carries at most RETRIEVAL_TOP_K
+# chunks within RETRIEVAL_MAX_TOKENS. Chunks are ranked by BM25, plus
+# embedding similarity with RETRIEVAL_EMBEDDINGS.
+RETRIEVAL_ENABLED = os.environ.get('RETRIEVAL_ENABLED', '1') == '1'
+RETRIEVAL_INDEX_ROOT = os.environ.get('RETRIEVAL_INDEX_ROOT', str(BASE_DIR / 'retrieval_index'))
+RETRIEVAL_TOP_K = int(os.environ.get('RETRIEVAL_TOP_K', '4'))
+RETRIEVAL_MAX_TOKENS = int(os.environ.get('RETRIEVAL_MAX_TOKENS', '1200'))
+RETRIEVAL_CHUNK_TOKENS = int(os.environ.get('RETRIEVAL_CHUNK_TOKENS', '200'))
+RETRIEVAL_CHUNK_OVERLAP_TOKENS = int(os.environ.get('RETRIEVAL_CHUNK_OVERLAP_TOKENS', '30'))
+RETRIEVAL_EMBEDDINGS = os.environ.get('RETRIEVAL_EMBEDDINGS', '0') == '1'
+RETRIEVAL_EMBEDDING_MODEL = os.environ.get('RETRIEVAL_EMBEDDING_MODEL', 'gemini-embedding-001')
+RETRIEVAL_EMBEDDING_DIMENSIONS = int(os.environ.get('RETRIEVAL_EMBEDDING_DIMENSIONS', '256'))
+# Chunks with no matching words are still used above this cosine similarity
+RETRIEVAL_MIN_SIMILARITY = float(os.environ.get('RETRIEVAL_MIN_SIMILARITY', '0.6'))
+# Indexes kept parsed in memory per process
+RETRIEVAL_CACHED_INDEXES = int(os.environ.get('RETRIEVAL_CACHED_INDEXES', '32'))
+
+# Uploaded documents (onboarding.documents). Uploads are streamed to disk and
+# their text is extracted by workers serving the 'documents' queue.
+DOCUMENT_MAX_UPLOAD_SIZE = int(os.environ.get('DOCUMENT_MAX_UPLOAD_SIZE', str(50 * 1024 * 1024)))
+
+# Stage, LLM and database write timings (onboarding.metrics), served in the
+# Prometheus text format at /metrics. StageTiming rows are stored for
+# METRICS_TIMING_SAMPLE_RATE of client turns.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+METRICS_TIMING_SAMPLE_RATE = float(os.environ.get('METRICS_TIMING_SAMPLE_RATE', '1.0'))
+
+# Logging of the onboarding app. Only ONBOARDING_LOG_SAMPLE_RATE of records
+# below WARNING are emitted (onboarding.log_sampling).
+ONBOARDING_LOG_LEVEL = os.environ.get('ONBOARDING_LOG_LEVEL', 'INFO')
+ONBOARDING_LOG_SAMPLE_RATE = float(os.environ.get('ONBOARDING_LOG_SAMPLE_RATE', '1.0'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'sampled': {
+            '()': 'django_app.onboarding.log_sampling.SampleFilter',
+            'rate': ONBOARDING_LOG_SAMPLE_RATE,
+        },
+    },
+    'formatters': {
+        'onboarding': {
+            'format': '[%(levelname)s] %(name)s: %(message)s',
+        },
+    },
+    'handlers': {
+        'onboarding': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'onboarding',
+            'filters': ['sampled'],
+        },
+    },
+    'loggers': {
+        'django_app.onboarding': {
+            'handlers': ['onboarding'],
+            'level': ONBOARDING_LOG_LEVEL,
+            'propagate': False,
+        },
+    },
+}
+
+# LLM backend (onboarding.llm): 'gemini', or 'stub' for a local deterministic
+# stand-in that needs no network access. A dotted path to a backend class
+# works too.
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'gemini')
+# Seconds the stub waits per call, plus per 1000 input tokens of a chat turn
+LLM_STUB_LATENCY = float(os.environ.get('LLM_STUB_LATENCY', '0.5'))
+LLM_STUB_TOKEN_LATENCY = float(os.environ.get('LLM_STUB_TOKEN_LATENCY', '0'))
+# Optional JSON file of {"match": regex, "reply": text} rules for stub chat replies
+LLM_STUB_SCRIPT = os.environ.get('LLM_STUB_SCRIPT', '')
+
+# Gemini client
+# Shared clients are built once per event loop by onboarding.genai_client.
+GEMINI_MAX_CONNECTIONS = int(os.environ.get('GEMINI_MAX_CONNECTIONS', '20'))
+GEMINI_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get('GEMINI_MAX_KEEPALIVE_CONNECTIONS', '10'))
+GEMINI_KEEPALIVE_EXPIRY = float(os.environ.get('GEMINI_KEEPALIVE_EXPIRY', '60'))
+
+# Per-call timeouts in seconds
+GEMINI_TIMEOUTS = {
+    'default': float(os.environ.get('GEMINI_TIMEOUT', '60')),
+    'classify': float(os.environ.get('GEMINI_CLASSIFY_TIMEOUT', '20')),
+    'summary': float(os.environ.get('GEMINI_SUMMARY_TIMEOUT', '45')),
+}
+
+# Overlap the independent Gemini calls of a client turn as asyncio tasks on
+# the request's event loop (onboarding.orchestration.start)
+GEMINI_PARALLEL_TURNS = os.environ.get('GEMINI_PARALLEL_TURNS', '1') == '1'
+# Threads of the shared pool for work that outlives a request, e.g. context
+# cache creation and in-process jobs
+GEMINI_MAX_WORKERS = int(os.environ.get('GEMINI_MAX_WORKERS', '16'))
+
+# Replace the separate extraction and department-change calls with a single
+# combined turn-analysis call (see onboarding.gemini.aanalyze_turn)
+GEMINI_COMBINED_ANALYSIS = os.environ.get('GEMINI_COMBINED_ANALYSIS', '0') == '1'
+
+# Attorney SQL agent (onboarding.sql_agent)
+SQL_AGENT_POOL_SIZE = int(os.environ.get('SQL_AGENT_POOL_SIZE', '5'))
+SQL_AGENT_MAX_OVERFLOW = int(os.environ.get('SQL_AGENT_MAX_OVERFLOW', '5'))
+SQL_AGENT_POOL_RECYCLE = int(os.environ.get('SQL_AGENT_POOL_RECYCLE', '1800'))
+# Build the agent when the ASGI server starts instead of on the first question
+SQL_AGENT_WARM_UP = os.environ.get('SQL_AGENT_WARM_UP', '1') == '1'
+
+# PBKDF2 work factor for client passwords (onboarding.credentials). Stored
+# hashes are upgraded to the current value on the client's next login.
+CLIENT_PASSWORD_ITERATIONS = int(os.environ.get('CLIENT_PASSWORD_ITERATIONS', '600000'))
+
+# Largest synthetic run (onboarding.synthetic) one request to
+# api/create_interactions/ may queue
+SYNTHETIC_MAX_COUNT = int(os.environ.get('SYNTHETIC_MAX_COUNT', '5000'))
+
+# Background jobs (onboarding.jobs). Run them with `manage.py run_worker`, or set
+# JOBS_RUN_IN_PROCESS to run them on the web process's own thread pool.
+JOBS_RUN_IN_PROCESS = os.environ.get('JOBS_RUN_IN_PROCESS', '0') == '1'
+JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS', '4'))
+JOB_WORKER_PROCESSES = int(os.environ.get('JOB_WORKER_PROCESSES', '1'))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', '0.5'))
+# Queues a worker takes jobs from unless given --queues
+JOB_QUEUES = [queue.strip() for queue in os.environ.get('JOB_QUEUES', 'default,synthetic,documents').split(',') if queue.strip()]
+# Retry delays double from JOB_RETRY_BACKOFF up to JOB_RETRY_BACKOFF_MAX seconds
+JOB_RETRY_BACKOFF = float(os.environ.get('JOB_RETRY_BACKOFF', '5'))
+JOB_RETRY_BACKOFF_MAX = float(os.environ.get('JOB_RETRY_BACKOFF_MAX', '300'))
+# A running job not finished within this many seconds is assumed lost
+JOB_LEASE = int(os.environ.get('JOB_LEASE', '900'))
+
+# Seconds the in-process department catalog (onboarding.departments) is used
+# before being reloaded; changes made in this process reload it immediately.
+DEPARTMENT_CATALOG_TTL = float(os.environ.get('DEPARTMENT_CATALOG_TTL', '60'))
+
+# Default context strategy for resuming a client chat (onboarding.context):
+# 'full', 'window', 'summary' or 'budget'. Departments can override all three.
+GEMINI_CONTEXT_STRATEGY = os.environ.get('GEMINI_CONTEXT_STRATEGY', 'full')
+GEMINI_CONTEXT_WINDOW = int(os.environ.get('GEMINI_CONTEXT_WINDOW', '10'))
+GEMINI_CONTEXT_TOKEN_BUDGET = int(os.environ.get('GEMINI_CONTEXT_TOKEN_BUDGET', '8000'))
+
+# Gemini context caching of the system instructions of steady-state client
+# turns (onboarding.context_cache). Instructions below the minimum size Gemini
+# accepts for caching are always sent inline.
+GEMINI_CONTEXT_CACHE = os.environ.get('GEMINI_CONTEXT_CACHE', '1') == '1'
+GEMINI_CONTEXT_CACHE_TTL = int(os.environ.get('GEMINI_CONTEXT_CACHE_TTL', '3600'))
+GEMINI_CONTEXT_CACHE_MIN_TOKENS = int(os.environ.get('GEMINI_CONTEXT_CACHE_MIN_TOKENS', '1024'))
+# Seconds to wait before retrying a cache that failed to be created
+GEMINI_CONTEXT_CACHE_RETRY = int(os.environ.get('GEMINI_CONTEXT_CACHE_RETRY', '300'))
+
+# Cache of attorney answers (onboarding.response_cache). A TTL of 0 disables it;
+# a similarity above 0 also matches reworded questions by embedding.
+ATTORNEY_CACHE_TTL = float(os.environ.get('ATTORNEY_CACHE_TTL', '300'))
+ATTORNEY_CACHE_MAX_ENTRIES = int(os.environ.get('ATTORNEY_CACHE_MAX_ENTRIES', '256'))
+ATTORNEY_CACHE_SIMILARITY = float(os.environ.get('ATTORNEY_CACHE_SIMILARITY', '0'))
+ATTORNEY_CACHE_EMBEDDING_MODEL = os.environ.get('ATTORNEY_CACHE_EMBEDDING_MODEL', 'gemini-embedding-001')
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
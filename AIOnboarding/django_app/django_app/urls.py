@@ -18,6 +18,7 @@ from django.contrib import admin
 from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
+from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from .onboarding import views
 
 urlpatterns = [
@@ -28,10 +29,19 @@ urlpatterns = [
     path('interactions/', views.interactions_list, name="interactions_list"),
     path('interactions/<int:interaction_id>/', views.interaction_detail, name="interaction_detail"),
     path('api/message/', views.receive_message, name='receive_message'),
+    path('api/message/stream/', views.receive_message_stream, name='receive_message_stream'),
     path('api/attorney_message/', views.receive_message_department, name="receive_message_department"),
     path('api/create_interactions/', views.create_interactions_endpoint, name="create_interactions"),
+    path('api/interactions/<int:interaction_id>/messages/', views.interaction_messages, name="interaction_messages"),
+    path('api/interactions/<int:interaction_id>/documents/', views.interaction_documents, name="interaction_documents"),
+    path('api/documents/<int:document_id>/', views.document_status, name="document_status"),
+    path('api/search/', views.search_endpoint, name="search"),
+    path('api/jobs/<int:job_id>/', views.job_status, name="job_status"),
+    path('metrics', views.metrics_endpoint, name="metrics"),
 ]
 
-# Serve media files in development
+# Serve static and media files in development (the ASGI server doesn't do it
+# for us the way runserver does)
 if settings.DEBUG:
+    urlpatterns += staticfiles_urlpatterns()
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)